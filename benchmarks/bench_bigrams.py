@@ -0,0 +1,55 @@
+# bench_bigrams.py - time to learn and score messages with bigrams
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Measures the time taken by a classifier using bigrams to learn and to
+score messages of increasing length.
+
+Run this as ``python benchmarks/bench_bigrams.py [NTOKENS ...]``. The
+messages are made of phrases drawn from a fixed set, as real messages repeat
+boilerplate and markup, so many of their bigrams repeat as well. If the time per token stays the same
+as messages grow longer, learning and scoring are linear in the length of
+a message.
+
+"""
+import random
+import sys
+import time
+
+from sbclassifier.classifiers.basic import Classifier
+
+
+def message(rng, phrases, n):
+    tokens = []
+    while len(tokens) < n:
+        tokens.extend(rng.choice(phrases))
+    return tokens[:n]
+
+
+def main(sizes):
+    rng = random.Random(0)
+    vocabulary = ['word{}'.format(i) for i in range(2000)]
+    phrases = [rng.sample(vocabulary, rng.randint(1, 8)) for _ in range(500)]
+    classifier = Classifier(use_bigrams=True)
+    for i in range(200):
+        classifier.learn(message(rng, phrases, 200), i % 2 == 0)
+    print('{:>10} {:>16} {:>16}'.format('tokens', 'learn (us/token)',
+                                        'score (us/token)'))
+    for n in sizes:
+        tokens = message(rng, phrases, n)
+        start = time.perf_counter()
+        classifier.learn(tokens, True)
+        learn = time.perf_counter() - start
+        classifier.unlearn(tokens, True)
+        start = time.perf_counter()
+        classifier.spamprob(tokens)
+        score = time.perf_counter() - start
+        print('{:>10} {:>16.2f} {:>16.2f}'.format(n, 1e6 * learn / n,
+                                                  1e6 * score / n))
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [10 ** 3, 10 ** 4, 10 ** 5])
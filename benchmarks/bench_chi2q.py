@@ -0,0 +1,68 @@
+# bench_chi2q.py - speed of the chi-squared survival function
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Compares :func:`chi2Q` with the straightforward summation of the whole
+series, and with :func:`chi2Q_many` on a batch of arguments.
+
+Run this as ``python benchmarks/bench_chi2q.py``.  The arguments are those
+that :meth:`Classifier.spamprob` computes for messages with 150 clues,
+which are the most expensive, ranging from clear ham to clear spam.
+
+"""
+import math
+import timeit
+
+from sbclassifier.classifiers.basic import chi2Q
+from sbclassifier.classifiers.basic import chi2Q_many
+from sbclassifier.classifiers.basic import numpy_is_available
+
+#: The number of degrees of freedom for a message with 150 clues.
+V = 300
+
+
+def reference_chi2Q(x2, v):
+    """The original implementation of :func:`chi2Q`."""
+    m = x2 / 2
+    result = term = math.exp(-m)
+    for i in range(1, v // 2):
+        term *= m / i
+        result += term
+    return min(result, 1.0)
+
+
+def arguments():
+    """Returns the values of x2 computed by spamprob() for messages whose
+    150 clues all have the same probability, for a range of probabilities.
+
+    """
+    probs = [0.01, 0.05, 0.1, 0.2, 0.3, 0.4, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99]
+    return [-2 * 150 * math.log(p) for p in probs]
+
+
+def main(number=2000):
+    print('{:>10} {:>16} {:>14}'.format('x2', 'reference (us)', 'chi2Q (us)'))
+    total_reference = total = 0
+    for x2 in arguments():
+        reference = timeit.timeit(lambda: reference_chi2Q(x2, V),
+                                  number=number) / number
+        optimized = timeit.timeit(lambda: chi2Q(x2, V), number=number) / number
+        total_reference += reference
+        total += optimized
+        print('{:>10.1f} {:>16.2f} {:>14.2f}'.format(x2, reference * 1e6,
+                                                     optimized * 1e6))
+    print('{:>10} {:>16.2f} {:>14.2f}'.format('total', total_reference * 1e6,
+                                              total * 1e6))
+    if numpy_is_available:
+        batch = arguments() * 1000
+        vs = [V] * len(batch)
+        elapsed = timeit.timeit(lambda: chi2Q_many(batch, vs), number=10) / 10
+        print('chi2Q_many: {:.2f} us per argument for {} arguments'.format(
+            elapsed / len(batch) * 1e6, len(batch)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# bench_frozen.py - time to open a pickled and a frozen classifier
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Compares the time taken to load a :class:`PickleClassifier` with the time
+taken to open the same database exported for a :class:`FrozenClassifier`,
+and the time taken by each to score a message.
+
+Run this as ``python benchmarks/bench_frozen.py [NTOKENS ...]``.
+
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sbclassifier.classifiers.frozen import export
+from sbclassifier.classifiers.frozen import FrozenClassifier
+from sbclassifier.classifiers.storage import PickleClassifier
+
+
+def timed(function, *args):
+    """Returns a pair ``(seconds, result)`` for a call to `function`."""
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main(sizes):
+    print('{:>10} {:>12} {:>12} {:>12} {:>12}'.format(
+        'tokens', 'load pickle', 'open frozen', 'score pickle',
+        'score frozen'))
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as dirname:
+            picklename = os.path.join(dirname, 'model.pickle')
+            frozenname = os.path.join(dirname, 'model.frozen')
+            classifier = PickleClassifier(picklename)
+            for i in range(n):
+                classifier._wordinfoset('token{}'.format(i),
+                                        classifier.WordInfoClass(i % 7 + 1, i % 5))
+            classifier.nspam = classifier.nham = n
+            classifier.store()
+            export(classifier, frozenname)
+            del classifier
+            message = ['token{}'.format(i) for i in range(0, n, n // 200)]
+            load, pickled = timed(PickleClassifier, picklename)
+            open_, frozen = timed(FrozenClassifier, frozenname)
+            score_pickled = timed(pickled.spamprob, message)[0]
+            score_frozen = timed(frozen.spamprob, message)[0]
+            frozen.close()
+        print('{:>10} {:>11.4f}s {:>11.4f}s {:>11.4f}s {:>11.4f}s'.format(
+            n, load, open_, score_pickled, score_frozen))
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [10 ** 4, 10 ** 5, 10 ** 6])
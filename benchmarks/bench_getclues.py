@@ -0,0 +1,61 @@
+# bench_getclues.py - sorting versus heap selection of clues
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Times the two strategies used by :meth:`Classifier._getclues` to select
+the strongest :const:`MAX_DISCRIMINATORS` clues of a message: sorting all
+candidate clues, and selecting with a bounded heap.
+
+Run this as ``python benchmarks/bench_getclues.py``.  The column labelled
+``candidates`` is the number of clues that pass the
+:const:`MINIMUM_PROB_STRENGTH` filter, which is what
+:const:`HEAP_SELECTION_THRESHOLD` is compared against; the last column shows
+the time taken by ``_getclues`` itself, including the database lookups.
+
+"""
+import heapq
+import random
+import timeit
+
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.classifiers.basic import MAX_DISCRIMINATORS
+
+SIZES = (1000, 2000, 3000, 5000, 10000, 30000, 100000)
+
+
+def build(ntokens, rng):
+    """Returns a classifier trained on random messages drawn from a
+    vocabulary of `ntokens` words, and one message containing every word.
+
+    """
+    vocabulary = ['token{}'.format(i) for i in range(ntokens)]
+    classifier = Classifier()
+    for i in range(50):
+        classifier.learn(rng.sample(vocabulary, ntokens // 4), i % 2)
+    return classifier, vocabulary
+
+
+def main(repeat=5):
+    rng = random.Random(0)
+    print('{:>8} {:>10} {:>12} {:>12} {:>12}'.format(
+        'tokens', 'candidates', 'sort (ms)', 'heap (ms)', 'getclues (ms)'))
+    for n in SIZES:
+        classifier, message = build(n, rng)
+        candidates = [t for t in map(classifier._worddistanceget, message)
+                      if t[0] >= 0.1]
+        sort = timeit.timeit(lambda: sorted(candidates)[-MAX_DISCRIMINATORS:],
+                             number=repeat) / repeat
+        heap = timeit.timeit(
+            lambda: heapq.nlargest(MAX_DISCRIMINATORS, candidates),
+            number=repeat) / repeat
+        total = timeit.timeit(lambda: classifier._getclues(message),
+                              number=repeat) / repeat
+        print('{:>8} {:>10} {:>12.3f} {:>12.3f} {:>12.3f}'.format(
+            n, len(candidates), sort * 1000, heap * 1000, total * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# bench_hashing.py - accuracy and memory of the hashing classifier
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Compares the error rates and memory use of :class:`HashingClassifier`,
+for several numbers of buckets, with those of the basic classifier.
+
+Run this as ``python benchmarks/bench_hashing.py [NTRAIN [NTEST]]``, where
+`NTRAIN` and `NTEST` are the numbers of messages of each class used for
+training and testing. The corpus is synthetic: every message mixes words
+drawn from a vocabulary typical of its class, words common to both classes,
+a few words typical of the other class, and random strings which never
+occur twice, as the junk in real spam does. The random strings make the
+basic database grow with every message, while the hashed one stays the same
+size.
+
+"""
+import random
+import sys
+import tracemalloc
+
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.classifiers.basic import classify_probability
+from sbclassifier.classifiers.constants import HAM
+from sbclassifier.classifiers.constants import SPAM
+from sbclassifier.classifiers.constants import UNSURE
+from sbclassifier.classifiers.hashing import HashingClassifier
+
+#: The numbers of buckets to measure.
+NBUCKETS = (2 ** 22, 2 ** 20, 2 ** 18, 2 ** 16)
+
+
+def vocabulary(prefix, n):
+    return ['{}{}'.format(prefix, i) for i in range(n)]
+
+
+def message(rng, own, other, common):
+    """Returns a list of tokens for a message of the class whose typical
+    words are `own`.
+
+    """
+    words = rng.choices(own, k=40)
+    words += rng.choices(other, k=10)
+    words += rng.choices(common, k=60)
+    words += ['{:016x}'.format(rng.getrandbits(64)) for _ in range(50)]
+    return words
+
+
+def corpus(rng, n):
+    """Returns a list of `n` ham and `n` spam ``(tokens, is_spam)`` pairs."""
+    ham = vocabulary('ham', 20000)
+    spam = vocabulary('spam', 20000)
+    common = vocabulary('common', 50000)
+    return ([(message(rng, ham, spam, common), False) for _ in range(n)] +
+            [(message(rng, spam, ham, common), True) for _ in range(n)])
+
+
+def evaluate(make_classifier, training, testing):
+    """Returns a tuple ``(bytes, false_positives, false_negatives,
+    unsure)`` for a classifier returned by `make_classifier` and trained on
+    `training`.
+
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    classifier = make_classifier()
+    classifier.learn_many(training)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # The counts of a hashing classifier take a known number of bytes;
+    # anything else traced, such as the probability cache, is not part of
+    # the database.
+    size = getattr(classifier.wordinfo, 'size', size)
+    false_positives = false_negatives = unsure = 0
+    for tokens, is_spam in testing:
+        verdict = classify_probability(classifier.spamprob(tokens))
+        if verdict == UNSURE:
+            unsure += 1
+        elif is_spam and verdict == HAM:
+            false_negatives += 1
+        elif not is_spam and verdict == SPAM:
+            false_positives += 1
+    return size, false_positives, false_negatives, unsure
+
+
+def main(ntrain, ntest):
+    rng = random.Random(0)
+    training = corpus(rng, ntrain)
+    testing = corpus(rng, ntest)
+    print('{:>10} {:>14} {:>10} {:>10} {:>10}'.format(
+        'buckets', 'memory (bytes)', 'false pos.', 'false neg.', 'unsure'))
+    candidates = [('(basic)', Classifier)]
+    candidates += [(n, lambda n=n: HashingClassifier(n)) for n in NBUCKETS]
+    for name, make_classifier in candidates:
+        size, fp, fn, unsure = evaluate(make_classifier, training, testing)
+        print('{:>10} {:>14} {:>10.1%} {:>10.1%} {:>10.1%}'.format(
+            name, size, fp / ntest, fn / ntest, unsure / (2 * ntest)))
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [2000, 500][len(args):]))
@@ -0,0 +1,52 @@
+# bench_journal.py - storing a pickle versus appending to a journal
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Measures the time taken to store a large database after learning one
+message, with :class:`PickleClassifier` and with
+:class:`JournaledPickleClassifier`.
+
+Run this as ``python benchmarks/bench_journal.py [NTOKENS]``.
+
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sbclassifier.classifiers.storage import JournaledPickleClassifier
+from sbclassifier.classifiers.storage import PickleClassifier
+
+
+def main(ntokens, repeat=5):
+    directory = tempfile.mkdtemp()
+    print('{:>10} {:>14} {:>14}'.format('tokens', 'pickle (ms)',
+                                        'journal (ms)'))
+    for cls in PickleClassifier, JournaledPickleClassifier:
+        classifier = cls(os.path.join(directory, cls.__name__))
+        classifier.learn_many((['token{}'.format(j)
+                                for j in range(i, ntokens, 10)], i % 2 == 0)
+                              for i in range(10))
+        classifier.store()
+        start = time.perf_counter()
+        for i in range(repeat):
+            classifier.learn(['new{}'.format(i), 'token1', 'token2'], True)
+            classifier.store()
+        elapsed = (time.perf_counter() - start) / repeat
+        classifier.close()
+        if cls is PickleClassifier:
+            pickle_time = elapsed
+        else:
+            journal_time = elapsed
+    print('{:>10} {:>14.2f} {:>14.2f}'.format(ntokens, 1000 * pickle_time,
+                                              1000 * journal_time))
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,89 @@
+# bench_probcache.py - the cache of word probabilities across training
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Compares the cache of word probabilities kept by :class:`Classifier` with
+two alternatives: emptying a single table after every message trained, as
+the classifier originally did, and a least-recently-used cache keyed by
+``(spamcount, hamcount, nspam, nham)``.
+
+Run this as ``python benchmarks/bench_probcache.py``.  The ``score`` column
+only scores messages.  The ``interleaved`` column scores a message, trains
+it by mistake, un-learns it, and scores it again, as a mail client does when
+the user corrects a misfiled message; un-learning returns the classifier to
+message totals it has seen before, whose table of probabilities is kept.
+
+"""
+import random
+import timeit
+
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.classifiers.basic import PROBCACHE_SIZE
+from sbclassifier.lrucache import LRUCache
+
+
+class ResetClassifier(Classifier):
+    """Empties the cache after every message trained."""
+
+    def _post_training(self):
+        self._init_probcache()
+
+
+class LRUClassifier(Classifier):
+    """Keeps the probabilities in an LRU cache keyed by the counts of the
+    word together with the message totals.
+
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lru = LRUCache(PROBCACHE_SIZE)
+
+    def probability(self, record):
+        key = (record.spamcount, record.hamcount, self.nspam, self.nham)
+        prob = self._lru.get(key)
+        if prob is None:
+            prob = super().probability(record)
+            self._lru.put(key, prob)
+        return prob
+
+
+def build(cls, rng, vocabulary):
+    classifier = cls()
+    for i in range(400):
+        classifier.learn(rng.sample(vocabulary, 300), i % 2)
+    return classifier
+
+
+def main(repeat=3):
+    rng = random.Random(0)
+    vocabulary = ['token{}'.format(i) for i in range(20000)]
+    messages = [rng.sample(vocabulary, 300) for i in range(300)]
+
+    def score(classifier):
+        for message in messages:
+            classifier.spamprob(message)
+
+    def interleaved(classifier):
+        for i, message in enumerate(messages):
+            classifier.spamprob(message)
+            classifier.learn(message, i % 2)
+            classifier.unlearn(message, i % 2)
+            classifier.spamprob(message)
+
+    print('{:>12} {:>12} {:>18}'.format('cache', 'score (s)',
+                                        'interleaved (s)'))
+    for name, cls in (('reset', ResetClassifier), ('lru', LRUClassifier),
+                      ('tables', Classifier)):
+        classifier = build(cls, random.Random(1), vocabulary)
+        times = [min(timeit.repeat(lambda: f(classifier), number=1,
+                                   repeat=repeat))
+                 for f in (score, interleaved)]
+        print('{:>12} {:>12.3f} {:>18.3f}'.format(name, *times))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# bench_safepickle.py - time taken to store pickles of increasing size
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Compares the time taken by :func:`sbclassifier.safepickle.pickle_write`,
+with and without forcing the data to disk, against the original write path,
+which dumped the pickle to a temporary file in the system's temporary
+directory and then moved it over the target with :func:`shutil.move`.
+
+Run this as ``python benchmarks/bench_safepickle.py [DIRECTORY [MB ...]]``.
+The pickles are written in `DIRECTORY`, which defaults to the current
+directory; when it is on a different filesystem from the system's temporary
+directory, the original path copies every pickle a second time. The values
+pickled are lists of 1 MB byte strings, so that pickling itself, which costs
+the same on every path, takes almost no time; the sizes default to 10 MB,
+100 MB and 1 GB.
+
+"""
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+from sbclassifier.safepickle import pickle_write
+
+
+def original_pickle_write(filename, value, protocol=pickle.HIGHEST_PROTOCOL):
+    """The write path replaced by the current one."""
+    with tempfile.NamedTemporaryFile(delete=False) as fp:
+        pickle.dump(value, fp, protocol)
+    shutil.move(fp.name, filename)
+
+
+def main(directory, sizes, repeat=3):
+    print('{:>8} {:>14} {:>14} {:>14}'.format(
+        'MB', 'original (s)', 'no fsync (s)', 'fsync (s)'))
+    filename = os.path.join(directory, 'bench_safepickle.pickle')
+    writers = (original_pickle_write,
+               lambda f, v: pickle_write(f, v, fsync=False),
+               pickle_write)
+    for size in sizes:
+        value = [os.urandom(1024 * 1024) for _ in range(size)]
+        times = []
+        for write in writers:
+            start = time.perf_counter()
+            for i in range(repeat):
+                write(filename, value)
+            times.append((time.perf_counter() - start) / repeat)
+        print('{:>8} {:>14.3f} {:>14.3f} {:>14.3f}'.format(size, *times))
+    os.remove(filename)
+
+
+if __name__ == '__main__':
+    directory = sys.argv[1] if len(sys.argv) > 1 else os.curdir
+    sizes = [int(n) for n in sys.argv[2:]] or [10, 100, 1000]
+    main(directory, sizes)
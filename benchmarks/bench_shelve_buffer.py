@@ -0,0 +1,59 @@
+# bench_shelve_buffer.py - training a shelve with and without a write buffer
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Measures the time taken by a :class:`ShelveClassifier` to train on and
+store a batch of messages, and the number of writes made to the database,
+when every write is made at once, and when writes are buffered with the
+default flush policy and with a larger buffer.
+
+Run this as ``python benchmarks/bench_shelve_buffer.py [NMESSAGES]``.
+
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sbclassifier.classifiers.storage import ShelveClassifier
+
+
+def messages(n, rng, length=200, vocabulary=1000000):
+    return [(['token{}'.format(int(vocabulary ** rng.random()))
+              for _ in range(length)], rng.random() < 0.5)
+            for _ in range(n)]
+
+
+def main(nmessages):
+    corpus = messages(nmessages, random.Random(0))
+    directory = tempfile.mkdtemp()
+    print('{:>12} {:>10} {:>12} {:>12}'.format('', 'train (s)', 'db writes',
+                                               'saved'))
+    policies = (('unbuffered', dict(flush_count=1)),
+                ('default', {}),
+                ('large', dict(flush_count=100000,
+                               flush_bytes=64 * 1024 * 1024)))
+    for name, kw in policies:
+        classifier = ShelveClassifier(os.path.join(directory, name), **kw)
+        start = time.perf_counter()
+        for wordstream, is_spam in corpus:
+            classifier.learn(wordstream, is_spam)
+        classifier.store()
+        elapsed = time.perf_counter() - start
+        stats = classifier.buffer_stats()
+        # The changed words are written by store() whether or not writes
+        # are buffered, so only the buffered writes are counted here.
+        print('{:>12} {:>10.2f} {:>12} {:>12}'.format(
+            name, elapsed, stats['flushed'], stats['saved']))
+        classifier.close()
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,78 @@
+# bench_shelve_cache.py - memory and time taken to score from a shelve
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Measures the memory held and the time taken by a :class:`ShelveClassifier`
+scoring many messages, as a long-running scoring process would, with
+unbounded and bounded caches of word records.
+
+Run this as ``python benchmarks/bench_shelve_cache.py [NWORDS [SIZE ...]]``.
+The database holds `NWORDS` words, 200000 by default, and is scored with
+each cache size given, by default 1000 and 10000 as well as no bound.
+
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sbclassifier.classifiers.storage import ShelveClassifier
+from sbclassifier.corpora.caches import INFINITY
+
+
+def messages(n, nwords, rng, length=200):
+    return [['token{}'.format(int(nwords ** rng.random()))
+             for _ in range(length)] for _ in range(n)]
+
+
+def score(filename, cache_size, corpus):
+    classifier = ShelveClassifier(filename, cache_size=cache_size)
+    start = time.perf_counter()
+    for wordstream in corpus:
+        classifier.spamprob(wordstream)
+    elapsed = time.perf_counter() - start
+    stats = classifier.cache_stats()
+    classifier.close()
+    return elapsed, stats
+
+
+def main(nwords, sizes, nscored=5000):
+    rng = random.Random(0)
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'db')
+    classifier = ShelveClassifier(filename)
+    words = ['token{}'.format(i) for i in range(nwords)]
+    # Every word is seen twice, so that no record is a single count.
+    for i in range(0, nwords, 1000):
+        classifier.learn(words[i:i + 1000], True)
+        classifier.learn(words[i:i + 1000], False)
+    classifier.store()
+    classifier.close()
+    corpus = messages(nscored, nwords, rng)
+    print('{:>10} {:>12} {:>12} {:>10}'.format('cache', 'peak (MB)',
+                                                'score (s)', 'hit rate'))
+    for size in sizes:
+        # Memory is measured in a run of its own, since tracing slows the
+        # scoring down.
+        tracemalloc.start()
+        score(filename, size, corpus)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        elapsed, stats = score(filename, size, corpus)
+        hit_rate = stats['hits'] / (stats['hits'] + stats['misses'])
+        print('{:>10} {:>12.1f} {:>12.2f} {:>10.2f}'.format(
+            size, peak / 1e6, elapsed, hit_rate))
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    nwords = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    sizes = [int(n) for n in sys.argv[2:]] or [1000, 10000]
+    main(nwords, [INFINITY] + sizes)
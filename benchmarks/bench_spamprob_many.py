@@ -0,0 +1,72 @@
+# bench_spamprob_many.py - batch scoring versus scoring one message at a time
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Compares :meth:`Classifier.spamprob_many` with calling
+:meth:`Classifier.spamprob` on each message of a batch in turn.
+
+Run this as ``python benchmarks/bench_spamprob_many.py``.  The ``combine``
+columns time only the combining of clues that have already been selected,
+which is the stage that :meth:`spamprob_many` vectorizes; the ``total``
+columns also include the selection of clues, which is the same for both
+and takes most of the time, so the saving there is much smaller.
+
+"""
+import random
+import timeit
+
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.classifiers.basic import numpy_is_available
+
+BATCH_SIZES = (10, 100, 1000)
+
+
+def build(rng):
+    """Returns a classifier trained on random messages, and a function
+    returning a random message of the same kind.
+
+    """
+    hammy = ['ham{}'.format(i) for i in range(3000)]
+    spammy = ['spam{}'.format(i) for i in range(3000)]
+    vocabulary = hammy + spammy
+    classifier = Classifier()
+    for i in range(200):
+        classifier.learn_ham(rng.sample(hammy, 200))
+        classifier.learn_spam(rng.sample(spammy, 200))
+
+    def message():
+        return rng.sample(vocabulary, 300)
+
+    return classifier, message
+
+
+def main(repeat=5):
+    if not numpy_is_available:
+        print('NumPy is not available; spamprob_many() scores one message'
+              ' at a time.')
+        return
+    rng = random.Random(0)
+    classifier, message = build(rng)
+    print('{:>6} {:>14} {:>14} {:>12} {:>12}'.format(
+        'batch', 'combine (ms)', 'combine_many', 'total (ms)',
+        'total_many'))
+    for size in BATCH_SIZES:
+        batch = [message() for i in range(size)]
+        allclues = [classifier._getclues(w) for w in batch]
+
+        def best(f):
+            return min(timeit.repeat(f, number=1, repeat=repeat)) * 1000
+
+        combine = best(lambda: [classifier._combine(c) for c in allclues])
+        combine_many = best(lambda: classifier._combine_many(allclues))
+        total = best(lambda: [classifier.spamprob(w) for w in batch])
+        total_many = best(lambda: classifier.spamprob_many(batch))
+        print('{:>6} {:>14.2f} {:>14.2f} {:>12.2f} {:>12.2f}'.format(
+            size, combine, combine_many, total, total_many))
+
+
+if __name__ == '__main__':
+    main()
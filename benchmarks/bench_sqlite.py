@@ -0,0 +1,75 @@
+# bench_sqlite.py - training and scoring with a SQLite database
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Measures the time taken to train on and store a batch of messages, and
+to score messages with a freshly opened database, as a reader process
+would, with :class:`ShelveClassifier`, with :class:`SQLiteClassifier`, and
+with a :class:`SQLiteClassifier` which looks up one token per query.
+
+Run this as ``python benchmarks/bench_sqlite.py [NMESSAGES]``.
+
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.classifiers.storage import ShelveClassifier
+from sbclassifier.classifiers.storage import SQLiteClassifier
+
+
+class PerTokenSQLiteClassifier(SQLiteClassifier):
+    """Looks up each token with a query of its own."""
+
+    def _getclues(self, wordstream, worddistanceget=None):
+        self._refresh()
+        return Classifier._getclues(self, wordstream, worddistanceget)
+
+    def _distinct(self, wordstream):
+        self._refresh()
+        return Classifier._distinct(self, wordstream)
+
+
+def messages(n, rng, length=200, vocabulary=1000000):
+    return [(['token{}'.format(int(vocabulary ** rng.random()))
+              for _ in range(length)], rng.random() < 0.5)
+            for _ in range(n)]
+
+
+def main(nmessages, nscored=200):
+    rng = random.Random(0)
+    corpus = messages(nmessages, rng)
+    scored = messages(nscored, rng)
+    directory = tempfile.mkdtemp()
+    print('{:>28} {:>12} {:>18}'.format('', 'train (s)', 'score (ms/msg)'))
+    for cls in (ShelveClassifier, SQLiteClassifier,
+                PerTokenSQLiteClassifier):
+        filename = os.path.join(directory, cls.__name__)
+        classifier = cls(filename)
+        start = time.perf_counter()
+        for wordstream, is_spam in corpus:
+            classifier.learn(wordstream, is_spam)
+        classifier.store()
+        train_time = time.perf_counter() - start
+        classifier.close()
+        classifier = cls(filename)
+        start = time.perf_counter()
+        for wordstream, _ in scored:
+            classifier.spamprob(wordstream)
+        score_time = (time.perf_counter() - start) / nscored
+        classifier.close()
+        print('{:>28} {:>12.2f} {:>18.3f}'.format(cls.__name__, train_time,
+                                                  1000 * score_time))
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,61 @@
+# bench_streaming.py - memory used to score a very long message
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Measures the peak memory and time taken to score one very long message,
+generated lazily as a tokenizer would, with the default scorer and with the
+streaming scorer using an exact and a Bloom seen-filter.
+
+Run this as ``python benchmarks/bench_streaming.py [NTOKENS]``. The default
+message has two million tokens, about as many as a 10 MB message, half of
+them distinct. Peak memory is measured with :mod:`tracemalloc` and excludes
+the database, which is built before measuring starts; the time includes
+generating the tokens.
+
+"""
+import functools
+import random
+import sys
+import time
+import tracemalloc
+
+from sbclassifier.bloomfilter import BloomFilter
+from sbclassifier.classifiers.basic import Classifier
+
+
+def message(n):
+    """Yields `n` tokens, about half of them distinct."""
+    rng = random.Random(0)
+    for i in range(n):
+        yield 'token{}'.format(rng.randrange(n // 2))
+
+
+def main(n):
+    classifier = Classifier()
+    for i in range(20):
+        classifier.learn(['token{}'.format(j) for j in range(i, 50000, 20)],
+                         i % 2 == 0)
+    filters = [('default', None), ('set', set),
+               ('bloom', functools.partial(BloomFilter, n, 0.001))]
+    print('{:>8} {:>12} {:>10} {:>10}'.format('filter', 'peak (MB)',
+                                              'time (s)', 'prob'))
+    for name, seen_filter in filters:
+        classifier.seen_filter = seen_filter
+        start = time.perf_counter()
+        prob = classifier.spamprob(message(n))
+        elapsed = time.perf_counter() - start
+        # Tracing slows everything down, so time and memory are measured
+        # in separate runs.
+        tracemalloc.start()
+        classifier.spamprob(message(n))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('{:>8} {:>12.1f} {:>10.2f} {:>10.6f}'.format(
+            name, peak / 2 ** 20, elapsed, prob))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000000)
@@ -0,0 +1,54 @@
+# bench_wordinfo_memory.py - memory used by the token database
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Compares the memory used by the token database of the basic classifier
+(a dictionary of :class:`WordInfo` objects) with that of
+:class:`CompactClassifier` (arrays of counts).
+
+Run this as ``python benchmarks/bench_wordinfo_memory.py [NTOKENS ...]``.
+The token strings themselves are allocated before measuring, since both
+classifiers must hold them.
+
+"""
+import sys
+import tracemalloc
+
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.classifiers.compact import CompactClassifier
+
+
+def measure(classifier_class, tokens):
+    """Returns the number of bytes allocated while storing one record for
+    each of the specified tokens in a new instance of `classifier_class`.
+
+    """
+    tracemalloc.start()
+    classifier = classifier_class()
+    before = tracemalloc.get_traced_memory()[0]
+    for i, token in enumerate(tokens):
+        # Mimic the distribution of a real database, in which most tokens
+        # are hapaxes but some have large counts.
+        record = classifier.WordInfoClass(i % 2, (i % 3) * (i % 1000))
+        classifier._wordinfoset(token, record)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before
+
+
+def main(sizes):
+    print('{:>10} {:>14} {:>14} {:>8}'.format('tokens', 'dict (bytes)',
+                                              'array (bytes)', 'ratio'))
+    for n in sizes:
+        tokens = ['token{}'.format(i) for i in range(n)]
+        basic = measure(Classifier, tokens)
+        compact = measure(CompactClassifier, tokens)
+        print('{:>10} {:>14} {:>14} {:>8.2f}'.format(n, basic, compact,
+                                                     basic / compact))
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [10 ** 4, 10 ** 5, 10 ** 6])
@@ -0,0 +1,93 @@
+# bloomfilter.py - a compact, approximate set
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""A set-like filter which may report items as present which are not."""
+import math
+
+#: The default probability that a full :class:`BloomFilter` reports an item
+#: as present which was never added.
+ERROR_RATE = 0.001
+
+_MASK = (1 << 64) - 1
+
+# Never an item; see BloomFilter._last.
+_NO_ITEM = object()
+
+
+class BloomFilter:
+    """A Bloom filter sized for `capacity` distinct items with a false
+    positive probability of `error_rate`.
+
+    Items are added with :meth:`add` and tested with ``in``. An item that
+    was added is always reported as present; an item that was not is
+    reported as present with probability about `error_rate`, as long as no
+    more than `capacity` distinct items have been added, and with increasing
+    probability as more are. The filter uses about ``-1.44 *
+    math.log2(error_rate)`` bits per item of capacity, however large the
+    items are: under 2 bytes per item for the default error rate. In
+    exchange, testing and adding an item take several times as long as they
+    do for a :class:`set`.
+
+    Items are hashed with :func:`hash`, so they should be strings or bytes,
+    and which items are false positives differs between processes.
+
+    There is no default capacity, since the whole filter is allocated and
+    zeroed when it is created: a filter sized for a million items takes
+    1.8 MB at the default error rate, far more than a :class:`set` of the
+    tokens of a typical message. To use a Bloom filter as the
+    ``seen_filter`` of a classifier, set it to a factory with a capacity
+    chosen for the longest messages expected, such as
+    ``functools.partial(BloomFilter, 100000)``.
+
+    """
+
+    def __init__(self, capacity, error_rate=ERROR_RATE):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        if not 0 < error_rate < 1:
+            raise ValueError('error rate must be between 0 and 1')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        nbits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        #: The number of bits in the filter.
+        self.nbits = max(8, nbits)
+        #: The number of bits set for each item.
+        self.nhashes = max(1, round(self.nbits / capacity * math.log(2)))
+        self.bits = bytearray((self.nbits + 7) // 8)
+        # The item most recently tested with "in", and its positions, since
+        # an item is usually added right after it is found to be absent.
+        self._last = _NO_ITEM, None
+
+    def _positions(self, item):
+        if item is self._last[0]:
+            return self._last[1]
+        # Double hashing: the positions h1 + i * h2 for i in range(k) are
+        # as good as k independent hashes.
+        h = hash(item) & _MASK
+        h2 = (h >> 32) | 1
+        start = h & 0xffffffff
+        nbits = self.nbits
+        return [x % nbits
+                for x in range(start, start + self.nhashes * h2, h2)]
+
+    def __contains__(self, item):
+        positions = self._positions(item)
+        self._last = item, positions
+        bits = self.bits
+        for i in positions:
+            if not bits[i >> 3] & (1 << (i & 7)):
+                return False
+        return True
+
+    def add(self, item):
+        """Adds `item` to the filter."""
+        bits = self.bits
+        for i in self._positions(item):
+            bits[i >> 3] |= 1 << (i & 7)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self.bits.__sizeof__()
@@ -5,8 +5,15 @@
 #
 # This file is part of sbclassifier, which is licensed under the Python
 # Software Foundation License; for more information, see LICENSE.txt.
+from .asynchronous import AsyncClassifier
 from .basic import Classifier
+from .compact import CompactClassifier
+from .frozen import FrozenClassifier
+from .hashing import HashingClassifier
+from .layered import LayeredClassifier
 from .slurping import SlurpingClassifier
+from .threadsafe import SnapshotClassifier
 from .storage import PickleClassifier
 from .storage import ShelveClassifier
+from .storage import SQLiteClassifier
 from .storage import CDBClassifier
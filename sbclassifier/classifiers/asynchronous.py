@@ -0,0 +1,155 @@
+# asynchronous.py - using a classifier from asyncio code
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""A facade which lets asyncio code tokenize, score, train and store without
+blocking the event loop.
+
+Tokenizing a message is pure computation, while looking its tokens up and
+storing the database may wait for the disk. :class:`AsyncClassifier` runs
+the former in a configurable executor, which may be a process pool, and the
+latter in a thread pool, and serializes every use of the classifier so that
+the results are exactly those of the synchronous API called in the order in
+which the coroutines reached the classifier::
+
+    classifier = AsyncClassifier(ShelveClassifier('tokens.db'))
+    prob = await classifier.score(message)
+    await classifier.learn(message, True)
+    await classifier.store()
+
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from sbclassifier.tokenizer import tokenize
+
+
+def _tokenize(tokenizer, message):
+    """Returns the list of tokens generated by `tokenizer` for `message`.
+
+    This is a module-level function so that it can run in a process pool.
+
+    """
+    return list(tokenizer(message))
+
+
+class AsyncClassifier:
+    """An asyncio facade for `classifier`.
+
+    `tokenizer` turns each message given to :meth:`score`, :meth:`learn` and
+    :meth:`unlearn` into tokens; it defaults to
+    :data:`sbclassifier.tokenizer.tokenize`, which accepts strings and
+    :class:`email.message.Message` objects. Tokenizing runs in `executor`,
+    which defaults to the event loop's default executor; if it is a process
+    pool, `tokenizer` and the messages must be picklable.
+
+    Everything else that uses `classifier` runs in `io_executor`, which
+    defaults to a thread pool of its own with a single thread, and is
+    serialized by a lock in any case, since classifiers are not thread-safe.
+
+    Concurrent calls to :meth:`store` are coalesced: a call that arrives
+    while the database is being stored waits for that store to finish and
+    then for one more store, which it shares with every other call that
+    arrived in the meantime. Each call therefore returns only once every
+    training call that completed before it was made has been stored, but
+    there are never more than two stores waiting or in progress.
+
+    """
+
+    def __init__(self, classifier, tokenizer=tokenize, executor=None,
+                 io_executor=None):
+        self.classifier = classifier
+        self.tokenizer = tokenizer
+        self.executor = executor
+        self._own_io_executor = io_executor is None
+        if io_executor is None:
+            io_executor = ThreadPoolExecutor(max_workers=1)
+        self.io_executor = io_executor
+        self._lock = threading.Lock()
+        # The store in progress, and the one that will follow it.
+        self._current_store = None
+        self._next_store = None
+        #: The number of times the database has been stored.
+        self.stores = 0
+
+    def _locked(self, function, *args):
+        with self._lock:
+            return function(*args)
+
+    async def _run_io(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.io_executor, self._locked,
+                                          function, *args)
+
+    async def tokenize(self, message):
+        """Returns the list of tokens of `message`."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _tokenize,
+                                          self.tokenizer, message)
+
+    async def score(self, message, evidence=False):
+        """Returns the probability that `message` is spam, as returned by
+        :meth:`Classifier.spamprob`.
+
+        """
+        tokens = await self.tokenize(message)
+        return await self._run_io(self.classifier.spamprob, tokens, evidence)
+
+    async def learn(self, message, is_spam):
+        """Teaches the classifier that `message` is spam if `is_spam` is
+        true, or ham otherwise.
+
+        """
+        tokens = await self.tokenize(message)
+        await self._run_io(self.classifier.learn, tokens, is_spam)
+
+    async def unlearn(self, message, is_spam):
+        """Un-learns `message`, as :meth:`Classifier.unlearn` does."""
+        tokens = await self.tokenize(message)
+        await self._run_io(self.classifier.unlearn, tokens, is_spam)
+
+    async def store(self):
+        """Stores the database of the classifier, which must have a
+        ``store`` method.
+
+        """
+        if self._next_store is None:
+            self._next_store = asyncio.ensure_future(
+                self._store_after(self._current_store))
+        await asyncio.shield(self._next_store)
+
+    async def _store_after(self, previous):
+        if previous is not None:
+            try:
+                await previous
+            except Exception:
+                # That store's callers see its exception; this one starts
+                # afresh.
+                pass
+        # Calls made from now on need a store that starts after this one.
+        this = self._current_store = self._next_store
+        self._next_store = None
+        try:
+            await self._run_io(self.classifier.store)
+            self.stores += 1
+        finally:
+            if self._current_store is this:
+                self._current_store = None
+
+    async def close(self):
+        """Waits for any pending store, then shuts down the thread pool
+        created for input and output, if any.
+
+        """
+        for future in self._next_store, self._current_store:
+            if future is not None:
+                try:
+                    await future
+                except Exception:
+                    pass
+        if self._own_io_executor:
+            self.io_executor.shutdown()
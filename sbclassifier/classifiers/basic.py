@@ -41,14 +41,39 @@ of scores, and good cutoff values aren't touchy).
 This implementation is due to Tim Peters et alia.
 
 """
+from collections import Counter
+from collections import namedtuple
+from collections import OrderedDict
+import heapq
 import itertools
 import math
+import operator
+
+try:
+    import numpy
+    numpy_is_available = True
+except ImportError:
+    numpy_is_available = False
+
+from sbclassifier.classifiers.constants import HAM
+from sbclassifier.classifiers.constants import HAM_CUTOFF
+from sbclassifier.classifiers.constants import SPAM
+from sbclassifier.classifiers.constants import SPAM_CUTOFF
+from sbclassifier.classifiers.constants import UNSURE
+from sbclassifier.instrumentation import clock
+from sbclassifier.instrumentation import CLUES
+from sbclassifier.instrumentation import COMBINE
+from sbclassifier.instrumentation import LOOKUP
+from sbclassifier.instrumentation import LOOKUPS
+from sbclassifier.instrumentation import PROBCACHE_HITS
+from sbclassifier.instrumentation import PROBCACHE_MISSES
+from sbclassifier.instrumentation import SPAMPROB
 
 #: The natural logarithm of two; this is used frequently by a function
 #: performing chi-combining.
 LN2 = math.log(2)
 
-PICKLE_VERSION = 5
+PICKLE_VERSION = 6
 
 #: The format string for creating a token from a bigram.
 BIGRAM_FORMAT = 'bi:{} {}'
@@ -105,6 +130,50 @@ MINIMUM_PROB_STRENGTH = 0.1
 #: well across all corpora tested.
 MAX_DISCRIMINATORS = 150
 
+#: When a message has more than this many candidate clues, the strongest
+#: :const:`MAX_DISCRIMINATORS` of them are selected with a bounded heap rather
+#: than by sorting all of them.  Sorting is faster for short messages because
+#: it runs entirely in C; see benchmarks/bench_getclues.py for the measurements
+#: from which this crossover point was chosen.
+HEAP_SELECTION_THRESHOLD = 1500
+
+#: The maximum number of entries in each table of the cache of word
+#: probabilities kept by each classifier.  A table holds the probabilities for
+#: one pair of spam and ham message totals, keyed by the spam and ham counts of
+#: a word; when a table is full, its least recently used entry is evicted.
+PROBCACHE_SIZE = 10000
+
+#: The number of tables of word probabilities kept by each classifier.
+#: Training changes the message totals, and so switches to a different table,
+#: but the tables for the most recent totals are kept, so that un-learning a
+#: mistaken message, or alternating between the same totals, reuses the
+#: probabilities already computed for them.
+PROBCACHE_TABLES = 4
+
+#: When classifying a message with early termination enabled, check whether
+#: the verdict is already decided once this many clues have been evaluated,
+#: and again each time the number evaluated has doubled.  Each check costs
+#: four evaluations of chi2Q(), so checking more often would usually cost
+#: more than it saves; see benchmarks/bench_classify.py.
+EARLY_EXIT_FIRST_CHECK = 16
+
+#: The result of :meth:`Classifier.classify`.
+#:
+#: `classification` is one of :const:`HAM`, :const:`SPAM`, or :const:`UNSURE`.
+#: The spam probability of the message is known to be in the closed interval
+#: [`low`, `high`]; if all the clues were evaluated, both are equal to the
+#: probability :meth:`Classifier.spamprob` would return.  `early` is ``True``
+#: if the classification was decided before all the clues were evaluated, and
+#: `nclues` is the number of clues that were evaluated.
+Classification = namedtuple('Classification',
+                            'classification low high early nclues')
+
+
+#: A term of the series in :func:`chi2Q` that is at most this fraction of
+#: the partial sum is less than half a unit in the last place of the partial
+#: sum, so adding it (or any smaller term) does not change the sum at all.
+NEGLIGIBLE_TERM = 2.0 ** -54
+
 
 def chi2Q(x2, v):  # , exp=math.exp, min=min):
     """Return the probability that `chisq` is at least x2, with `v` degrees of
@@ -116,13 +185,43 @@ def chi2Q(x2, v):  # , exp=math.exp, min=min):
     if v & 1 != 0:
         raise ValueError('v must be even')
 
-    # XXX If x2 is very large, exp(-m) will underflow to 0.
+    # For even v, the survival function is the finite series
+    #
+    #     exp(-m) * sum(m**i / i! for i in range(v // 2))
+    #
+    # with m = x2 / 2.  The ratio of consecutive terms is m / i, so the terms
+    # increase while i < m and decrease afterwards.  The series is summed
+    # starting from its smallest end, and as soon as the terms become too
+    # small to change the sum (see NEGLIGIBLE_TERM), the summation stops.
+    # Since the terms only get smaller from there, stopping early gives
+    # exactly the same result as summing every term.
     m = x2 / 2  # this is true division on Python 3
-    result = math.exp(-m)
-    term = result
-    for i in range(1, v // 2):
-        term *= m / i
-        result += term
+    k = v // 2
+    if k > 1 and m >= k - 1:
+        # Every term is larger than the one before, so sum backwards from the
+        # last term, computed directly in log space.  This also avoids the
+        # underflow of exp(-m) for very large x2, which would make the
+        # forward summation return 0.
+        term = math.exp((k - 1) * math.log(m) - m - math.lgamma(k))
+        result = term
+        for i in range(k - 1, 0, -1):
+            term *= i / m
+            if term <= result * NEGLIGIBLE_TERM:
+                break
+            result += term
+    else:
+        result = math.exp(-m)
+        term = result
+        # The terms increase up to i = m, so none of them can be negligible.
+        peak = min(int(m) + 1, k)
+        for i in range(1, peak):
+            term *= m / i
+            result += term
+        for i in range(peak, k):
+            term *= m / i
+            if term <= result * NEGLIGIBLE_TERM:
+                break
+            result += term
     # With small x2 and large v, accumulated roundoff error, plus error in
     # the platform exp(), can cause this to spill a few ULP above 1.0.  For
     # example, chi2Q(100, 300) on my box has sum == 1.0 + 2.0**-52 at this
@@ -130,6 +229,81 @@ def chi2Q(x2, v):  # , exp=math.exp, min=min):
     return min(result, 1.0)
 
 
+def chi2_combine(S, H, n):
+    """Returns the spam probability for a message with `n` clues, given the
+    natural logarithms of the products of their (1 - probability) values and
+    of their probability values, `S` and `H` respectively.
+
+    """
+    S = 1 - chi2Q(-2 * S, 2 * n)
+    H = 1 - chi2Q(-2 * H, 2 * n)
+    return (S - H + 1) / 2
+
+
+def classify_probability(prob, ham_cutoff=HAM_CUTOFF,
+                         spam_cutoff=SPAM_CUTOFF):
+    """Returns :const:`HAM`, :const:`SPAM`, or :const:`UNSURE`, depending on
+    where the spam probability `prob` lies with respect to the cutoffs.
+
+    """
+    if prob <= ham_cutoff:
+        return HAM
+    if prob >= spam_cutoff:
+        return SPAM
+    return UNSURE
+
+
+def chi2Q_many(x2, v):
+    """Vectorized version of :func:`chi2Q`.
+
+    `x2` and `v` are NumPy arrays of the same shape (or objects that can be
+    converted to such arrays); the return value is an array in which each
+    element is ``chi2Q(x2[i], v[i])``, computed from the same series as
+    :func:`chi2Q` computes, for every element at once.
+
+    If any element of `v` is not even, :exc:`ValueError` is raised.
+
+    This function requires NumPy.
+
+    """
+    x2 = numpy.asarray(x2, dtype=float)
+    v = numpy.asarray(v, dtype=int)
+    if numpy.any(v & 1):
+        raise ValueError('v must be even')
+    shape = x2.shape
+    m = x2.reshape(-1, 1) / 2
+    k = v.reshape(-1, 1) // 2
+    # As in chi2Q(), each series starts from its largest end: the first
+    # term, exp(-m), if the terms decrease, and otherwise the last term,
+    # computed in log space.  Each row of the ratios below holds the ratio
+    # of each term after the starting one to the term before it, or zero
+    # once the series has ended, so the cumulative products along the row
+    # are the remaining terms of the series divided by the starting one.
+    backward = ((k > 1) & (m >= k - 1))[:, 0]
+    forward = ~backward
+    kmax = int(k.max(initial=1))
+    j = numpy.arange(1, kmax)
+    result = numpy.empty(len(m))
+    if backward.any():
+        mb = m[backward]
+        kb = k[backward]
+        # lgamma[i - 1] is lgamma(i); this table depends only on the
+        # largest element of v, not on the number of elements.
+        lgamma = numpy.array([math.lgamma(i) for i in range(1, kmax + 1)])
+        last = numpy.exp((kb - 1) * numpy.log(mb) - mb - lgamma[kb - 1])
+        # The ratio (k - j) / m is zero once the series has ended at j = k.
+        ratios = (kb - j) / mb
+        result[backward] = last[:, 0] * (1 + numpy.cumprod(
+            ratios, axis=1).sum(axis=1))
+    if forward.any():
+        mf = m[forward]
+        ratios = mf / j * (j < k[forward])
+        result[forward] = numpy.exp(-mf[:, 0]) * (1 + numpy.cumprod(
+            ratios, axis=1).sum(axis=1))
+    # See chi2Q() for why the result is limited to one.
+    return numpy.minimum(result, 1.0).reshape(shape)
+
+
 class WordInfo(object):
     """Represents the number of occurences of a word in spam and in ham.
 
@@ -177,24 +351,139 @@ class Classifier:
     # allow a subclass to use a different class for WordInfo
     WordInfoClass = WordInfo
 
-    def __init__(self, use_bigrams=USE_BIGRAMS):
+    # If this is not None, each change made by training is also recorded by
+    # calling journal.record(nspam, nham, deltas), where nspam and nham are
+    # the changes in the number of messages and deltas maps each changed
+    # word to the pair of changes in its spam and ham counts.  See
+    # sbclassifier.classifiers.replication.
+    journal = None
+
+    # If this is not None, each call to spamprob() reports the time taken by
+    # each of its stages and the number of lookups it made to this
+    # sbclassifier.instrumentation.Instrument.
+    instrument = None
+
+    # If this is not None, spamprob() scores unigrams in a single pass over
+    # the tokens, keeping only the strongest MAX_DISCRIMINATORS candidates
+    # instead of a set of every distinct token, and calls seen_filter() for
+    # each message to make the collection of tokens already seen.  This may
+    # be set, which gives the same results, or a factory for
+    # sbclassifier.bloomfilter.BloomFilter with a capacity fitting the
+    # longest messages expected, such as functools.partial(BloomFilter,
+    # 100000), which uses far less memory for long messages but skips the
+    # occasional token as a false positive.
+    seen_filter = None
+
+    # Whether _wordinfokeys() can list the words in the database.  A
+    # classifier which does not store its words, such as
+    # sbclassifier.classifiers.hashing.HashingClassifier, sets this to False,
+    # and cannot be pruned.
+    stores_words = True
+
+    # Whether training records the generation in which each word was last
+    # learned, through _lastseenset() and _lastseendel().  This costs an
+    # entry per word, so it is off unless set to True, as it must be on a
+    # classifier to be pruned with
+    # sbclassifier.classifiers.pruning.HapaxAgePolicy.
+    track_lastseen = False
+
+    # The number of tables of word probabilities kept for different message
+    # totals, including the current one; see PROBCACHE_TABLES.
+    probcache_tables = PROBCACHE_TABLES
+
+    # The number of changes made to the database by this object.  Anything
+    # that changes the counts of words or messages increments this, so that
+    # results computed from the database can be recognized as out of date;
+    # see sbclassifier.classifiers.scorecache.
+    version = 0
+
+    def __init__(self, use_bigrams=USE_BIGRAMS,
+                 probcache_size=PROBCACHE_SIZE):
         self._use_bigrams = use_bigrams
         self.wordinfo = {}
-        # This is an optimization; this contains the probability for each
-        # (hamcount, spamcount) property. It is only set during the call to
-        # probability().
-        self._probcache = {}
+        self._probcache_size = probcache_size
+        self._init_probcache()
         self.nspam = 0
         self.nham = 0
+        #: The number of calls to :meth:`learn` or :meth:`learn_many` so
+        #: far; each such call is one training generation.
+        self.generation = 0
+        #: Maps each word to the generation in which it was last learned, if
+        #: :attr:`track_lastseen` is true.
+        self.lastseen = {}
 
     def __getstate__(self):
-        return (PICKLE_VERSION, self.wordinfo, self.nspam, self.nham)
+        return (PICKLE_VERSION, self.wordinfo, self.nspam, self.nham,
+                self.generation, self.lastseen)
 
     def __setstate__(self, t):
-        if t[0] != PICKLE_VERSION:
+        if t[0] == 5:
+            # Version 5 did not record the age of words.
+            t = t + (0, {})
+        elif t[0] != PICKLE_VERSION:
             raise ValueError("Can't unpickle; version %s unknown".format(t[0]))
-        self.wordinfo, self.nspam, self.nham = t[1:]
-        self._probcache = {}
+        (self.wordinfo, self.nspam, self.nham, self.generation,
+         self.lastseen) = t[1:]
+        if not hasattr(self, '_probcache'):
+            self._probcache_size = PROBCACHE_SIZE
+            self._init_probcache()
+
+    def refresh(self):
+        """Picks up any changes stored in the database by other processes,
+        incrementing :attr:`version` if there were any.
+
+        The basic classifier keeps its database in memory, so this does
+        nothing; subclasses whose database may be shared override it.
+
+        """
+        pass
+
+    def _init_probcache(self):
+        # This is an optimization; self._probcache maps each pair
+        # (spamcount, hamcount) to the probability, for the message totals
+        # self._probcache_nspam and self._probcache_nham, in order from the
+        # least to the most recently used. It is only set during the call to
+        # probability(), which switches to the table for the current totals
+        # first, so training never needs to invalidate it. The tables for the
+        # last few totals are kept in self._probcaches, keyed by (nspam,
+        # nham).
+        self._probcaches = {}
+        self._probcache = OrderedDict()
+        self._probcache_nspam = self._probcache_nham = None
+        self._probcache_hits = 0
+        self._probcache_misses = 0
+
+    def _switch_probcache(self, nspam, nham):
+        """Makes the table of probabilities for the message totals `nspam`
+        and `nham` the current one, creating it if necessary.
+
+        """
+        tables = self._probcaches
+        if self._probcache_nspam is not None:
+            tables[self._probcache_nspam, self._probcache_nham] = (
+                self._probcache)
+        table = tables.pop((nspam, nham), None)
+        while len(tables) >= self.probcache_tables:
+            del tables[next(iter(tables))]
+        self._probcache = table if table is not None else OrderedDict()
+        self._probcache_nspam = nspam
+        self._probcache_nham = nham
+
+    @property
+    def probcache_hits(self):
+        """The number of calls to :meth:`probability` answered from the
+        cache.
+
+        """
+        return self._probcache_hits
+
+    @property
+    def probcache_misses(self):
+        """The number of calls to :meth:`probability` that had to compute the
+        probability.
+
+        """
+        return self._probcache_misses
 
     # Implementation note: Across vectors of length n, containing random
     # uniformly-distributed probabilities, -2*sum(ln(p_i)) follows the
@@ -219,6 +508,64 @@ class Classifier:
         first element is the probability as described above and the second
         element is a list of (word, probability) pairs representing....
 
+        """
+        if self.instrument is not None:
+            return self._instrumented_spamprob(wordstream, evidence)
+        clues = self._getclues(wordstream)
+        prob, S, H = self._combine(clues)
+        if evidence:
+            return prob, self._evidence(clues, S, H)
+        return prob
+
+    def _instrumented_spamprob(self, wordstream, evidence):
+        """Does the same as :meth:`spamprob`, reporting the time taken by each
+        stage to :attr:`instrument`.
+
+        """
+        instrument = self.instrument
+        wordinfoget = self._wordinfoget
+        lookups = 0
+        lookup_time = 0
+
+        def worddistanceget(word):
+            nonlocal lookups, lookup_time
+            before = clock()
+            record = wordinfoget(word)
+            lookup_time += clock() - before
+            lookups += 1
+            if record is None:
+                prob = UNKNOWN_WORD_PROB
+            else:
+                prob = self.probability(record)
+            return abs(prob - 0.5), prob, word, record
+
+        hits = self.probcache_hits
+        misses = self.probcache_misses
+        start = clock()
+        clues = self._getclues(wordstream, worddistanceget)
+        combine_start = clock()
+        prob, S, H = self._combine(clues)
+        end = clock()
+        instrument.record(CLUES, combine_start - start)
+        instrument.record(LOOKUP, lookup_time)
+        instrument.record(COMBINE, end - combine_start)
+        instrument.record(SPAMPROB, end - start)
+        instrument.count(LOOKUPS, lookups)
+        instrument.count(PROBCACHE_HITS, self.probcache_hits - hits)
+        instrument.count(PROBCACHE_MISSES, self.probcache_misses - misses)
+        if evidence:
+            return prob, self._evidence(clues, S, H)
+        return prob
+
+    def _combine(self, clues):
+        """Combines the probabilities of the specified clues into a single
+        spam probability.
+
+        `clues` is a list as returned by :meth:`_getclues`. The return value is
+        a triple ``(prob, S, H)``, in which `prob` is the probability returned
+        by :meth:`spamprob` and `S` and `H` are the spam and ham measures
+        included in its evidence.
+
         """
         # We compute two chi-squared statistics, one for ham and one for spam.
         # The sum-of-the-logs business is more sensitive to probs near 0 than
@@ -236,7 +583,6 @@ class Classifier:
         Hexp = 0
         Sexp = 0
 
-        clues = self._getclues(wordstream)
         for prob, word, record in clues:
             S *= 1 - prob
             H *= prob
@@ -268,14 +614,142 @@ class Classifier:
             prob = (S - H + 1) / 2
         else:
             prob = 0.5
+        return prob, S, H
+
+    def classify(self, wordstream, early_exit=False, ham_cutoff=HAM_CUTOFF,
+                 spam_cutoff=SPAM_CUTOFF):
+        """Classifies `wordstream` as ham, spam, or unsure.
+
+        `wordstream` is as in :meth:`spamprob`. The return value is a
+        :data:`Classification`.
+
+        If `early_exit` is ``True``, the clues are evaluated from strongest to
+        weakest, and evaluation stops as soon as the remaining clues cannot
+        change the classification. This is decided from the fact that the
+        spam probability only increases when the probability of any clue
+        increases: the remaining clues are no stronger than the last one
+        evaluated, so the final probability is bounded by the probabilities
+        computed as if all of them were as hammy, or as spammy, as possible.
 
+        Since every clue has been looked up before the first one is
+        evaluated, early termination saves only part of the combining, which
+        is a small part of the cost of classifying a message, so it is off by
+        default.
+
+        """
+        clues = self._getclues(wordstream)
+        n = len(clues)
+        if early_exit:
+            # The products are kept as in _combine(), and their logarithms
+            # are only taken when the verdict is checked.
+            S = H = 1.0
+            Sexp = Hexp = 0
+            check = EARLY_EXIT_FIRST_CHECK
+            for i, (prob, word, record) in enumerate(reversed(clues), 1):
+                S *= 1 - prob
+                H *= prob
+                if S < 1e-200:  # prevent underflow
+                    S, e = math.frexp(S)
+                    Sexp += e
+                if H < 1e-200:  # prevent underflow
+                    H, e = math.frexp(H)
+                    Hexp += e
+                if i < check or i == n:
+                    continue
+                check *= 2
+                logS = math.log(S) + Sexp * LN2
+                logH = math.log(H) + Hexp * LN2
+                remaining = n - i
+                distance = abs(prob - 0.5)
+                weak = math.log(0.5 - distance) * remaining
+                strong = math.log(0.5 + distance) * remaining
+                low = chi2_combine(logS + strong, logH + weak, n)
+                high = chi2_combine(logS + weak, logH + strong, n)
+                classification = classify_probability(low, ham_cutoff,
+                                                      spam_cutoff)
+                if classification == classify_probability(high, ham_cutoff,
+                                                          spam_cutoff):
+                    return Classification(classification, low, high, True, i)
+        prob = self._combine(clues)[0]
+        return Classification(classify_probability(prob, ham_cutoff,
+                                                   spam_cutoff),
+                              prob, prob, False, n)
+
+    def spamprob_many(self, wordstreams, evidence=False):
+        """Returns best-guess probabilities that each of the wordstreams in
+        `wordstreams` is spam.
+
+        `wordstreams` is an iterable of wordstreams, each of which is as
+        described in :meth:`spamprob`. The return value is a list containing,
+        for each wordstream, what :meth:`spamprob` would return for that
+        wordstream with the same value of `evidence`.
+
+        If NumPy is available, the clue probabilities for the whole batch are
+        collected into a padded matrix, and the logarithms of the products
+        and the chi-squared combining are computed for all messages at once.
+        Otherwise this is equivalent to calling :meth:`spamprob` on each
+        wordstream in turn.
+
+        """
+        if not numpy_is_available:
+            return [self.spamprob(w, evidence) for w in wordstreams]
+        allclues = [self._getclues(w) for w in wordstreams]
+        if not allclues:
+            return []
+        probs, S, H = self._combine_many(allclues)
         if evidence:
-            clues = [(w, p) for p, w, _r in clues]
-            clues.sort(key=lambda x: x[1])
-            clues.insert(0, (b'*S*', S))
-            clues.insert(0, (b'*H*', H))
-            return prob, clues
-        return prob
+            return [(prob, self._evidence(clues, s, h))
+                    for prob, clues, s, h in zip(probs, allclues, S, H)]
+        return probs
+
+    def _combine_many(self, allclues):
+        """Vectorized version of :meth:`_combine`.
+
+        `allclues` is a non-empty list of lists as returned by
+        :meth:`_getclues`. The return value is a triple of lists, containing
+        the values of `prob`, `S` and `H` that :meth:`_combine` returns for
+        each list of clues.
+
+        This method requires NumPy.
+
+        """
+        n = numpy.array([len(clues) for clues in allclues])
+        width = int(n.max())
+        mask = numpy.arange(width) < n[:, numpy.newaxis]
+        # Each row is padded with factors of one, whose logarithms are zero.
+        # The rows of a boolean mask are filled in row-major order, which is
+        # the order in which the probabilities are listed here.
+        flat = numpy.fromiter(map(operator.itemgetter(0),
+                                  itertools.chain.from_iterable(allclues)),
+                              dtype=float, count=int(n.sum()))
+        hfactors = numpy.ones((len(allclues), width))
+        hfactors[mask] = flat
+        sfactors = numpy.ones((len(allclues), width))
+        sfactors[mask] = 1.0 - flat
+
+        # The sums of the logarithms are the logarithms of the products
+        # computed by spamprob(), without any risk of underflow.
+        S = numpy.log(sfactors).sum(axis=1)
+        H = numpy.log(hfactors).sum(axis=1)
+        scored = n > 0
+        S = numpy.where(scored, 1 - chi2Q_many(-2 * S, 2 * n), S)
+        H = numpy.where(scored, 1 - chi2Q_many(-2 * H, 2 * n), H)
+        probs = numpy.where(scored, (S - H + 1) / 2, 0.5)
+        return probs.tolist(), S.tolist(), H.tolist()
+
+    def _evidence(self, clues, S, H):
+        """Returns the list of (word, probability) pairs returned by
+        :meth:`spamprob` when evidence is requested.
+
+        `clues` is the list returned by :meth:`_getclues`, and `S` and `H` are
+        the final spam and ham measures.
+
+        """
+        clues = [(w, p) for p, w, _r in clues]
+        clues.sort(key=lambda x: x[1])
+        clues.insert(0, (b'*S*', S))
+        clues.insert(0, (b'*H*', H))
+        return clues
 
     def learn_spam(self, wordstream):
         """Convenience method for ``self.learn(wordstream, True)``."""
@@ -320,10 +794,67 @@ class Classifier:
             wordstream = self._enhance_wordstream(wordstream)
         self._remove_msg(wordstream, is_spam)
 
+    def learn_many(self, messages):
+        """Teach the classifier many messages at once.
+
+        `messages` is an iterable of ``(wordstream, is_spam)`` pairs, each of
+        which is as in :meth:`learn`. The result is the same as calling
+        :meth:`learn` on each pair in turn, but the counts for each word are
+        accumulated first and the database is updated once per distinct word,
+        so this is much faster for large batches, especially when the
+        database is on disk.
+
+        """
+        self._add_msgs(self._count_words(messages))
+
+    def unlearn_many(self, messages):
+        """Un-learns many messages at once.
+
+        `messages` is an iterable of ``(wordstream, is_spam)`` pairs, each of
+        which is as in :meth:`unlearn`. The result is the same as calling
+        :meth:`unlearn` on each pair in turn, except that if the spam or ham
+        count would go negative, :exc:`ValueError` is raised before the
+        database is modified at all.
+
+        """
+        self._remove_msgs(self._count_words(messages))
+
+    def _count_words(self, messages):
+        """Returns a tuple ``(nspam, nham, spamcounts, hamcounts)`` for the
+        specified iterable of ``(wordstream, is_spam)`` pairs.
+
+        `nspam` and `nham` are the number of spam and ham messages, and
+        `spamcounts` and `hamcounts` are :class:`collections.Counter` objects
+        mapping each word to the number of spam and ham messages, respectively,
+        in which it appears.
+
+        """
+        nspam = nham = 0
+        spamcounts = Counter()
+        hamcounts = Counter()
+        for wordstream, is_spam in messages:
+            if self._use_bigrams:
+                wordstream = self._enhance_wordstream(wordstream)
+            if is_spam:
+                nspam += 1
+                spamcounts.update(self._distinct(wordstream))
+            else:
+                nham += 1
+                hamcounts.update(self._distinct(wordstream))
+        return nspam, nham, spamcounts, hamcounts
+
     def _enhance_wordstream(self, wordstream):
         """Add bigrams to the wordstream.
 
-        For example, a b c -> a b "a b" c "b c"
+        For example, a b c a b -> a b c a b "a b" "b c" "c a"
+
+        Each distinct bigram appears once in the result, since training
+        counts each word at most once per message anyway.
+
+        Every unigram is included.  Versions before the bigram path was
+        rewritten dropped the last token of each message, so databases
+        trained by them lack those counts, and the last token of a message
+        may now contribute a clue where it did not before.
 
         Note that these are *token* bigrams, and not *word* bigrams - i.e.
         'synthetic' tokens get bigram'ed, too.
@@ -339,15 +870,12 @@ class Classifier:
         removed, too.
 
         """
-        # For the sake of brevity, create an alias.
-        chain = itertools.chain.from_iterable
-        # Create an iterable of bigrams from `wordstream`.
-        bigrams = zip(wordstream, itertools.islice(wordstream, 1, None))
-        # This string interpolation must match the one in _getclues().
-        to_string = lambda x, y: BIGRAM_FORMAT.format(x, y)
-        # This interleaves the individual strings from `wordstream` with the
-        # string representation of the bigrams.
-        return chain(zip(wordstream, (to_string(x, y) for x, y in bigrams)))
+        tokens = list(wordstream)
+        # Each distinct pair of adjacent tokens is formatted only once.  This
+        # string interpolation must match the one in _getclues().
+        pairs = dict.fromkeys(zip(tokens, itertools.islice(tokens, 1, None)))
+        tokens.extend(BIGRAM_FORMAT.format(x, y) for x, y in pairs)
+        return tokens
 
     def probability(self, record):
         """Computes, stores, and returns the probability that a message is spam
@@ -365,15 +893,26 @@ class Classifier:
 
         spamcount = record.spamcount
         hamcount = record.hamcount
+        nspam = self.nspam
+        nham = self.nham
 
         # Try the cache first
+        if nspam != self._probcache_nspam or nham != self._probcache_nham:
+            self._switch_probcache(nspam, nham)
+        table = self._probcache
+        key = spamcount, hamcount
         try:
-            return self._probcache[spamcount][hamcount]
+            prob = table[key]
         except KeyError:
             pass
+        else:
+            table.move_to_end(key)
+            self._probcache_hits += 1
+            return prob
+        self._probcache_misses += 1
 
-        nham = self.nham or 1
-        nspam = self.nspam or 1
+        nham = nham or 1
+        nspam = nspam or 1
 
         if hamcount > nham:
             raise Exception('Token seen in more ham than ham trained.')
@@ -407,10 +946,9 @@ class Classifier:
         prob = (StimesX + n * prob) / (S + n)
 
         # Update the cache
-        try:
-            self._probcache[spamcount][hamcount] = prob
-        except KeyError:
-            self._probcache[spamcount] = {hamcount: prob}
+        if len(table) >= self._probcache_size:
+            table.popitem(last=False)
+        table[key] = prob
 
         return prob
 
@@ -438,13 +976,15 @@ class Classifier:
     # in a msg, but distorting spamprob doesn't appear a correct way to exploit
     # it.
     def _add_msg(self, wordstream, is_spam):
-        self._probcache = {}    # nuke the prob cache
         if is_spam:
             self.nspam += 1
         else:
             self.nham += 1
+        self.generation += 1
+        track_lastseen = self.track_lastseen
 
-        for word in set(wordstream):
+        words = self._distinct(wordstream)
+        for word in words:
             record = self._wordinfoget(word)
             if record is None:
                 record = self.WordInfoClass()
@@ -454,12 +994,17 @@ class Classifier:
             else:
                 record.hamcount += 1
 
+            if track_lastseen:
+                self._lastseenset(word, self.generation)
             self._wordinfoset(word, record)
 
+        if self.journal is not None:
+            delta = (1, 0) if is_spam else (0, 1)
+            self.journal.record(*delta, deltas=dict.fromkeys(words, delta))
+        self.version += 1
         self._post_training()
 
     def _remove_msg(self, wordstream, is_spam):
-        self._probcache = {}    # nuke the prob cache
         if is_spam:
             if self.nspam <= 0:
                 raise ValueError("spam count would go negative!")
@@ -469,22 +1014,97 @@ class Classifier:
                 raise ValueError("non-spam count would go negative!")
             self.nham -= 1
 
-        for word in set(wordstream):
+        # The words whose counts were actually decremented.
+        changed = []
+        for word in self._distinct(wordstream):
             record = self._wordinfoget(word)
             if record is not None:
                 if is_spam:
                     if record.spamcount > 0:
                         record.spamcount -= 1
+                        changed.append(word)
                 else:
                     if record.hamcount > 0:
                         record.hamcount -= 1
+                        changed.append(word)
+                if record.hamcount == 0 == record.spamcount:
+                    self._wordinfodel(word)
+                    if self.track_lastseen:
+                        self._lastseendel(word)
+                else:
+                    self._wordinfoset(word, record)
+
+        if self.journal is not None:
+            delta = (-1, 0) if is_spam else (0, -1)
+            self.journal.record(*delta, deltas=dict.fromkeys(changed, delta))
+        self.version += 1
+        self._post_training()
+
+    def _add_msgs(self, counts):
+        nspam, nham, spamcounts, hamcounts = counts
+        self.nspam += nspam
+        self.nham += nham
+        self.generation += 1
+        track_lastseen = self.track_lastseen
+
+        for word in spamcounts.keys() | hamcounts.keys():
+            record = self._wordinfoget(word)
+            if record is None:
+                record = self.WordInfoClass()
+            record.spamcount += spamcounts[word]
+            record.hamcount += hamcounts[word]
+            if track_lastseen:
+                self._lastseenset(word, self.generation)
+            self._wordinfoset(word, record)
+
+        if self.journal is not None:
+            self.journal.record(nspam, nham, {
+                word: (spamcounts[word], hamcounts[word])
+                for word in spamcounts.keys() | hamcounts.keys()})
+        self.version += 1
+        self._post_training()
+
+    def _remove_msgs(self, counts):
+        nspam, nham, spamcounts, hamcounts = counts
+        if nspam > self.nspam:
+            raise ValueError("spam count would go negative!")
+        if nham > self.nham:
+            raise ValueError("non-spam count would go negative!")
+        self.nspam -= nspam
+        self.nham -= nham
+
+        deltas = {}
+        for word in spamcounts.keys() | hamcounts.keys():
+            record = self._wordinfoget(word)
+            if record is not None:
+                # As in _remove_msg(), the counts never go below zero.
+                spamdelta = min(record.spamcount, spamcounts[word])
+                hamdelta = min(record.hamcount, hamcounts[word])
+                record.spamcount -= spamdelta
+                record.hamcount -= hamdelta
+                deltas[word] = (-spamdelta, -hamdelta)
                 if record.hamcount == 0 == record.spamcount:
                     self._wordinfodel(word)
+                    if self.track_lastseen:
+                        self._lastseendel(word)
                 else:
                     self._wordinfoset(word, record)
 
+        if self.journal is not None:
+            self.journal.record(-nspam, -nham, deltas)
+        self.version += 1
         self._post_training()
 
+    def _distinct(self, wordstream):
+        """Returns the distinct words of `wordstream` whose counts training
+        should increment or decrement by one.
+
+        Subclasses in which distinct words may share a record can override
+        this to return only one word per record.
+
+        """
+        return set(wordstream)
+
     def _post_training(self):
         """This is called after training on a wordstream.  Subclasses might
         want to ensure that their databases are in a consistent state at
@@ -493,7 +1113,7 @@ class Classifier:
         """
         pass
 
-    def _getclues(self, wordstream):
+    def _getclues(self, wordstream, worddistanceget=None):
         """Return list of (probability, word, record) triples, sorted by
         increasing probability.
 
@@ -506,7 +1126,12 @@ class Classifier:
         in `wordstream`. Tokens with probability less than
         :const:`MINIMUM_PROB_STRENGTH` from 0.5 aren't returned.
 
+        Each token is looked up by calling `worddistanceget`, which defaults
+        to :meth:`_worddistanceget`.
+
         """
+        if worddistanceget is None:
+            worddistanceget = self._worddistanceget
         if self._use_bigrams:
             # This scheme mixes single tokens with pairs of adjacent tokens.
             # wordstream is "tiled" into non-overlapping unigrams and
@@ -515,59 +1140,76 @@ class Classifier:
             # (systematic correlation probably isn't a good thing).
 
             # First fill list raw with
-            #     (distance, prob, word, record), indices
-            # pairs, one for each unigram and bigram in wordstream.
-            # indices is a tuple containing the indices (0-based relative to
-            # the start of wordstream) of the tokens that went into word.
-            # indices is a 1-tuple for an original token, and a 2-tuple for
-            # a synthesized bigram token.  The indices are needed to detect
-            # overlap later.
+            #     (distance, prob, word, record), first, last
+            # triples, one for the first occurrence of each distinct unigram
+            # and bigram in wordstream.  first and last are the indices
+            # (0-based relative to the start of wordstream) of the first and
+            # last tokens that went into word; they are equal for an
+            # original token.  The indices are needed to detect overlap
+            # later.
+            # The index of the first occurrence of each distinct token, and
+            # of the second token of the first occurrence of each distinct
+            # pair of adjacent tokens, is found by building a dictionary from
+            # the positions in reverse, so that the first occurrence is
+            # assigned last.  Each bigram string is then formatted and
+            # looked up only once per message, however often it repeats.
+            tokens = list(wordstream)
+            positions = range(len(tokens) - 1, -1, -1)
+            firsts = dict(zip(reversed(tokens), positions))
+            pairs = list(zip(tokens, itertools.islice(tokens, 1, None)))
+            pairs.reverse()
+            pair_firsts = dict(zip(pairs, positions))
+            # This string interpolation must match the one in
+            # _enhance_wordstream().
+            bigrams = [(BIGRAM_FORMAT.format(x, y), i)
+                       for (x, y), i in pair_firsts.items()]
+            self._prefetch(itertools.chain(
+                firsts, (bigram for bigram, i in bigrams)))
             raw = []
-            pair = None
-            # Keep track of which tokens we've already seen.
-            seen = set()
-            for i, token in enumerate(wordstream):
-                if i:   # not the 1st loop trip, so there is a preceding token
-                    # This string interpolation must match the one in
-                    # _enhance_wordstream().
-                    pair = BIGRAM_FORMAT.format(last_token, token)
-                last_token = token
-                for clue, indices in (token, (i,)), (pair, (i - 1, i)):
-                    if clue not in seen:    # as always, skip duplicates
-                        seen.add(clue)
-                        tup = self._worddistanceget(clue)
-                        if tup[0] >= MINIMUM_PROB_STRENGTH:
-                            raw.append((tup, indices))
+            for token, i in firsts.items():
+                tup = worddistanceget(token)
+                if tup[0] >= MINIMUM_PROB_STRENGTH:
+                    raw.append((tup, i, i))
+            for bigram, i in bigrams:
+                tup = worddistanceget(bigram)
+                if tup[0] >= MINIMUM_PROB_STRENGTH:
+                    raw.append((tup, i - 1, i))
 
             # Sort raw, strongest to weakest spamprob.
             raw.sort(reverse=True)
-            # raw.reverse()
-            # Fill clues with the strongest non-overlapping clues.
+            # Fill clues with the strongest non-overlapping clues.  used[i]
+            # is set once the token at index i has contributed to a clue.
+            # Since only the strongest clues are kept below, the rest need
+            # not be tiled at all.
             clues = []
-            # Keep track of which indices have already contributed to a
-            # clue in clues.
-            seen = set()
-            for tup, indices in raw:
-                overlap = [i for i in indices if i in seen]
-                if not overlap:  # no overlap with anything already in clues
-                    seen.update(indices)
+            used = bytearray(len(tokens))
+            for tup, first, last in raw:
+                if not (used[first] or used[last]):
+                    used[first] = used[last] = 1
                     clues.append(tup)
+                    if len(clues) == MAX_DISCRIMINATORS:
+                        break
             # Leave sorted from smallest to largest spamprob.
             clues.reverse()
 
+        elif self.seen_filter is not None:
+            clues = self._stream_clues(wordstream, worddistanceget)
+
         else:
             # The all-unigram scheme just scores the tokens as-is.  A set()
             # is used to weed out duplicates at high speed.
-            # clues = []
-            # for word in set(wordstream):
-            #     tup = self._worddistanceget(word)
-            #     if tup[0] >= MINIMUM_PROB_STRENGTH:
-            #         clues.append(tup)
-            # clues.sort()
-            clues = sorted(tup for tup in
-                           (self._worddistanceget(word)
-                            for word in set(wordstream))
-                           if tup[0] >= MINIMUM_PROB_STRENGTH)
+            clues = [tup for tup in
+                     (worddistanceget(word) for word in set(wordstream))
+                     if tup[0] >= MINIMUM_PROB_STRENGTH]
+            if len(clues) > HEAP_SELECTION_THRESHOLD:
+                # Only the strongest clues are kept below, so there is no
+                # need to sort all of them.  Since the words are distinct, no
+                # two tuples are equal, and this selects exactly the same
+                # clues in the same order as sorting would.
+                clues = heapq.nlargest(MAX_DISCRIMINATORS, clues)
+                clues.reverse()
+            else:
+                clues.sort()
 
         # If there are too many clues, remove the first few.
         if len(clues) > MAX_DISCRIMINATORS:
@@ -576,6 +1218,45 @@ class Classifier:
         # Return (prob, word, record).
         return [t[1:] for t in clues]
 
+    def _stream_clues(self, wordstream, worddistanceget):
+        """Returns the strongest clues among the unigrams in `wordstream` as a
+        list of ``(distance, prob, word, record)`` tuples sorted from weakest
+        to strongest, consuming `wordstream` one token at a time.
+
+        Only the :const:`MAX_DISCRIMINATORS` strongest candidates so far are
+        kept, in a heap, and the tokens already seen are kept in a filter
+        made by calling :attr:`seen_filter`.
+
+        """
+        seen = self.seen_filter()
+        heap = []
+        for word in wordstream:
+            if word in seen:
+                continue
+            seen.add(word)
+            tup = worddistanceget(word)
+            if tup[0] < MINIMUM_PROB_STRENGTH:
+                continue
+            if len(heap) < MAX_DISCRIMINATORS:
+                heapq.heappush(heap, tup)
+            elif tup > heap[0]:
+                # As in _getclues(), the words are distinct, so this keeps
+                # exactly the clues that sorting all of them would.
+                heapq.heapreplace(heap, tup)
+        heap.sort()
+        return heap
+
+    def _prefetch(self, words):
+        """Called by :meth:`_getclues` with the distinct unigrams and bigrams
+        of a message before they are looked up, when bigrams are used.
+
+        Subclasses whose database is slow to query one word at a time can
+        override this to read the records of all of `words` at once. The
+        default implementation does nothing.
+
+        """
+        pass
+
     def _worddistanceget(self, word):
         record = self._wordinfoget(word)
         if record is None:
@@ -596,3 +1277,52 @@ class Classifier:
 
     def _wordinfokeys(self):
         return self.wordinfo.keys()
+
+    def _iterwordinfokeys(self):
+        """Returns an iterator over the words in the database, which may be
+        modified while it is in use.
+
+        Words added or deleted after the iterator is created may or may not
+        be yielded. Subclasses with large databases on disk can override
+        this to read the words a bounded number at a time; by default they
+        are all listed at once.
+
+        """
+        return iter(list(self._wordinfokeys()))
+
+    # If track_lastseen is true, the generation in which each word was last
+    # learned is recorded through these methods, so that subclasses can keep
+    # it alongside their database.  The generation is set before the word's
+    # record is set, and deleted after its record is deleted.  A word whose
+    # generation is not known is treated as having been learned in
+    # generation 0.
+    def _lastseenget(self, word):
+        return self.lastseen.get(word, 0)
+
+    def _lastseenset(self, word, generation):
+        self.lastseen[word] = generation
+
+    def _lastseendel(self, word):
+        self.lastseen.pop(word, None)
+
+
+class ReadOnlyClassifier(Classifier):
+    """A classifier whose database cannot be modified.
+
+    This is a base class for classifiers that score against a database held
+    somewhere other than in their own :attr:`wordinfo` dictionary. Learning
+    or un-learning raises :exc:`TypeError`.
+
+    """
+
+    def _add_msg(self, wordstream, is_spam):
+        raise TypeError('cannot train a read-only classifier')
+
+    def _remove_msg(self, wordstream, is_spam):
+        raise TypeError('cannot train a read-only classifier')
+
+    def _add_msgs(self, counts):
+        raise TypeError('cannot train a read-only classifier')
+
+    def _remove_msgs(self, counts):
+        raise TypeError('cannot train a read-only classifier')
@@ -0,0 +1,281 @@
+# compact.py - a classifier that stores token counts in arrays
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""A classifier whose token database is stored in compact arrays.
+
+The basic :class:`~sbclassifier.classifiers.basic.Classifier` maps each token
+to its own :class:`~sbclassifier.classifiers.basic.WordInfo` object. Even
+with ``__slots__``, most of the memory used by a database with millions of
+tokens is spent on the overhead of those objects and on the dictionary that
+holds them.
+
+:class:`ArrayWordInfoStore` interns each token to an integer id and keeps
+the spam and ham counts in two growable ``array('I')`` columns indexed by
+that id. The tokens themselves are found through an open-addressing hash
+index which is also an array, so there is no per-token Python object other
+than the token string itself. :class:`CompactClassifier` is a classifier
+which uses such a store in place of the usual dictionary.
+
+"""
+from array import array
+from collections.abc import MutableMapping
+
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.classifiers.basic import PROBCACHE_SIZE
+from sbclassifier.classifiers.basic import USE_BIGRAMS
+
+#: The initial number of slots in the hash index of an empty store. This
+#: must be a power of two.
+INITIAL_INDEX_SIZE = 8
+
+# Markers for the slots of the hash index. All other slots contain one more
+# than the id of the token that hashes there.
+_EMPTY = 0
+_DELETED = -1
+
+
+class WordInfoView:
+    """A lightweight stand-in for a
+    :class:`~sbclassifier.classifiers.basic.WordInfo` object.
+
+    The `spamcount` and `hamcount` attributes of a view read from and write
+    to a single row of the count columns of an :class:`ArrayWordInfoStore`,
+    so modifying the view modifies the store. A view created by calling this
+    class directly is detached from any store and simply owns its counts,
+    exactly as a :class:`~sbclassifier.classifiers.basic.WordInfo` does.
+
+    A view obtained from a store is only valid until its word is deleted
+    from that store.
+
+    """
+
+    __slots__ = '_spamcounts', '_hamcounts', '_id'
+
+    def __init__(self, spamcount=0, hamcount=0):
+        self._spamcounts = array('I', (spamcount, ))
+        self._hamcounts = array('I', (hamcount, ))
+        self._id = 0
+
+    @classmethod
+    def _attach(cls, store, id):
+        """Returns a view of the row of `store` with the specified id."""
+        view = cls.__new__(cls)
+        view._spamcounts = store.spamcounts
+        view._hamcounts = store.hamcounts
+        view._id = id
+        return view
+
+    @property
+    def spamcount(self):
+        return self._spamcounts[self._id]
+
+    @spamcount.setter
+    def spamcount(self, value):
+        self._spamcounts[self._id] = value
+
+    @property
+    def hamcount(self):
+        return self._hamcounts[self._id]
+
+    @hamcount.setter
+    def hamcount(self, value):
+        self._hamcounts[self._id] = value
+
+    def __repr__(self):
+        return 'WordInfoView{!r}'.format(self.__getstate__())
+
+    def __getstate__(self):
+        return self.spamcount, self.hamcount
+
+    def __setstate__(self, t):
+        self.__init__(*t)
+
+
+class ArrayWordInfoStore(MutableMapping):
+    """A mapping from token to :class:`WordInfoView`, backed by arrays.
+
+    Each token is assigned an integer id when it is first stored; ids of
+    deleted tokens are reused. The counts for the token with id ``i`` are
+    ``spamcounts[i]`` and ``hamcounts[i]``.
+
+    Values may be set to any object with `spamcount` and `hamcount`
+    attributes; only the counts are copied into the store. Getting a value
+    returns a :class:`WordInfoView` of the stored counts.
+
+    """
+
+    def __init__(self):
+        #: Maps id to token, or to ``None`` if the id is free.
+        self._tokens = []
+        #: Ids of deleted tokens, available for reuse.
+        self._free = []
+        self.spamcounts = array('I')
+        self.hamcounts = array('I')
+        self._len = 0
+        self._reindex(INITIAL_INDEX_SIZE)
+
+    def __getstate__(self):
+        # Only the live tokens and their counts are saved; the hash index
+        # depends on the hash randomization of the current process, so it
+        # is rebuilt on load.
+        live = [i for i, token in enumerate(self._tokens) if token is not None]
+        return ([self._tokens[i] for i in live],
+                array('I', (self.spamcounts[i] for i in live)),
+                array('I', (self.hamcounts[i] for i in live)))
+
+    def __setstate__(self, t):
+        tokens, spamcounts, hamcounts = t
+        self._tokens = list(tokens)
+        self._free = []
+        self.spamcounts = array('I', spamcounts)
+        self.hamcounts = array('I', hamcounts)
+        self._len = len(self._tokens)
+        size = INITIAL_INDEX_SIZE
+        while 3 * self._len >= 2 * size:
+            size *= 2
+        self._reindex(size)
+
+    def _reindex(self, size):
+        """Rebuilds the hash index with the specified number of slots, which
+        must be a power of two large enough to hold all tokens.
+
+        """
+        self._index = index = array('q', bytes(8 * size))
+        mask = size - 1
+        for i, token in enumerate(self._tokens):
+            if token is None:
+                continue
+            slot = hash(token) & mask
+            while index[slot] != _EMPTY:
+                slot = (slot + 1) & mask
+            index[slot] = i + 1
+        # Number of slots that are not empty, including deleted markers.
+        self._used = self._len
+
+    def _probe(self, word):
+        """Returns a pair ``(slot, id)`` for the specified word.
+
+        If the word is in the store, `slot` is the slot of the hash index
+        that refers to it and `id` is its id. Otherwise, `slot` is the slot
+        into which the word should be inserted and `id` is -1.
+
+        """
+        index = self._index
+        tokens = self._tokens
+        mask = len(index) - 1
+        slot = hash(word) & mask
+        insert_at = None
+        while True:
+            entry = index[slot]
+            if entry == _EMPTY:
+                return (slot if insert_at is None else insert_at), -1
+            if entry == _DELETED:
+                if insert_at is None:
+                    insert_at = slot
+            elif tokens[entry - 1] == word:
+                return slot, entry - 1
+            slot = (slot + 1) & mask
+
+    def id(self, word):
+        """Returns the id of the specified word, or -1 if the word is not in
+        this store.
+
+        """
+        return self._probe(word)[1]
+
+    def get(self, word, default=None):
+        id = self._probe(word)[1]
+        if id < 0:
+            return default
+        return WordInfoView._attach(self, id)
+
+    def __getitem__(self, word):
+        id = self._probe(word)[1]
+        if id < 0:
+            raise KeyError(word)
+        return WordInfoView._attach(self, id)
+
+    def __setitem__(self, word, record):
+        self.set_counts(word, record.spamcount, record.hamcount)
+
+    def set_counts(self, word, spamcount, hamcount):
+        """Sets the counts of the specified word, adding the word to this
+        store if necessary.
+
+        """
+        slot, id = self._probe(word)
+        if id < 0:
+            if self._free:
+                id = self._free.pop()
+                self._tokens[id] = word
+            else:
+                id = len(self._tokens)
+                self._tokens.append(word)
+                self.spamcounts.append(0)
+                self.hamcounts.append(0)
+            if self._index[slot] == _EMPTY:
+                self._used += 1
+            self._index[slot] = id + 1
+            self._len += 1
+            if 3 * self._used >= 2 * len(self._index):
+                size = len(self._index)
+                while 3 * self._len >= size:
+                    size *= 2
+                self._reindex(size)
+        self.spamcounts[id] = spamcount
+        self.hamcounts[id] = hamcount
+
+    def __delitem__(self, word):
+        slot, id = self._probe(word)
+        if id < 0:
+            raise KeyError(word)
+        self._index[slot] = _DELETED
+        self._tokens[id] = None
+        self.spamcounts[id] = 0
+        self.hamcounts[id] = 0
+        self._free.append(id)
+        self._len -= 1
+
+    def __contains__(self, word):
+        return self._probe(word)[1] >= 0
+
+    def __iter__(self):
+        return (token for token in self._tokens if token is not None)
+
+    def __len__(self):
+        return self._len
+
+
+class CompactClassifier(Classifier):
+    """A classifier that keeps its token database in an
+    :class:`ArrayWordInfoStore` instead of a dictionary of
+    :class:`~sbclassifier.classifiers.basic.WordInfo` objects.
+
+    This classifier scores and trains exactly as the basic classifier does,
+    but uses a fraction of the memory for large databases. The records it
+    hands out are :class:`WordInfoView` objects.
+
+    """
+
+    WordInfoClass = WordInfoView
+
+    def __init__(self, use_bigrams=USE_BIGRAMS,
+                 probcache_size=PROBCACHE_SIZE):
+        super().__init__(use_bigrams, probcache_size)
+        self.wordinfo = ArrayWordInfoStore()
+
+    def _wordinfoget(self, word):
+        return self.wordinfo.get(word)
+
+    def _wordinfoset(self, word, record):
+        self.wordinfo.set_counts(word, record.spamcount, record.hamcount)
+
+    def _wordinfodel(self, word):
+        del self.wordinfo[word]
+
+    def _wordinfokeys(self):
+        return list(self.wordinfo)
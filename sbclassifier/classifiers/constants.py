@@ -25,3 +25,10 @@ SPAM_CUTOFF = 0.9
 #: ham_cutoff=0.30 and spam_cutoff=0.80 across three test data sets (original
 #: c.l.p data, his own email, and newer general python.org traffic).
 #USE_CHI_SQUARED_COMBINING = True
+
+#: The classifications returned by :meth:`Classifier.classify`.  A message is
+#: ham if its spam probability is at most HAM_CUTOFF, spam if it is at least
+#: SPAM_CUTOFF, and unsure otherwise.
+HAM = 'ham'
+SPAM = 'spam'
+UNSURE = 'unsure'
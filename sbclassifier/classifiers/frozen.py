@@ -0,0 +1,79 @@
+# frozen.py - a read-only classifier database in a memory-mapped file
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Exporting a trained classifier to a file which is scored against in place.
+
+Loading a :class:`~sbclassifier.classifiers.storage.PickleClassifier`
+unpickles its whole database, which for a large database takes seconds and
+much memory in every process that does it. When a classifier is trained in
+one place and only used for scoring elsewhere, :func:`export` writes its
+database to a file in the packed format (see
+:mod:`sbclassifier.classifiers.packed`), and :class:`FrozenClassifier` maps
+that file into memory and looks tokens up directly in the mapping. Opening
+a frozen classifier reads only its header, so it takes the same time however
+large the database is, and since the mapping is read-only, every process on
+a host which opens the same file shares the same pages of the page cache.
+
+"""
+import mmap
+
+from lockfile import FileLock
+
+from sbclassifier.classifiers.basic import USE_BIGRAMS
+from sbclassifier.classifiers.packed import pack
+from sbclassifier.classifiers.packed import PackedClassifier
+from sbclassifier.safepickle import atomic_open
+from sbclassifier.safepickle import DEFAULT_TIMEOUT
+from sbclassifier.safepickle import remove_stale_files
+
+
+def export(classifier, filename):
+    """Writes the database of `classifier` to the file named `filename`, in
+    the packed format.
+
+    The database is written to a temporary file which then replaces
+    `filename`, so a process which opens `filename` sees either the old
+    database or the new one in full, and a process which already has the
+    old one open keeps using it until it is closed. As in
+    :func:`~sbclassifier.safepickle.pickle_write`, the file is locked while
+    it is written, so concurrent exports of the same file are serialized.
+
+    """
+    data = pack(classifier)
+    with FileLock(filename, timeout=DEFAULT_TIMEOUT):
+        remove_stale_files(filename)
+        with atomic_open(filename) as f:
+            f.write(data)
+
+
+class FrozenClassifier(PackedClassifier):
+    """A read-only classifier that scores against a database written by
+    :func:`export`.
+
+    `filename` is the name of the file. `use_bigrams` should be the same as
+    for the exported classifier. The results of :meth:`spamprob` are
+    identical to those of the exported classifier at the time it was
+    exported.
+
+    Call :meth:`close` to unmap the file.
+
+    """
+
+    def __init__(self, filename, use_bigrams=USE_BIGRAMS):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            super().__init__(self._mmap, use_bigrams)
+        except Exception:
+            self._mmap.close()
+            raise
+
+    def close(self):
+        """Unmaps the file."""
+        self.wordinfo.release()
+        self._mmap.close()
@@ -0,0 +1,186 @@
+# hashing.py - a classifier that hashes tokens into a fixed number of buckets
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""A classifier whose memory use is fixed when it is created.
+
+The token database of the basic
+:class:`~sbclassifier.classifiers.basic.Classifier` grows with every new
+token it is trained on, and a stream of spam full of random strings can make
+it grow without bound. :class:`HashingClassifier` instead uses the "hashing
+trick": each token is mapped by a stable hash function to one of a fixed
+number of buckets, and only the spam and ham counts of each bucket are kept,
+in two ``array('I')`` columns. The database therefore takes eight bytes per
+bucket no matter how many tokens are trained, and the tokens themselves are
+not stored at all.
+
+The price is that tokens which hash to the same bucket share their counts,
+so a rare token may be scored with the counts of a common one. With enough
+buckets such collisions are rare among the tokens that matter;
+benchmarks/bench_hashing.py measures the error rates of this classifier on a
+synthetic corpus for several numbers of buckets, compared with those of the
+basic classifier. On that corpus, with 2000 training messages of each
+class and about 430,000 distinct tokens, no message was misclassified, but
+the fraction of messages scored as unsure grew as the number of buckets
+shrank:
+
+=========  ==========  ======
+buckets    memory      unsure
+=========  ==========  ======
+(basic)    21.6 MB     2.6%
+2 ** 22    33.6 MB     3.5%
+2 ** 20    8.4 MB      6.6%
+2 ** 18    2.1 MB      26.0%
+2 ** 16    0.5 MB      94.9%
+=========  ==========  ======
+
+The memory of a hashing classifier is that of its counts, eight bytes per
+bucket. The memory of the basic classifier, as measured by the benchmark,
+does not include the token strings, which the benchmark shares with its
+corpus; in real use they roughly double it. A good rule of thumb is to use
+at least as many buckets as the number of distinct tokens expected in the
+database.
+
+Scoring works on the original tokens, so the evidence returned by
+:meth:`~sbclassifier.classifiers.basic.Classifier.spamprob` names the tokens
+of the message, not bucket numbers.
+
+"""
+from array import array
+
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.classifiers.basic import PROBCACHE_SIZE
+from sbclassifier.classifiers.basic import USE_BIGRAMS
+from sbclassifier.classifiers.compact import WordInfoView
+from sbclassifier.classifiers.packed import encode_token
+from sbclassifier.classifiers.packed import token_hash
+
+#: The default number of buckets, which uses eight megabytes.
+DEFAULT_NBUCKETS = 2 ** 20
+
+
+def bucket(word, nbuckets):
+    """Returns the number of the bucket, out of `nbuckets`, for the specified
+    token.
+
+    The result is the same in every process, so a hashed database can be
+    saved and loaded again.
+
+    """
+    return token_hash(*encode_token(word)) % nbuckets
+
+
+class BucketStore:
+    """The spam and ham counts of a fixed number of buckets.
+
+    The counts for bucket ``i`` are ``spamcounts[i]`` and ``hamcounts[i]``;
+    a :class:`~sbclassifier.classifiers.compact.WordInfoView` of them is
+    returned by :meth:`get`.
+
+    """
+
+    def __init__(self, nbuckets=DEFAULT_NBUCKETS):
+        if nbuckets < 1:
+            raise ValueError('the number of buckets must be positive')
+        self.nbuckets = nbuckets
+        self.spamcounts = array('I', bytes(4 * nbuckets))
+        self.hamcounts = array('I', bytes(4 * nbuckets))
+
+    def __getstate__(self):
+        return self.nbuckets, self.spamcounts, self.hamcounts
+
+    def __setstate__(self, t):
+        self.nbuckets, self.spamcounts, self.hamcounts = t
+
+    def __len__(self):
+        """Returns the number of buckets with a nonzero count."""
+        return sum(1 for spamcount, hamcount in zip(self.spamcounts,
+                                                    self.hamcounts)
+                   if spamcount or hamcount)
+
+    @property
+    def size(self):
+        """The number of bytes used by the counts."""
+        return (self.spamcounts.itemsize * len(self.spamcounts) +
+                self.hamcounts.itemsize * len(self.hamcounts))
+
+    def get(self, i):
+        """Returns a view of the counts of bucket `i`, or ``None`` if both are
+        zero.
+
+        """
+        if self.spamcounts[i] == 0 == self.hamcounts[i]:
+            return None
+        return WordInfoView._attach(self, i)
+
+    def set_counts(self, i, spamcount, hamcount):
+        """Sets the counts of bucket `i`."""
+        self.spamcounts[i] = spamcount
+        self.hamcounts[i] = hamcount
+
+
+class HashingClassifier(Classifier):
+    """A classifier that keeps the counts of each token in one of `nbuckets`
+    buckets, chosen by hashing the token.
+
+    The memory used by the database is fixed when the classifier is created,
+    at about eight bytes per bucket. Otherwise this classifier scores and
+    trains as the basic classifier does, except that tokens hashing to the
+    same bucket are counted together; a message in which several tokens
+    share a bucket increments that bucket only once.
+
+    Since the tokens are not stored, listing them is not supported:
+    :meth:`_wordinfokeys` raises :exc:`TypeError`, the database
+    cannot be pruned or converted back into an ordinary one, and the
+    generation in which each token was last learned is not recorded.
+
+    """
+
+    WordInfoClass = WordInfoView
+
+    # The buckets do not record which tokens they count.
+    stores_words = False
+
+    def __init__(self, nbuckets=DEFAULT_NBUCKETS, use_bigrams=USE_BIGRAMS,
+                 probcache_size=PROBCACHE_SIZE):
+        super().__init__(use_bigrams, probcache_size)
+        self.wordinfo = BucketStore(nbuckets)
+
+    @property
+    def nbuckets(self):
+        return self.wordinfo.nbuckets
+
+    def _bucket(self, word):
+        return bucket(word, self.wordinfo.nbuckets)
+
+    def _distinct(self, wordstream):
+        buckets = {}
+        for word in wordstream:
+            buckets.setdefault(self._bucket(word), word)
+        return buckets.values()
+
+    def _wordinfoget(self, word):
+        return self.wordinfo.get(self._bucket(word))
+
+    def _wordinfoset(self, word, record):
+        self.wordinfo.set_counts(self._bucket(word), record.spamcount,
+                                 record.hamcount)
+
+    def _wordinfodel(self, word):
+        self.wordinfo.set_counts(self._bucket(word), 0, 0)
+
+    def _wordinfokeys(self):
+        raise TypeError('cannot list the tokens of a hashing classifier,'
+                        ' which does not store them')
+
+    def _lastseenget(self, word):
+        return 0
+
+    def _lastseenset(self, word, generation):
+        pass
+
+    def _lastseendel(self, word):
+        pass
@@ -0,0 +1,145 @@
+# journal.py - append-only journals of pickled records in segment files
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Append-only journals of pickled records, kept in numbered segment files.
+
+A :class:`Journal` appends records to the last of a sequence of segment
+files, each of which holds a sequence of length-prefixed pickled records.
+The journal of changes followed by the replicas of
+:mod:`sbclassifier.classifiers.replication` and the journal of a
+:class:`~sbclassifier.classifiers.storage.JournaledPickleClassifier` are
+both kept this way.
+
+A record is appended only once the one before it has been written, so if
+the process writing a journal crashes, only the last record of the last
+segment can be incomplete; :func:`read_records` stops before it, and
+:meth:`Journal.resume` discards it.
+
+"""
+import os
+import pickle
+import struct
+
+#: The length of the pickled record that follows.
+RECORD_HEADER = struct.Struct('=I')
+
+
+def numbered_files(directory, pattern):
+    """Returns a sorted list of ``(number, filename)`` pairs for the files in
+    `directory` whose names match the compiled regular expression `pattern`,
+    whose first group is the number.
+
+    """
+    result = []
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match is not None:
+            result.append((int(match.group(1)), os.path.join(directory, name)))
+    result.sort()
+    return result
+
+
+def read_records(f):
+    """Yields ``(offset, record)`` pairs for the complete records in the
+    file `f`, starting at its current position, where `offset` is the
+    position just after the record.
+
+    A record that has not been completely written yet ends the sequence.
+
+    """
+    while True:
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        size, = RECORD_HEADER.unpack(header)
+        data = f.read(size)
+        if len(data) < size:
+            return
+        yield f.tell(), pickle.loads(data)
+
+
+class Journal:
+    """A journal kept in segment files in `directory`.
+
+    The name of each segment is `name_format` formatted with its number, and
+    matches the compiled regular expression `pattern`, whose first group is
+    the number. :attr:`number` is the number of the segment being appended
+    to, or ``None`` until :meth:`resume` or :meth:`start_segment` opens one.
+
+    If `fsync` is true, every record is forced to disk as it is written;
+    otherwise, records are only flushed to the operating system.
+
+    """
+
+    def __init__(self, directory, name_format, pattern, fsync=False):
+        self.directory = directory
+        self.name_format = name_format
+        self.pattern = pattern
+        self.fsync = fsync
+        self.number = None
+        self._file = None
+
+    def segments(self):
+        """Returns a sorted list of ``(number, filename)`` pairs for the
+        segments.
+
+        """
+        return numbered_files(self.directory, self.pattern)
+
+    def resume(self):
+        """Opens the last segment for appending, after discarding any
+        incomplete record at its end, and returns a list of the records in
+        it, which is empty if there are no segments.
+
+        """
+        segments = self.segments()
+        if not segments:
+            return []
+        self.close()
+        self.number, filename = segments[-1]
+        records = []
+        end = 0
+        with open(filename, 'rb') as f:
+            for end, record in read_records(f):
+                records.append(record)
+        self._file = open(filename, 'r+b')
+        self._file.truncate(end)
+        self._file.seek(end)
+        return records
+
+    def start_segment(self, number):
+        """Closes the segment being appended to, if any, and starts
+        appending to a new segment numbered `number`.
+
+        """
+        self.close()
+        self.number = number
+        self._file = open(os.path.join(self.directory,
+                                       self.name_format.format(number)), 'ab')
+
+    def append(self, record):
+        """Appends `record` to the segment being appended to, and returns the
+        size of that segment.
+
+        """
+        data = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        self._file.write(RECORD_HEADER.pack(len(data)) + data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def remove_segments(self, last):
+        """Deletes the segments numbered `last` or lower."""
+        for number, filename in self.segments():
+            if number <= last:
+                os.remove(filename)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
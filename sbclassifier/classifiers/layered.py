@@ -0,0 +1,153 @@
+# layered.py - a per-user classifier layered over a shared one
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""A classifier for one user of a system that serves many.
+
+When many mailboxes are filtered by one system, most of the vocabulary of
+each mailbox is shared with the others. :class:`LayeredClassifier` lets each
+mailbox use a single shared base classifier, trained on mail common to all
+of them, together with a small layer of its own containing only the changes
+made by that mailbox's own training. The base is never modified, so it may
+be a read-only classifier such as a
+:class:`~sbclassifier.classifiers.packed.PackedClassifier` in shared memory,
+and the memory used by each layer is proportional only to its own training,
+apart from a small cache of word probabilities of bounded size.
+
+"""
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.classifiers.basic import PICKLE_VERSION
+
+#: The default maximum number of entries in the cache of word probabilities
+#: kept by each layer.  This is enough for the distinct counts of the clues
+#: of a message, and a full cache uses about 50 kilobytes.
+LAYER_PROBCACHE_SIZE = 512
+
+
+class LayeredClassifier(Classifier):
+    """A classifier which combines a shared `base` classifier with training
+    of its own.
+
+    The counts for each word are the sums of the counts in `base` and in
+    this classifier's own layer, and so are :attr:`nspam` and :attr:`nham`.
+    Training modifies only the layer, which holds the difference between
+    the combined counts and those of `base`, in :attr:`wordinfo`,
+    :attr:`own_nspam`, and :attr:`own_nham`. A layer may therefore hold
+    negative counts, if a message is un-learned which was trained into the
+    base.
+
+    `base` may be any classifier. It must not be trained while it is in use
+    as a base, but it may be replaced by assigning a new classifier to the
+    :attr:`base` attribute; the layer is then applied to the new base.
+    Where the layer un-learned more than the new base holds, the combined
+    counts are clamped at zero. `use_bigrams` defaults to that of `base`.
+
+    Only the layer is pickled. To restore a pickled layer, call
+    :meth:`__setstate__` on a new instance created with the desired base.
+
+    Besides the counts in its layer, each instance keeps a cache of word
+    probabilities of at most `probcache_size` entries. Since the combined
+    message totals differ from one layer to the next, the cache cannot be
+    shared, so only the table for the current totals is kept, and the
+    default size is small; see :const:`LAYER_PROBCACHE_SIZE`.
+
+    """
+
+    # Keep only the table for the current totals; see above.
+    probcache_tables = 1
+
+    def __init__(self, base, use_bigrams=None,
+                 probcache_size=LAYER_PROBCACHE_SIZE):
+        if use_bigrams is None:
+            use_bigrams = base._use_bigrams
+        self.base = base
+        super().__init__(use_bigrams, probcache_size)
+        # The base class initialized nspam and nham to zero through the
+        # setters below, which is not the same as an empty layer.
+        self.own_nspam = 0
+        self.own_nham = 0
+
+    @property
+    def base(self):
+        return self._base
+
+    @base.setter
+    def base(self, base):
+        self._base = base
+        # The combined counts are all different now.
+        self.version += 1
+
+    def __getstate__(self):
+        return (PICKLE_VERSION, self.wordinfo, self.own_nspam, self.own_nham,
+                self.generation, self.lastseen)
+
+    def __setstate__(self, t):
+        super().__setstate__(t)
+        # The state holds the counts of the layer only.
+        self.own_nspam, self.own_nham = t[2:4]
+
+    @property
+    def nspam(self):
+        return max(self.base.nspam + self.own_nspam, 0)
+
+    @nspam.setter
+    def nspam(self, value):
+        self.own_nspam = value - self.base.nspam
+
+    @property
+    def nham(self):
+        return max(self.base.nham + self.own_nham, 0)
+
+    @nham.setter
+    def nham(self, value):
+        self.own_nham = value - self.base.nham
+
+    def _wordinfoget(self, word):
+        own = self.wordinfo.get(word)
+        base = self.base._wordinfoget(word)
+        if own is None:
+            if base is None:
+                return None
+            # Always return a new record, since training modifies records in
+            # place and the base must not be modified.
+            return self.WordInfoClass(base.spamcount, base.hamcount)
+        spamcount, hamcount = own.spamcount, own.hamcount
+        if base is not None:
+            spamcount += base.spamcount
+            hamcount += base.hamcount
+        # The layer may have un-learned more than the base holds, if the
+        # base was replaced since.
+        spamcount = max(spamcount, 0)
+        hamcount = max(hamcount, 0)
+        if spamcount == 0 == hamcount:
+            # The layer cancels out the base.
+            return None
+        return self.WordInfoClass(spamcount, hamcount)
+
+    def _wordinfoset(self, word, record):
+        base = self.base._wordinfoget(word)
+        if base is None:
+            self.wordinfo[word] = record
+            return
+        own = self.WordInfoClass(record.spamcount - base.spamcount,
+                                 record.hamcount - base.hamcount)
+        if own.spamcount == 0 == own.hamcount:
+            self.wordinfo.pop(word, None)
+        else:
+            self.wordinfo[word] = own
+
+    def _wordinfodel(self, word):
+        base = self.base._wordinfoget(word)
+        if base is None:
+            del self.wordinfo[word]
+        else:
+            self.wordinfo[word] = self.WordInfoClass(-base.spamcount,
+                                                     -base.hamcount)
+
+    def _wordinfokeys(self):
+        keys = set(self.base._wordinfokeys())
+        keys.update(self.wordinfo)
+        return [word for word in keys if self._wordinfoget(word) is not None]
@@ -0,0 +1,250 @@
+# packed.py - a read-only classifier database packed into a flat buffer
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""A binary format for a trained token database, which can be used in place
+without unpacking.
+
+:func:`pack` converts the database of a trained classifier into a single
+block of bytes, and :class:`PackedClassifier` scores messages by looking
+tokens up directly in such a block. Since the block contains no Python
+objects and no pointers, it can be placed in shared memory or in a
+memory-mapped file and used by many processes at once without being copied.
+
+The block consists of a header followed by these sections, each starting at
+a multiple of eight bytes and stored in the native byte order:
+
+* the hash index, an open-addressing table of ``nslots`` 64-bit entries,
+  each of which is zero or one more than the number of a token;
+* the 64-bit hash of each token;
+* the offset of each token in the string table (one more than the number of
+  tokens, so that the last token also has an end);
+* the 32-bit spam count of each token;
+* the 32-bit ham count of each token;
+* one byte per token which is ``1`` if the token was a :class:`str` and ``0``
+  if it was :class:`bytes`;
+* the string table, which contains all the tokens, encoded as UTF-8.
+
+The hash of a token is computed with BLAKE2 rather than :func:`hash`, whose
+values differ from one process to the next.
+
+"""
+from array import array
+import hashlib
+import struct
+
+from sbclassifier.classifiers.basic import ReadOnlyClassifier
+from sbclassifier.classifiers.basic import USE_BIGRAMS
+
+#: Identifies a packed token database, and the version of its format.
+MAGIC = b'SBPACK01'
+
+#: The header: the magic string, the number of spam and ham messages
+#: trained, the number of tokens, the number of slots in the hash index, and
+#: the size of the string table.
+HEADER = struct.Struct('=8sQQQQQ')
+
+# The kinds of token, as stored in the packed database.
+_BYTES = 0
+_STR = 1
+
+
+def _align(n):
+    """Returns the smallest multiple of eight that is at least `n`."""
+    return (n + 7) & ~7
+
+
+def token_hash(kind, data):
+    """Returns the 64-bit hash of a token of the specified kind whose encoded
+    value is `data`.
+
+    """
+    digest = hashlib.blake2b(data, digest_size=8, person=bytes((kind, )))
+    return int.from_bytes(digest.digest(), 'little')
+
+
+def encode_token(word):
+    """Returns a pair ``(kind, data)`` for the specified token."""
+    if isinstance(word, str):
+        return _STR, word.encode('utf-8')
+    return _BYTES, bytes(word)
+
+
+def pack(classifier):
+    """Returns a :class:`bytearray` containing the database of `classifier`
+    in the packed format.
+
+    `classifier` may be any classifier; its database is read through its
+    :meth:`_wordinfokeys` and :meth:`_wordinfoget` methods.
+
+    """
+    entries = []
+    for word in classifier._wordinfokeys():
+        record = classifier._wordinfoget(word)
+        kind, data = encode_token(word)
+        entries.append((token_hash(kind, data), kind, data,
+                        record.spamcount, record.hamcount))
+    # Sorting makes the output depend only on the contents of the database.
+    entries.sort()
+    ntokens = len(entries)
+    nslots = 8
+    while nslots < 2 * ntokens:
+        nslots *= 2
+
+    slots = array('q', bytes(8 * nslots))
+    mask = nslots - 1
+    offsets = array('Q', [0])
+    strings = bytearray()
+    for i, (h, kind, data, spamcount, hamcount) in enumerate(entries):
+        slot = h & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = i + 1
+        strings += data
+        offsets.append(len(strings))
+
+    sections = [slots,
+                array('Q', (e[0] for e in entries)),
+                offsets,
+                array('I', (e[3] for e in entries)),
+                array('I', (e[4] for e in entries)),
+                array('B', (e[1] for e in entries)),
+                strings]
+    result = bytearray(HEADER.pack(MAGIC, classifier.nspam, classifier.nham,
+                                   ntokens, nslots, len(strings)))
+    for section in sections:
+        result += section
+        result += bytes(_align(len(result)) - len(result))
+    return result
+
+
+class PackedWordInfo:
+    """A read-only mapping from token to ``(spamcount, hamcount)`` pairs,
+    backed by a buffer containing a database in the packed format.
+
+    `buf` is any object supporting the buffer protocol, such as
+    :class:`bytes`, a :class:`mmap.mmap`, or the ``buf`` attribute of a
+    :class:`multiprocessing.shared_memory.SharedMemory`. The buffer is not
+    copied, and must not be modified or closed while this object is in use.
+
+    """
+
+    def __init__(self, buf):
+        view = memoryview(buf).cast('B')
+        if len(view) < HEADER.size:
+            view.release()
+            raise ValueError('not a packed token database')
+        magic, nspam, nham, ntokens, nslots, nbytes = \
+            HEADER.unpack_from(view)
+        if magic != MAGIC:
+            view.release()
+            raise ValueError('not a packed token database')
+        # The sections, in order, as (format, item size, number of items).
+        layout = (('q', 8, nslots), ('Q', 8, ntokens), ('Q', 8, ntokens + 1),
+                  ('I', 4, ntokens), ('I', 4, ntokens), ('B', 1, ntokens),
+                  ('B', 1, nbytes))
+        offset = _align(HEADER.size)
+        sections = []
+        for format, itemsize, count in layout:
+            sections.append((format, offset, itemsize * count))
+            offset = _align(offset + itemsize * count)
+        if len(view) < offset:
+            view.release()
+            raise ValueError('truncated packed token database')
+        self.nspam = nspam
+        self.nham = nham
+        self._ntokens = ntokens
+        self._view = view
+        (self._slots, self._hashes, self._offsets, self._spamcounts,
+         self._hamcounts, self._kinds, self._strings) = \
+            [view[start:start + size].cast(format)
+             for format, start, size in sections]
+        #: The number of bytes of the buffer used by the database.
+        self.size = offset
+
+    def release(self):
+        """Releases the views of the underlying buffer, which must be done
+        before a memory map or shared memory block can be closed.
+
+        """
+        for name in ('_slots', '_hashes', '_offsets', '_spamcounts',
+                     '_hamcounts', '_kinds', '_strings', '_view'):
+            getattr(self, name).release()
+
+    def _find(self, word):
+        """Returns the number of the specified token, or -1 if it is not in
+        the database.
+
+        """
+        kind, data = encode_token(word)
+        h = token_hash(kind, data)
+        slots = self._slots
+        mask = len(slots) - 1
+        slot = h & mask
+        while True:
+            entry = slots[slot]
+            if not entry:
+                return -1
+            i = entry - 1
+            if (self._hashes[i] == h and self._kinds[i] == kind and
+                    self._strings[self._offsets[i]:self._offsets[i + 1]]
+                    == data):
+                return i
+            slot = (slot + 1) & mask
+
+    def _token(self, i):
+        data = bytes(self._strings[self._offsets[i]:self._offsets[i + 1]])
+        return data.decode('utf-8') if self._kinds[i] == _STR else data
+
+    def get(self, word, default=None):
+        i = self._find(word)
+        if i < 0:
+            return default
+        return self._spamcounts[i], self._hamcounts[i]
+
+    def __getitem__(self, word):
+        counts = self.get(word)
+        if counts is None:
+            raise KeyError(word)
+        return counts
+
+    def __contains__(self, word):
+        return self._find(word) >= 0
+
+    def __iter__(self):
+        return (self._token(i) for i in range(self._ntokens))
+
+    def __len__(self):
+        return self._ntokens
+
+    def keys(self):
+        return list(self)
+
+
+class PackedClassifier(ReadOnlyClassifier):
+    """A read-only classifier that scores against a database in the packed
+    format.
+
+    `buf` is as in :class:`PackedWordInfo`. The number of spam and ham
+    messages trained is read from the buffer. `use_bigrams` should be the
+    same as for the classifier from which the database was packed.
+
+    """
+
+    def __init__(self, buf, use_bigrams=USE_BIGRAMS):
+        super().__init__(use_bigrams)
+        self.wordinfo = PackedWordInfo(buf)
+        self.nspam = self.wordinfo.nspam
+        self.nham = self.wordinfo.nham
+
+    def _wordinfoget(self, word):
+        counts = self.wordinfo.get(word)
+        if counts is None:
+            return None
+        return self.WordInfoClass(*counts)
+
+    def _wordinfokeys(self):
+        return self.wordinfo.keys()
@@ -0,0 +1,130 @@
+# partial.py - mergeable counts from training on part of a corpus
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Training in parallel on separate parts of a corpus.
+
+A :class:`PartialModel` holds the counts that training on some messages
+would add to a classifier: the number of spam and ham messages, and for
+each token the number of spam and ham messages in which it appears. Partial
+models can be computed independently, in separate processes or on separate
+machines, for disjoint shards of a corpus; they are picklable, and merging
+them is associative and commutative, so they can be combined in any order
+or grouping. The result can then be applied to any classifier, including
+any of the stored classifiers, which then has exactly the counts it would
+have had it learned every message itself with
+:meth:`~sbclassifier.classifiers.basic.Classifier.learn_many`.
+
+"""
+from collections import Counter
+
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.classifiers.basic import USE_BIGRAMS
+from sbclassifier.safepickle import pickle_read
+from sbclassifier.safepickle import pickle_write
+
+
+class PartialModel:
+    """The counts obtained by training on some messages.
+
+    :attr:`nspam` and :attr:`nham` are the numbers of spam and ham
+    messages, and :attr:`spamcounts` and :attr:`hamcounts` are
+    :class:`collections.Counter` objects mapping each token to the number
+    of spam and ham messages, respectively, in which it appears.
+
+    Partial models which are to be merged or applied to the same classifier
+    must be computed with the same value of `use_bigrams` as that
+    classifier.
+
+    """
+
+    def __init__(self, nspam=0, nham=0, spamcounts=None, hamcounts=None):
+        self.nspam = nspam
+        self.nham = nham
+        self.spamcounts = Counter() if spamcounts is None else spamcounts
+        self.hamcounts = Counter() if hamcounts is None else hamcounts
+
+    @classmethod
+    def from_messages(cls, messages, use_bigrams=USE_BIGRAMS):
+        """Returns the partial model for the specified iterable of
+        ``(wordstream, is_spam)`` pairs, as they would be learned by
+        :meth:`Classifier.learn_many`.
+
+        """
+        return cls(*Classifier(use_bigrams)._count_words(messages))
+
+    @classmethod
+    def load(cls, filename):
+        """Returns the partial model saved by :meth:`save` in the specified
+        file.
+
+        """
+        model = pickle_read(filename)
+        if not isinstance(model, cls):
+            raise ValueError('{} does not contain a partial'
+                             ' model'.format(filename))
+        return model
+
+    def save(self, filename):
+        """Saves this partial model in the specified file."""
+        pickle_write(filename, self)
+
+    def __repr__(self):
+        return '<PartialModel: {} spam, {} ham, {} tokens>'.format(
+            self.nspam, self.nham, len(self.spamcounts.keys() |
+                                       self.hamcounts.keys()))
+
+    def __eq__(self, other):
+        if not isinstance(other, PartialModel):
+            return NotImplemented
+        return ((self.nspam, self.nham, self.spamcounts, self.hamcounts) ==
+                (other.nspam, other.nham, other.spamcounts, other.hamcounts))
+
+    def __add__(self, other):
+        if not isinstance(other, PartialModel):
+            return NotImplemented
+        result = PartialModel(self.nspam, self.nham, self.spamcounts.copy(),
+                              self.hamcounts.copy())
+        result.update(other)
+        return result
+
+    def update(self, other):
+        """Adds the counts of the partial model `other` to this one."""
+        self.nspam += other.nspam
+        self.nham += other.nham
+        self.spamcounts.update(other.spamcounts)
+        self.hamcounts.update(other.hamcounts)
+
+    def apply(self, classifier):
+        """Adds these counts to the database of `classifier`, exactly as if
+        it had learned the messages from which they were computed.
+
+        As with training, call the ``store`` method of a stored classifier
+        afterwards to save the result.
+
+        """
+        classifier._add_msgs(self._counts())
+
+    def unapply(self, classifier):
+        """Removes these counts from the database of `classifier`, as if it
+        had un-learned the messages from which they were computed.
+
+        """
+        classifier._remove_msgs(self._counts())
+
+    def _counts(self):
+        return self.nspam, self.nham, self.spamcounts, self.hamcounts
+
+
+def merge(models):
+    """Returns a new partial model containing the sum of the counts of all
+    of the partial models in the iterable `models`.
+
+    """
+    result = PartialModel()
+    for model in models:
+        result.update(model)
+    return result
@@ -0,0 +1,272 @@
+# pruning.py - removing useless tokens from a classifier's database
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Incremental pruning of tokens which are unlikely to matter.
+
+After years of training, most of a token database consists of hapaxes,
+tokens which appeared in only one message. They take up memory and disk
+space but are seldom strong enough to be among the
+:const:`~sbclassifier.classifiers.basic.MAX_DISCRIMINATORS` clues used to
+score a message.
+
+Every classifier counts its training generations (calls to
+:meth:`~sbclassifier.classifiers.basic.Classifier.learn` or
+:meth:`~sbclassifier.classifiers.basic.Classifier.learn_many`). If its
+``track_lastseen`` attribute is true, it also records the generation in
+which each token was last learned, which :class:`HapaxAgePolicy` requires.
+A :class:`Pruner` applies a pruning policy, such as :class:`HapaxAgePolicy`
+or :class:`UsefulnessPolicy`, to the database of a classifier a little at a
+time, so that a large database can be pruned between other work::
+
+    classifier.track_lastseen = True
+    ...
+    pruner = Pruner(classifier, HapaxAgePolicy(10000))
+    while not pruner.step():
+        handle_some_messages()
+    classifier.store()
+
+Pruning deletes tokens through the same methods as un-learning does, so it
+works with any classifier which can list its tokens, including the stored
+classifiers; as with training, call ``store()`` afterwards to save the
+result. The numbers of spam and ham messages trained are not changed. If
+the classifier has a journal, each token pruned is recorded in it as a
+decrease in its counts to zero, so that replicas prune it too.
+
+"""
+import heapq
+import math
+import time
+
+from sbclassifier.classifiers.basic import MINIMUM_PROB_STRENGTH
+
+#: The default number of seconds for which :meth:`Pruner.step` runs.
+TIME_SLICE = 0.05
+
+
+class PruningPolicy:
+    """Decides which tokens a :class:`Pruner` deletes.
+
+    If :attr:`scans` is true, :meth:`scan` is called for every token in the
+    database before :meth:`should_prune` is called for any of them.
+    Subclasses must implement :meth:`should_prune`.
+
+    """
+
+    #: Whether this policy needs to see every token before pruning any.
+    scans = False
+
+    #: Whether this policy needs the generation in which each token was last
+    #: learned.
+    requires_lastseen = False
+
+    def begin(self, classifier):
+        """Called when a :class:`Pruner` starts to prune `classifier`."""
+        pass
+
+    def scan(self, classifier, word, record):
+        """Called during the first pass over the database with each word and
+        its record.
+
+        """
+        pass
+
+    def should_prune(self, classifier, word, record):
+        """Returns ``True`` if `word`, whose record is `record`, should be
+        deleted from the database of `classifier`.
+
+        """
+        raise NotImplementedError
+
+
+class HapaxAgePolicy(PruningPolicy):
+    """Prunes hapaxes which were last learned more than `max_age`
+    generations ago.
+
+    The classifier must track the generations in which tokens were last
+    learned, by having a true ``track_lastseen`` attribute, since it was
+    first trained.
+
+    """
+
+    requires_lastseen = True
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+
+    def should_prune(self, classifier, word, record):
+        if record.spamcount + record.hamcount != 1:
+            return False
+        age = classifier.generation - classifier._lastseenget(word)
+        return age > self.max_age
+
+
+def usefulness(classifier, record):
+    """Returns a measure of how useful a token with the specified record is
+    for scoring messages with `classifier`.
+
+    This is the distance of the spam probability of the token from 0.5,
+    weighted by the number of messages in which it appeared; it is zero for
+    tokens which are too weak ever to be used as a clue.
+
+    """
+    distance = abs(classifier.probability(record) - 0.5)
+    if distance < MINIMUM_PROB_STRENGTH:
+        return 0.0
+    return distance * (record.spamcount + record.hamcount)
+
+
+class UsefulnessPolicy(PruningPolicy):
+    """Prunes all but the `max_tokens` most useful tokens, as measured by
+    :func:`usefulness`.
+
+    The tokens are ranked during a first pass over the database, so a token
+    learned while pruning is in progress is not counted, though it may be
+    pruned if it is not more useful than those kept. If `max_tokens` is zero,
+    every token is pruned; if it is negative, :exc:`ValueError` is raised.
+
+    """
+
+    scans = True
+
+    def __init__(self, max_tokens):
+        if max_tokens < 0:
+            raise ValueError('max_tokens must not be negative')
+        self.max_tokens = max_tokens
+
+    def begin(self, classifier):
+        # A heap of the largest usefulness values seen so far.
+        self._best = []
+        self._threshold = None
+
+    def scan(self, classifier, word, record):
+        value = usefulness(classifier, record)
+        if len(self._best) < self.max_tokens:
+            heapq.heappush(self._best, value)
+        elif self._best and value > self._best[0]:
+            heapq.heapreplace(self._best, value)
+
+    def _finish_scan(self):
+        if len(self._best) < self.max_tokens:
+            # There are few enough tokens already.
+            self._threshold = -1.0
+            self._ties = 0
+        elif not self._best:
+            # No tokens are to be kept.
+            self._threshold = math.inf
+            self._ties = 0
+        else:
+            # Tokens exactly as useful as the least useful one to be kept
+            # are kept only until the total reaches max_tokens.
+            self._threshold = self._best[0]
+            self._ties = self._best.count(self._threshold)
+        del self._best[:]
+
+    def should_prune(self, classifier, word, record):
+        if self._threshold is None:
+            self._finish_scan()
+        value = usefulness(classifier, record)
+        if value > self._threshold:
+            return False
+        if value == self._threshold and self._ties > 0:
+            self._ties -= 1
+            return False
+        return True
+
+
+class Pruner:
+    """Prunes the database of `classifier` according to `policy`, in slices
+    of bounded duration.
+
+    The tokens to be examined are listed as pruning proceeds, by the
+    classifier's ``_iterwordinfokeys`` method, which reads them from a large
+    database a page at a time where the database allows it. Each call to
+    :meth:`step` examines some of them; once :meth:`step` has returned
+    ``True``, all of them have been examined. The classifier may be trained
+    between calls to :meth:`step`; tokens learned meanwhile may or may not
+    be examined.
+
+    The number of tokens examined and pruned so far are in the
+    :attr:`examined` and :attr:`pruned` attributes.
+
+    A classifier which cannot list its tokens, because its ``stores_words``
+    attribute is false, cannot be pruned; :exc:`TypeError` is raised. Nor
+    can a classifier which does not track the generations in which tokens
+    were last learned be pruned by a policy which requires them.
+
+    """
+
+    def __init__(self, classifier, policy):
+        if not classifier.stores_words:
+            raise TypeError('cannot prune a classifier which does not store'
+                            ' its tokens')
+        if policy.requires_lastseen and not classifier.track_lastseen:
+            raise TypeError('the pruning policy requires a classifier which'
+                            ' tracks when tokens were last learned')
+        self.classifier = classifier
+        self.policy = policy
+        self.examined = 0
+        self.pruned = 0
+        self.done = False
+        self._work = self._run()
+        policy.begin(classifier)
+
+    def _run(self):
+        """Yields after examining each token."""
+        classifier = self.classifier
+        policy = self.policy
+        if policy.scans:
+            for word in classifier._iterwordinfokeys():
+                record = classifier._wordinfoget(word)
+                if record is not None:
+                    policy.scan(classifier, word, record)
+                yield
+        for word in classifier._iterwordinfokeys():
+            record = classifier._wordinfoget(word)
+            self.examined += 1
+            if (record is not None and
+                    policy.should_prune(classifier, word, record)):
+                # The counts are read before the record is deleted, since
+                # some records are views of the database.
+                delta = (-record.spamcount, -record.hamcount)
+                classifier._wordinfodel(word)
+                if classifier.track_lastseen:
+                    classifier._lastseendel(word)
+                if classifier.journal is not None:
+                    classifier.journal.record(0, 0, {word: delta})
+                classifier.version += 1
+                self.pruned += 1
+            yield
+
+    def step(self, time_slice=TIME_SLICE):
+        """Prunes for about `time_slice` seconds, and returns ``True`` if
+        pruning is complete.
+
+        At least one token is examined by each call, however small
+        `time_slice` is.
+
+        """
+        deadline = time.monotonic() + time_slice
+        for _ in self._work:
+            if time.monotonic() >= deadline:
+                return False
+        self.done = True
+        return True
+
+    def run(self):
+        """Prunes all the tokens at once, and returns the number pruned."""
+        for _ in self._work:
+            pass
+        self.done = True
+        return self.pruned
+
+
+def prune(classifier, policy):
+    """Prunes the database of `classifier` according to `policy` all at
+    once, and returns the number of tokens pruned.
+
+    """
+    return Pruner(classifier, policy).run()
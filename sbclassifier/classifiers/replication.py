@@ -0,0 +1,230 @@
+# replication.py - replicating training to other classifiers through a journal
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Keeping replicas of a classifier up to date through a journal of changes.
+
+Instead of reloading a whole database whenever the classifier being trained
+is stored, scoring replicas can follow a journal of the changes made to it.
+Setting the :attr:`journal` attribute of any classifier to a
+:class:`JournalWriter` makes each training call append a record to the
+journal, containing a sequence number, the changes in the numbers of spam
+and ham messages, and the changes in the counts of each word affected::
+
+    classifier.journal = JournalWriter(directory)
+
+A :class:`Replica` reads the journal in the same directory, perhaps in
+another process or on another machine sharing the directory, and applies
+the changes to a classifier of its own each time :meth:`Replica.poll` is
+called.
+
+The journal is a :class:`~sbclassifier.classifiers.journal.Journal`, whose
+segment files are named after the sequence number of their first record.
+:meth:`JournalWriter.compact` writes a snapshot of the whole
+database, named after the sequence number of the last record it includes,
+and deletes the segments and snapshots it makes unnecessary. A new replica
+starts from the latest snapshot, as does a replica which has fallen so far
+behind that the records it needs have been compacted away.
+
+The writer and the replicas must agree on `use_bigrams`, and the database of
+the classifier being journaled must match the journal when the journal is
+opened, for example by having been loaded from a store made just before a
+compaction.
+
+"""
+import os
+import re
+
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.classifiers.journal import Journal
+from sbclassifier.classifiers.journal import numbered_files
+from sbclassifier.classifiers.journal import read_records
+from sbclassifier.classifiers.partial import PartialModel
+from sbclassifier.safepickle import pickle_read
+from sbclassifier.safepickle import pickle_write
+
+#: When a segment of the journal grows beyond this many bytes, the writer
+#: starts a new one.
+SEGMENT_SIZE = 16 * 1024 * 1024
+
+SEGMENT_FORMAT = 'journal-{:016d}.log'
+SNAPSHOT_FORMAT = 'snapshot-{:016d}.pickle'
+
+_SEGMENT_RE = re.compile(r'^journal-(\d{16})\.log$')
+_SNAPSHOT_RE = re.compile(r'^snapshot-(\d{16})\.pickle$')
+
+
+class JournalWriter:
+    """Appends the changes made by training to the journal in `directory`,
+    which is created if necessary.
+
+    If the journal already exists, new records follow the existing ones,
+    after any incomplete record at the end is discarded. :attr:`seq` is the
+    sequence number of the last record written; sequence numbers start at
+    one.
+
+    If `fsync` is true, every record is forced to disk as it is written;
+    otherwise, records are only flushed to the operating system.
+
+    """
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, fsync=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self.seq = max([n for n, _ in numbered_files(directory, _SNAPSHOT_RE)],
+                       default=0)
+        self._journal = Journal(directory, SEGMENT_FORMAT, _SEGMENT_RE, fsync)
+        segments = self._journal.segments()
+        if segments:
+            self.seq = segments[-1][0] - 1
+            for record in self._journal.resume():
+                self.seq = record[0]
+        else:
+            self._journal.start_segment(self.seq + 1)
+
+    def record(self, nspam, nham, deltas):
+        """Appends a record of one change to the database.
+
+        `nspam` and `nham` are the changes in the numbers of spam and ham
+        messages, and `deltas` maps words to pairs of changes in their spam
+        and ham counts.
+
+        """
+        self.seq += 1
+        size = self._journal.append((self.seq, nspam, nham, deltas))
+        if size >= self.segment_size:
+            self._journal.start_segment(self.seq + 1)
+
+    def compact(self, classifier):
+        """Writes a snapshot of the database of `classifier`, which must
+        reflect every record written so far, and deletes the segments and
+        snapshots that are no longer needed.
+
+        """
+        counts = PartialModel(classifier.nspam, classifier.nham)
+        for word in classifier._wordinfokeys():
+            record = classifier._wordinfoget(word)
+            counts.spamcounts[word] = record.spamcount
+            counts.hamcounts[word] = record.hamcount
+        pickle_write(os.path.join(self.directory,
+                                  SNAPSHOT_FORMAT.format(self.seq)),
+                     (self.seq, counts))
+        self._journal.start_segment(self.seq + 1)
+        self._journal.remove_segments(self.seq)
+        for seq, filename in numbered_files(self.directory, _SNAPSHOT_RE):
+            if seq < self.seq:
+                os.remove(filename)
+
+    def close(self):
+        self._journal.close()
+
+
+class Replica:
+    """A classifier kept up to date with the journal in `directory`.
+
+    :attr:`classifier` is the replicated classifier, created by calling
+    `factory` with no arguments and then loaded from the latest snapshot, if
+    any. :attr:`seq` is the sequence number of the last record applied.
+    Call :meth:`poll` to apply any new records.
+
+    If the replica falls so far behind that the records it needs have been
+    compacted away, :meth:`poll` replaces :attr:`classifier` with a new one
+    loaded from the latest snapshot.
+
+    """
+
+    def __init__(self, directory, factory=Classifier):
+        self.directory = directory
+        self.factory = factory
+        self._reload()
+
+    def _reload(self):
+        """Replaces the classifier with one loaded from the latest
+        snapshot.
+
+        """
+        classifier = self.factory()
+        self.seq = 0
+        snapshots = numbered_files(self.directory, _SNAPSHOT_RE)
+        if snapshots:
+            self.seq, counts = pickle_read(snapshots[-1][1])
+            counts.apply(classifier)
+        self.classifier = classifier
+        self._segment = None
+        self._offset = 0
+
+    def _apply(self, record):
+        seq, nspam, nham, deltas = record
+        classifier = self.classifier
+        classifier.nspam += nspam
+        classifier.nham += nham
+        for word, (spamdelta, hamdelta) in deltas.items():
+            info = classifier._wordinfoget(word)
+            if info is None:
+                info = classifier.WordInfoClass()
+            info.spamcount += spamdelta
+            info.hamcount += hamdelta
+            if info.spamcount == 0 == info.hamcount:
+                classifier._wordinfodel(word)
+            else:
+                classifier._wordinfoset(word, info)
+        classifier.version += 1
+        self.seq = seq
+
+    def _find_segment(self, segments):
+        """Returns the segment containing the record after the last one
+        applied, or ``None`` if there is none yet.
+
+        """
+        candidates = [s for s in segments if s[0] <= self.seq + 1]
+        if not candidates and segments and segments[0][0] > self.seq + 1:
+            # The records this replica needs have been compacted away.
+            self._reload()
+            candidates = [s for s in segments if s[0] <= self.seq + 1]
+        return candidates[-1] if candidates else None
+
+    def poll(self):
+        """Applies all the complete records written since the last call, and
+        returns the number of records applied.
+
+        """
+        applied = 0
+        segments = numbered_files(self.directory, _SEGMENT_RE)
+        if self._segment is None:
+            self._segment = self._find_segment(segments)
+            if self._segment is None:
+                return applied
+            self._offset = 0
+        while True:
+            first, filename = self._segment
+            try:
+                with open(filename, 'rb') as f:
+                    f.seek(self._offset)
+                    for self._offset, record in read_records(f):
+                        if record[0] <= self.seq:
+                            continue
+                        if record[0] != self.seq + 1:
+                            raise ValueError('journal record {} is missing'
+                                             .format(self.seq + 1))
+                        self._apply(record)
+                        applied += 1
+            except FileNotFoundError:
+                # The segment was compacted away; the records after the last
+                # one applied are in a later segment, or in a snapshot.
+                segments = numbered_files(self.directory, _SEGMENT_RE)
+                self._segment = self._find_segment(segments)
+                self._offset = 0
+                if self._segment is None:
+                    return applied
+                continue
+            later = [s for s in segments if s[0] > first]
+            if not later:
+                return applied
+            # A segment is complete once a later one has been started.
+            self._segment = later[0]
+            self._offset = 0
@@ -0,0 +1,151 @@
+# scorecache.py - remembering the scores of messages seen before
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Avoiding tokenizing and scoring the same message more than once.
+
+Forwarded and resent messages, and messages sent to several recipients or
+mailing lists, arrive many times over with the same content. A
+:class:`ScoreCache` sits in front of the tokenizer and a classifier, and
+remembers the score of each message it has seen, keyed by a digest of the
+message with its line endings normalized, for as long as the classifier
+is not trained::
+
+    scores = ScoreCache(classifier)
+    prob = scores.score(message)
+
+Every classifier counts the changes made to its database in its
+``version`` attribute, which learning, un-learning, pruning, replication,
+loading a stored classifier and replacing the base of a layered classifier
+all increment. A :class:`~sbclassifier.classifiers.storage.SQLiteClassifier`
+also checks for changes stored by other processes when its version is
+read. When the cache finds that the version has changed, it
+discards every score it holds, since they may all be out of date.
+
+"""
+import email.message
+import hashlib
+
+from sbclassifier.lrucache import LRUCache
+from sbclassifier.tokenizer import tokenize
+
+#: The default number of scores kept by a :class:`ScoreCache`.
+CACHE_SIZE = 10000
+
+#: The number of bytes in the digest of a message.
+DIGEST_SIZE = 16
+
+
+def normalize(message):
+    """Returns the content of `message` as bytes, with each line ending
+    replaced by a single newline.
+
+    `message` may be a string, bytes, or a :class:`email.message.Message`.
+    The email parser treats every kind of line ending the same way, so
+    messages that differ only in their line endings produce the same
+    tokens.
+
+    """
+    if isinstance(message, email.message.Message):
+        message = message.as_string()
+    if isinstance(message, str):
+        message = message.encode('utf-8', 'surrogateescape')
+    return message.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+
+def digest(message):
+    """Returns a digest of `message` after normalizing it with
+    :func:`normalize`.
+
+    """
+    return hashlib.blake2b(normalize(message),
+                           digest_size=DIGEST_SIZE).digest()
+
+
+class ScoreCache:
+    """A cache of the scores given by `classifier` to the messages made into
+    tokens by `tokenizer`.
+
+    At most `max_size` scores are kept; when the cache is full, the score
+    that was least recently used is evicted. The cache is emptied whenever
+    the ``version`` of `classifier` changes; before each lookup, the
+    classifier's ``refresh()`` method is called, so that changes stored by
+    other processes are seen.
+
+    The numbers of calls to :meth:`score` answered from the cache and not,
+    the number of scores evicted, and the number of times the cache was
+    emptied because the classifier changed are in the :attr:`hits`,
+    :attr:`misses`, :attr:`evictions` and :attr:`invalidations` attributes;
+    :meth:`stats` returns them all, along with the hit rate.
+
+    """
+
+    def __init__(self, classifier, tokenizer=tokenize, max_size=CACHE_SIZE):
+        self.classifier = classifier
+        self.tokenizer = tokenizer
+        self._cache = LRUCache(max_size)
+        self._version = classifier.version
+        self.invalidations = 0
+
+    @property
+    def hits(self):
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        return self._cache.misses
+
+    @property
+    def evictions(self):
+        return self._cache.evictions
+
+    @property
+    def hit_rate(self):
+        """The fraction of calls to :meth:`score` answered from the cache, or
+        ``None`` if there have been none.
+
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        """Discards every score in the cache."""
+        self._cache.clear()
+
+    def score(self, message, evidence=False):
+        """Returns the probability that `message` is spam, as returned by
+        ``spamprob()``, from the cache if possible.
+
+        """
+        self.classifier.refresh()
+        version = self.classifier.version
+        if version != self._version:
+            self.clear()
+            self._version = version
+            self.invalidations += 1
+        key = digest(message), evidence
+        result = self._cache.get(key)
+        if result is None:
+            result = self.classifier.spamprob(self.tokenizer(message),
+                                              evidence)
+            self._cache.put(key, result)
+        if evidence:
+            # Each caller gets a list of clues of its own.
+            prob, clues = result
+            return prob, list(clues)
+        return result
+
+    def stats(self):
+        """Returns a dictionary of the counts described above, the number of
+        scores in the cache, and the hit rate.
+
+        """
+        stats = self._cache.stats()
+        stats.update(invalidations=self.invalidations, hit_rate=self.hit_rate)
+        return stats
@@ -0,0 +1,86 @@
+# shared.py - a classifier database shared between processes
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Publishing a trained classifier in shared memory for scoring processes.
+
+When scoring processes are forked from a process holding a trained
+classifier, each of them soon ends up with its own copy of the token
+database, because merely reading a Python object writes to its reference
+count. Instead, :func:`publish` packs the database (see
+:mod:`sbclassifier.classifiers.packed`) into a block of shared memory, and
+each scoring process attaches to that block by name with
+:class:`SharedMemoryClassifier`, which reads the counts directly from the
+shared pages.
+
+"""
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import sys
+
+from sbclassifier.classifiers.basic import USE_BIGRAMS
+from sbclassifier.classifiers.packed import pack
+from sbclassifier.classifiers.packed import PackedClassifier
+
+
+def publish(classifier, name=None):
+    """Packs the database of `classifier` into a new block of shared memory,
+    and returns the :class:`~multiprocessing.shared_memory.SharedMemory`
+    object.
+
+    `name` is the name of the block; if it is ``None``, a unique name is
+    chosen. Scoring processes attach to the block by passing its ``name``
+    attribute to :class:`SharedMemoryClassifier`.
+
+    The caller owns the block, and must call its ``unlink`` method once no
+    more scoring processes will attach to it.
+
+    """
+    data = pack(classifier)
+    shm = SharedMemory(name=name, create=True, size=max(len(data), 1))
+    shm.buf[:len(data)] = data
+    return shm
+
+
+def _attach(name):
+    """Returns the existing block of shared memory with the specified name,
+    without making this process responsible for unlinking it.
+
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    # Before Python 3.13 every process that attaches to a block registers it
+    # with its resource tracker, which unlinks it when the tracker exits,
+    # taking the block away from every other process, so the block is
+    # unregistered again once it is attached. A process forked from the
+    # publisher shares its tracker, so the publisher's own registration is
+    # removed too, and the tracker may report this when the publisher
+    # unlinks the block; the block is unlinked all the same.
+    shm = SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+class SharedMemoryClassifier(PackedClassifier):
+    """A read-only classifier that scores against a database published by
+    :func:`publish`.
+
+    `name` is the name of the block of shared memory. `use_bigrams` should
+    be the same as for the published classifier. The results of
+    :meth:`spamprob` are identical to those of the published classifier at
+    the time it was published.
+
+    Call :meth:`close` to detach from the block.
+
+    """
+
+    def __init__(self, name, use_bigrams=USE_BIGRAMS):
+        self._shm = _attach(name)
+        super().__init__(self._shm.buf, use_bigrams)
+
+    def close(self):
+        """Detaches from the block of shared memory."""
+        self.wordinfo.release()
+        self._shm.close()
@@ -10,6 +10,7 @@
 Classes:
     PickledClassifier - Classifier that uses a pickle db
     DBDictClassifier - Classifier that uses a shelve db
+    SQLiteClassifier - Classifier that uses SQLite
     PGClassifier - Classifier that uses postgres
     mySQLClassifier - Classifier that uses mySQL
     CBDClassifier - Classifier that uses CDB
@@ -45,15 +46,24 @@ __author__ = ("Neale Pickett <neale@woozle.org>,"
 __credits__ = "All the spambayes contributors."
 
 # import dbm.gnu
+from contextlib import contextmanager
 import logging
 import os
+import re
 # import time
 # import tempfile
 # import errno
 import shelve
+import sqlite3
+import threading
+import time
 from sbclassifier.classifiers.basic import Classifier
 from sbclassifier.classifiers.basic import PICKLE_VERSION
 from sbclassifier.classifiers.basic import WordInfo
+from sbclassifier.classifiers.journal import Journal
+from sbclassifier.classifiers.journal import read_records
+from sbclassifier.corpora.caches import INFINITY
+from sbclassifier.lrucache import LRUCache
 # from sbclassifier import cdb
 from sbclassifier.safepickle import pickle_read
 from sbclassifier.safepickle import pickle_write
@@ -105,6 +115,44 @@ WORD_CHANGED = "C"
 
 STATE_KEY = 'saved state'
 
+#: When the journal of a :class:`JournaledPickleClassifier` grows beyond this
+#: many bytes, it is compacted into a new snapshot.
+COMPACTION_THRESHOLD = 64 * 1024 * 1024
+
+JOURNAL_SUFFIX = '.journal.{:08d}'
+
+#: A :class:`ShelveClassifier` writes its buffered writes to the database
+#: after a message is trained once this many are buffered,
+FLUSH_COUNT = 1000
+
+#: or once they take about this many bytes,
+FLUSH_BYTES = 1024 * 1024
+
+#: or once this many seconds have passed since they were last written.
+FLUSH_INTERVAL = 5.0
+
+#: The approximate number of bytes taken by a buffered write, besides its key.
+BUFFERED_WRITE_SIZE = 100
+
+#: The number of seconds for which a :class:`SQLiteClassifier` waits for
+#: another process to release a lock on its database.
+SQLITE_TIMEOUT = 20
+
+#: The default number of words whose records, or whose absence, a
+#: :class:`SQLiteClassifier` remembers after reading them.
+SQLITE_CACHE_SIZE = 100000
+
+#: The most words looked up by a single query of a :class:`SQLiteClassifier`.
+#: Older versions of SQLite allow no more than 999 parameters in a statement.
+SQLITE_MAX_LOOKUP = 512
+
+#: The number of words read by each query of a :class:`SQLiteClassifier`
+#: while iterating over the words in its database.
+SQLITE_PAGE_SIZE = 1024
+
+# Never an entry of the cache of a SQLiteClassifier.
+_UNCACHED = object()
+
 # # Make shelve use binary pickles by default.
 # oldShelvePickler = shelve.Pickler
 
@@ -153,6 +201,8 @@ class PickleClassifier(StoredClassifierBase):
         # objects are shared between tempbayes and self, and the tiny
         # tempbayes object is reclaimed when load() returns.
         logging.debug('Loading state from %s pickle', self.filename)
+        # Anything computed from the database before is out of date.
+        self.version += 1
 
         try:
             tempbayes = pickle_read(self.filename)
@@ -162,6 +212,8 @@ class PickleClassifier(StoredClassifierBase):
             self.wordinfo = {}
             self.nham = 0
             self.nspam = 0
+            self.generation = 0
+            self.lastseen = {}
             return
 
         # Copy state from tempbayes.  The use of our base-class __setstate__ is
@@ -177,6 +229,254 @@ class PickleClassifier(StoredClassifierBase):
         pickle_write(self.filename, self)  # , PICKLE_TYPE)
 
 
+class JournaledPickleClassifier(PickleClassifier):
+    """Classifier persisted in a pickle and a journal of changes to it.
+
+    Storing a :class:`PickleClassifier` rewrites the whole database.
+    Storing this classifier instead appends one record to a
+    :class:`~sbclassifier.classifiers.journal.Journal`, in files named after
+    `filename` with a ``.journal.NNNNNNNN`` suffix, containing the numbers of
+    messages and the counts of each word changed or deleted since the last
+    store, so the cost of storing is proportional to the amount of training
+    since the last store rather than to the size of the database. Loading
+    reads the snapshot in `filename`, which has the same format as the
+    pickle of a :class:`PickleClassifier`, and then replays the journal.
+
+    Once the journal grows beyond `compaction_threshold` bytes, storing
+    also starts a thread which writes a new snapshot of the database as it
+    was at that moment and then deletes the journal files it includes.
+    Training and scoring may continue meanwhile; the changes they make are
+    kept apart from the database being written, and folded into it once it
+    has been written. Call :meth:`compact` to compact the journal at once,
+    and :meth:`close` to wait for a compaction in progress to finish.
+
+    If `fsync` is true, each record is forced to disk as it is written;
+    otherwise, records are only flushed to the operating system.
+
+    """
+
+    def __init__(self, filename, compaction_threshold=COMPACTION_THRESHOLD,
+                 fsync=False):
+        self.compaction_threshold = compaction_threshold
+        self.fsync = fsync
+        dirname, basename = os.path.split(os.path.abspath(filename))
+        self._journal = Journal(dirname, basename + JOURNAL_SUFFIX,
+                                re.compile(re.escape(basename) +
+                                           r'\.journal\.(\d{8})$'),
+                                fsync)
+        # The words changed or deleted since the last store.
+        self._changed = set()
+        self._compaction = None
+        # While a compaction is in progress, the pair of dictionaries of
+        # records and generations being written to the snapshot, which must
+        # not change. self.wordinfo and self.lastseen then hold only the
+        # words changed since it started, mapped to None or 0 if they were
+        # deleted.
+        self._frozen = None
+        super().__init__(filename)
+
+    def load(self):
+        """Loads the snapshot and replays the journal."""
+        self._wait_for_compaction()
+        super().load()
+        self._changed.clear()
+        for number, name in self._journal.segments()[:-1]:
+            with open(name, 'rb') as f:
+                for end, record in read_records(f):
+                    self._replay(record)
+        # This discards an incomplete record left by a crash while storing,
+        # and appends to the last journal file.
+        for record in self._journal.resume():
+            self._replay(record)
+        self._stored_state = self.nspam, self.nham, self.generation
+
+    def _replay(self, record):
+        self.nspam, self.nham, self.generation, changes = record
+        for word, entry in changes.items():
+            if entry is None:
+                self.wordinfo.pop(word, None)
+                self.lastseen.pop(word, None)
+            else:
+                spamcount, hamcount, lastseen = entry
+                self.wordinfo[word] = self.WordInfoClass(spamcount, hamcount)
+                # Generations are only recorded if they are tracked.
+                if lastseen:
+                    self.lastseen[word] = lastseen
+                else:
+                    self.lastseen.pop(word, None)
+
+    def _write_record(self):
+        """Appends the changes made since the last store to the journal, and
+        returns the size of the journal file."""
+        if self._journal.number is None:
+            self._journal.start_segment(1)
+        changes = {}
+        for word in self._changed:
+            record = self._wordinfoget(word)
+            if record is None:
+                changes[word] = None
+            else:
+                changes[word] = (record.spamcount, record.hamcount,
+                                 self._lastseenget(word))
+        self._changed.clear()
+        self._stored_state = self.nspam, self.nham, self.generation
+        return self._journal.append((self.nspam, self.nham, self.generation,
+                                     changes))
+
+    def store(self):
+        """Appends the changes made since the last store to the journal."""
+        if self._compaction is not None and not self._compaction.is_alive():
+            self._finish_compaction()
+        if (not self._changed and
+                self._stored_state == (self.nspam, self.nham,
+                                       self.generation)):
+            # Nothing has changed since the last store.
+            return
+        logging.debug('Appending changes to the journal of %s', self.filename)
+        size = self._write_record()
+        if self._compaction is None and size >= self.compaction_threshold:
+            self._start_compaction()
+
+    def compact(self):
+        """Stores any changes, then replaces the snapshot and the journal with
+        a new snapshot, and waits for that to finish.
+
+        """
+        self._wait_for_compaction()
+        self._write_record()
+        self._start_compaction()
+        self._wait_for_compaction()
+
+    def _start_compaction(self):
+        # Everything up to this point has just been stored, so the snapshot
+        # includes exactly the journal files written so far.
+        last = self._journal.number
+        self._journal.start_segment(last + 1)
+        # The snapshot takes the dictionaries as they are, rather than
+        # copies, so that this takes the same time however large the
+        # database is; training continues in new ones.
+        self._frozen = self.wordinfo, self.lastseen
+        self.wordinfo = {}
+        self.lastseen = {}
+        snapshot = Classifier(self._use_bigrams)
+        snapshot.__setstate__((PICKLE_VERSION, self._frozen[0], self.nspam,
+                               self.nham, self.generation, self._frozen[1]))
+        self._compaction = threading.Thread(target=self._compact,
+                                            args=(snapshot, last))
+        self._compaction.start()
+
+    def _compact(self, snapshot, last):
+        logging.debug('Compacting the journal of %s', self.filename)
+        try:
+            pickle_write(self.filename, snapshot)
+            self._journal.remove_segments(last)
+        except Exception:
+            # Loading still replays every journal file, so nothing is lost.
+            logging.exception('Compacting the journal of %s failed',
+                              self.filename)
+
+    def _wait_for_compaction(self):
+        if self._compaction is not None:
+            self._finish_compaction()
+
+    def _finish_compaction(self):
+        """Waits for the compaction in progress to finish, and folds the
+        changes made since it started into the database it wrote.
+
+        """
+        self._compaction.join()
+        self._compaction = None
+        wordinfo, lastseen = self._frozen
+        self._frozen = None
+        for word, record in self.wordinfo.items():
+            if record is None:
+                wordinfo.pop(word, None)
+            else:
+                wordinfo[word] = record
+        for word, generation in self.lastseen.items():
+            if generation:
+                lastseen[word] = generation
+            else:
+                lastseen.pop(word, None)
+        self.wordinfo = wordinfo
+        self.lastseen = lastseen
+
+    def close(self):
+        """Waits for any compaction in progress, and closes the journal."""
+        self._wait_for_compaction()
+        self._journal.close()
+
+    def _unshare(self, words):
+        """Copies the records of `words` from the snapshot being written,
+        unless they have been changed since it started, so that training may
+        change the copies in place.
+
+        """
+        if self._frozen is None:
+            return
+        wordinfo = self.wordinfo
+        frozen = self._frozen[0]
+        for word in words:
+            if word not in wordinfo:
+                record = frozen.get(word)
+                if record is not None:
+                    wordinfo[word] = self.WordInfoClass(record.spamcount,
+                                                        record.hamcount)
+
+    # Training looks up each record it changes, changes it in place, and
+    # then sets it; the copy is made before the change, by the methods which
+    # determine the words to be trained.
+
+    def _distinct(self, wordstream):
+        words = super()._distinct(wordstream)
+        self._unshare(words)
+        return words
+
+    def _add_msgs(self, counts):
+        self._unshare(counts[2].keys() | counts[3].keys())
+        super()._add_msgs(counts)
+
+    def _remove_msgs(self, counts):
+        self._unshare(counts[2].keys() | counts[3].keys())
+        super()._remove_msgs(counts)
+
+    def _wordinfoget(self, word):
+        if self._frozen is None:
+            return self.wordinfo.get(word)
+        try:
+            return self.wordinfo[word]
+        except KeyError:
+            return self._frozen[0].get(word)
+
+    def _wordinfoset(self, word, record):
+        self.wordinfo[word] = record
+        self._changed.add(word)
+
+    def _wordinfodel(self, word):
+        if self._frozen is None:
+            del self.wordinfo[word]
+        else:
+            self.wordinfo[word] = None
+        self._changed.add(word)
+
+    def _wordinfokeys(self):
+        if self._frozen is None:
+            return self.wordinfo.keys()
+        keys = self._frozen[0].keys() | self.wordinfo.keys()
+        return [word for word in keys if self._wordinfoget(word) is not None]
+
+    def _lastseenget(self, word):
+        if self._frozen is not None and word not in self.lastseen:
+            return self._frozen[1].get(word, 0)
+        return self.lastseen.get(word, 0)
+
+    def _lastseendel(self, word):
+        if self._frozen is None:
+            self.lastseen.pop(word, None)
+        else:
+            self.lastseen[word] = 0
+
+
 class ShelveClassifier(StoredClassifierBase):
     """Classifier object persisted in a shelved DBM database.
 
@@ -185,20 +485,55 @@ class ShelveClassifier(StoredClassifierBase):
 
     `mode` is the same as the ``flag`` parameter in :func:`shelve.open`.
 
+    The records of words read from the database or trained are kept in
+    memory, in :attr:`wordinfo`. At most `cache_size` of them are kept; when
+    there are more, the least recently used are evicted, and any that have
+    changed since the last :meth:`store` are written to the database first.
+    :meth:`cache_stats` returns the numbers of hits, misses, evictions and
+    such writes.
+
+    The state key, single-count records and records evicted from the cache
+    are not written to the database as soon as they change; the latest value
+    of each is kept in a buffer instead. After each message is trained, the
+    buffer is written to the database by :meth:`flush`, along with every
+    other record changed or deleted since, if it holds at least
+    `flush_count` values, or about `flush_bytes` bytes, or if
+    `flush_interval` seconds have passed since it was last written, so the
+    database is always left as it was after some message. It is also
+    written by :meth:`store`, :meth:`load` and :meth:`close`.
+    :meth:`buffer_stats` returns the number of writes saved.
+
     """
 
-    def __init__(self, filename, flag='c'):
+    def __init__(self, filename, flag='c', cache_size=INFINITY,
+                 flush_count=FLUSH_COUNT, flush_bytes=FLUSH_BYTES,
+                 flush_interval=FLUSH_INTERVAL):
         super().__init__()
         self.statekey = STATE_KEY
         self.flag = flag
         self.filename = filename
+        self.cache_size = cache_size
+        self.writebacks = 0
+        self.flush_count = flush_count
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        # Maps each key to the value to be written to the database for it.
+        self.buffer = {}
+        self.buffer_size = 0
+        self.buffered_writes = 0
+        self.flushed_writes = 0
+        self.flushes = 0
+        self.last_flush = time.monotonic()
         self.load()
 
     def close(self):
+        self.flush()
         self.db.close()
         logging.debug('Closed %s database', self.filename)
 
     def load(self):
+        if self.buffer:
+            self.flush()
         logging.debug('Loading state from %s database', self.filename)
         # TODO why was this originally written like this?
         #
@@ -209,10 +544,13 @@ class ShelveClassifier(StoredClassifierBase):
         self.db = shelve.open(self.filename, self.flag)
         if self.statekey in self.db:
             t = self.db[self.statekey]
-            if t[0] != PICKLE_VERSION:
+            if t[0] == 5:
+                # Version 5 did not record the age of words.
+                t = t + (0, )
+            elif t[0] != PICKLE_VERSION:
                 msg = "Can't unpickle: version {} unknown".format(t[0])
                 raise ValueError(msg)
-            self.nspam, self.nham = t[1:]
+            self.nspam, self.nham, self.generation = t[1:]
             logging.debug('%s is an existing database with %d spam and %d ham',
                           self.filename, self.nspam, self.nham)
         else:
@@ -220,9 +558,15 @@ class ShelveClassifier(StoredClassifierBase):
             logging.debug('%s is a new database', self.filename)
             self.nspam = 0
             self.nham = 0
-        self.wordinfo = {}
+            self.generation = 0
+        self.wordinfo = _WordCache(self, self.cache_size)
+        # Like self.wordinfo, this holds only the words that have been read
+        # from the database or trained; the generation in which a word was
+        # last learned is saved as the third item of its record.
+        self.lastseen = {}
         self.deleted_words = set()
         self.changed_words = set()
+        self.version += 1
 
     def store(self):
         logging.debug('Persisting %s state in database', self.filename)
@@ -232,9 +576,47 @@ class ShelveClassifier(StoredClassifierBase):
         # could mess us up a little.  Possibly a little lock while we copy and
         # reset self.changed_words would be appropriate.  For now, just do it
         # the naive way.
+        self.flush()
+        # Update the global state, then do the actual save.
+        self._write_state_key()
+        self.db.sync()
+
+    def _write_state_key(self):
+        self.db[self.statekey] = self._state()
+
+    def _state(self):
+        """Returns the value to be saved in the database for the state key."""
+        return PICKLE_VERSION, self.nspam, self.nham, self.generation
+
+    def _write(self, key, value):
+        """Buffers a write of `value` to the database under `key`."""
+        if key not in self.buffer:
+            self.buffer_size += len(key) + BUFFERED_WRITE_SIZE
+        self.buffer[key] = value
+        self.buffered_writes += 1
+
+    def _dbget(self, key):
+        """Returns the value for `key` in the database, or ``None``, taking
+        the buffer into account.
+
+        """
+        try:
+            return self.buffer[key]
+        except KeyError:
+            return self.db.get(key)
+
+    def flush(self):
+        """Writes the buffered writes, and the records of the words changed
+        or deleted since the last flush, to the database.
+
+        """
+        for key, value in self.buffer.items():
+            self.db[key] = value
+        # The buffer is written first, since the changed and deleted words
+        # supersede it.
         for word in self.changed_words:
-            val = self.wordinfo[word]
-            self.db[word] = val.__getstate__()
+            self.db[word] = self._record_state(word,
+                                               self.wordinfo.peek(word))
         for word in self.deleted_words:
             if word in self.wordinfo:
                 msg = ('Should not have a wordinfo for "{}", flagged for'
@@ -245,22 +627,63 @@ class ShelveClassifier(StoredClassifierBase):
                 del self.db[word]
             except KeyError:
                 pass
-
         # Reset the changed and deleted word lists.
         self.deleted_words.clear()
         self.changed_words.clear()
-        # Update the global state, then do the actual save.
-        self._write_state_key()
-        self.db.sync()
-
-    def _write_state_key(self):
-        self.db[self.statekey] = (PICKLE_VERSION, self.nspam, self.nham)
+        self.flushed_writes += len(self.buffer)
+        self.flushes += 1
+        self.buffer.clear()
+        self.buffer_size = 0
+        self.last_flush = time.monotonic()
+
+    def buffer_stats(self):
+        """Returns a dictionary containing the number of writes made to the
+        buffer, the number of them written to the database, the number of
+        times it was written, the number still buffered, and the number saved
+        because a later write to the same key replaced them.
+
+        """
+        pending = len(self.buffer)
+        return dict(writes=self.buffered_writes, flushed=self.flushed_writes,
+                    flushes=self.flushes, pending=pending,
+                    saved=self.buffered_writes - self.flushed_writes - pending)
+
+    def _record_state(self, word, record):
+        """Returns the value to be saved in the database for `word`."""
+        return record.__getstate__() + (self.lastseen.get(word, 0), )
+
+    def _evict(self, word, record):
+        """Called when the record of `word` is evicted from :attr:`wordinfo`.
+
+        If it has changed since the last :meth:`store`, it is written to the
+        buffer now, as :meth:`_wordinfoset` writes single-count records.
+
+        """
+        if word in self.changed_words:
+            self._write(word, self._record_state(word, record))
+            self.changed_words.remove(word)
+            self.writebacks += 1
+        self.lastseen.pop(word, None)
+
+    def cache_stats(self):
+        """Returns a dictionary containing the numbers of hits, misses,
+        evictions and writebacks of the cache of word records, and the
+        number of records in it.
+
+        """
+        stats = self.wordinfo.stats()
+        stats.update(writebacks=self.writebacks)
+        return stats
 
     def _post_training(self):
         """This is called after training on a wordstream.  We ensure that the
         database is in a consistent state at this point by writing the state
-        key."""
-        self._write_state_key()
+        key, along with the rest of the buffer if the flush policy says so."""
+        self._write(self.statekey, self._state())
+        if (len(self.buffer) >= self.flush_count or
+                self.buffer_size >= self.flush_bytes or
+                time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
 
     def _wordinfoget(self, word):
         # if isinstance(word, unicode):
@@ -273,10 +696,14 @@ class ShelveClassifier(StoredClassifierBase):
         except KeyError:
             ret = None
             if word not in self.deleted_words:
-                r = self.db.get(word)
+                r = self._dbget(word)
                 if r:
                     ret = self.WordInfoClass()
-                    ret.__setstate__(r)
+                    ret.__setstate__(r[:2])
+                    # Records saved by version 5 have no generation, and
+                    # generations are only recorded if they are tracked.
+                    if len(r) > 2 and r[2]:
+                        self.lastseen[word] = r[2]
                     self.wordinfo[word] = ret
             return ret
 
@@ -299,7 +726,8 @@ class ShelveClassifier(StoredClassifierBase):
         # if isinstance(word, unicode):
         #     word = word.encode("utf-8")
         if record.spamcount + record.hamcount <= 1:
-            self.db[word] = record.__getstate__()
+            self._write(word, self._record_state(word, record))
+            self.lastseen.pop(word, None)
             for wordset in self.changed_words, self.deleted_words:
                 try:
                     wordset.remove(word)
@@ -308,25 +736,379 @@ class ShelveClassifier(StoredClassifierBase):
                     # twice, then untrained once, all before a store().
                     pass
 
-            try:
-                del self.wordinfo[word]
-            except KeyError:
-                pass
+            self.wordinfo.pop(word)
 
         else:
-            self.wordinfo[word] = record
+            # The word is marked as changed first, in case adding it to the
+            # cache evicts it at once.  Any buffered write of it is
+            # superseded by the write in flush().
             self.changed_words.add(word)
+            self.deleted_words.discard(word)
+            if self.buffer.pop(word, None) is not None:
+                self.buffer_size -= len(word) + BUFFERED_WRITE_SIZE
+            self.wordinfo[word] = record
 
     def _wordinfodel(self, word):
         # if isinstance(word, unicode):
         #     word = word.encode("utf-8")
         del self.wordinfo[word]
+        # A deleted word has no record left for flush() to write.
+        self.changed_words.discard(word)
+        self.deleted_words.add(word)
+
+    def _wordinfokeys(self):
+        wordinfokeys = set(self.db.keys())
+        wordinfokeys.update(self.buffer)
+        wordinfokeys -= self.deleted_words
+        wordinfokeys.discard(self.statekey)
+        # Changed records are only written by flush().
+        wordinfokeys.update(self.changed_words)
+        return list(wordinfokeys)
+
+    def _lastseenget(self, word):
+        try:
+            return self.lastseen[word]
+        except KeyError:
+            r = self._dbget(word) if word not in self.deleted_words else None
+            return r[2] if r and len(r) > 2 else 0
+
+
+class _WordCache(LRUCache):
+    """The cache of word records of a :class:`ShelveClassifier`."""
+
+    def __init__(self, classifier, max_size=INFINITY):
+        super().__init__(max_size)
+        self.classifier = classifier
+
+    def evict(self, word, record):
+        self.classifier._evict(word, record)
+
+
+class SQLiteClassifier(StoredClassifierBase):
+    """Classifier object persisted in a SQLite database.
+
+    `filename` is the location of the database file. It is opened in WAL
+    mode, so any number of processes may score messages from it while one
+    process trains and calls :meth:`store`; readers see the counts as of the
+    last :meth:`store` in the writer, from the next message they score or
+    the next call to :meth:`refresh`. It requires SQLite 3.8.2 or later.
+
+    The records of words changed by training are kept in :attr:`wordinfo`
+    until the next :meth:`store`, which writes every changed and deleted
+    word in one transaction. The records read from the database, and the
+    words found not to be in it, are kept in an
+    :class:`~sbclassifier.lrucache.LRUCache` of at most `cache_size`
+    entries. The tokens of a message are looked up a few hundred at a time,
+    by queries of the form ``word IN (...)``, rather than one query per
+    token.
+
+    """
+
+    table_definition = ('CREATE TABLE IF NOT EXISTS bayes ('
+                        '  word TEXT PRIMARY KEY,'
+                        '  nspam INTEGER NOT NULL,'
+                        '  nham INTEGER NOT NULL,'
+                        '  lastseen INTEGER NOT NULL DEFAULT 0'
+                        ') WITHOUT ROWID')
+
+    # Replacing the whole row has the same effect as the upsert below, since
+    # every column is given, but deletes the old row first.
+    replace = ('INSERT OR REPLACE INTO bayes (word, nspam, nham, lastseen)'
+               '  VALUES (?, ?, ?, ?)')
+
+    if sqlite3.sqlite_version_info >= (3, 24, 0):
+        upsert = ('INSERT INTO bayes (word, nspam, nham, lastseen)'
+                  '  VALUES (?, ?, ?, ?)'
+                  '  ON CONFLICT (word) DO UPDATE'
+                  '  SET nspam = excluded.nspam, nham = excluded.nham,'
+                  '      lastseen = excluded.lastseen')
+    else:
+        # SQLite supports upserts from version 3.24.0.
+        upsert = replace
+
+    def __init__(self, filename, cache_size=SQLITE_CACHE_SIZE):
+        super().__init__()
+        self.statekey = STATE_KEY
+        self.filename = filename
+        self.cache_size = cache_size
+        # Calls are serialized by the caller; see AsyncClassifier.
+        self.db = sqlite3.connect(filename, timeout=SQLITE_TIMEOUT,
+                                  isolation_level=None,
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute(self.table_definition)
+        self.load()
+
+    def close(self):
+        self.db.close()
+        logging.debug('Closed %s database', self.filename)
+
+    def refresh(self):
+        """Discards the records read from the database if another process
+        has stored changes to it since, and reads the new numbers of
+        messages trained, unless this classifier has changes of its own
+        which have not been stored.
+
+        :attr:`version` is incremented if anything was discarded. Scoring a
+        message does this first, and
+        :class:`~sbclassifier.classifiers.scorecache.ScoreCache` calls this
+        method before each lookup.
+
+        """
+        with self._reading():
+            self._refresh()
+
+    def load(self):
+        logging.debug('Loading state from %s database', self.filename)
+        with self._reading():
+            self._load_state(*self._read_state())
+
+    @contextmanager
+    def _reading(self):
+        """A context manager which makes everything read from the database
+        inside it part of a single read transaction, unless one is already
+        in progress.
+
+        In WAL mode, a read transaction sees the database as it was when
+        the transaction first read from it, whatever other processes store
+        meanwhile.
+
+        """
+        if self.db.in_transaction:
+            yield
+            return
+        self.db.execute('BEGIN')
+        try:
+            yield
+        finally:
+            self.db.execute('COMMIT')
+
+    def _read_state(self):
+        """Returns the data version and the state row of the database, read
+        in the current transaction.
+
+        """
+        # The data version changes whenever another connection commits. The
+        # state row is read first, so that the snapshot seen by the
+        # transaction is fixed before the data version is read.
+        row = self.db.execute('SELECT nspam, nham, lastseen FROM bayes'
+                              '  WHERE word = ?',
+                              (self.statekey, )).fetchone()
+        return self._get_data_version(), row
+
+    def _load_state(self, data_version, row):
+        """Discards every record held, and sets the state to that of `row`,
+        as returned by :meth:`_read_state`.
+
+        """
+        self.wordinfo = {}
+        self.lastseen = {}
+        self.deleted_words = set()
+        # Maps each word read from the database to a pair of its record and
+        # the generation in which it was last learned, or to None if it is
+        # not in the database.
+        self.cache = LRUCache(self.cache_size)
+        self._data_version = data_version
+        if row is not None:
+            self.nspam, self.nham, self.generation = row
+            logging.debug('%s is an existing database with %d spam and %d ham',
+                          self.filename, self.nspam, self.nham)
+        else:
+            # new database
+            logging.debug('%s is a new database', self.filename)
+            self.nspam = 0
+            self.nham = 0
+            self.generation = 0
+        self._stored_state = self.nspam, self.nham, self.generation
+        self.version += 1
+
+    def _get_data_version(self):
+        return self.db.execute('PRAGMA data_version').fetchone()[0]
+
+    def store(self):
+        logging.debug('Persisting %s state in database', self.filename)
+        rows = [(word, ) + self._record_state(word, record)
+                for word, record in self.wordinfo.items()]
+        rows.append((self.statekey, self.nspam, self.nham, self.generation))
+        # BEGIN IMMEDIATE takes the write lock at once, so that the
+        # transaction cannot fail part way through because another process
+        # is writing.
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.executemany(self.upsert, rows)
+            self.db.executemany('DELETE FROM bayes WHERE word = ?',
+                                ((word, ) for word in self.deleted_words))
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+        # What was written is now what the database holds.
+        for word, nspam, nham, lastseen in rows[:-1]:
+            self.cache.put(word, (self.wordinfo[word], lastseen))
+        for word in self.deleted_words:
+            self.cache.put(word, None)
+        self.wordinfo.clear()
+        self.lastseen.clear()
+        self.deleted_words.clear()
+        self._stored_state = self.nspam, self.nham, self.generation
+
+    def _record_state(self, word, record):
+        """Returns the values to be saved in the database for `word`."""
+        return record.__getstate__() + (self._lastseenget(word), )
+
+    def _refresh(self):
+        """Discards the records read from the database if another process
+        has stored changes to it since, unless this classifier has changes of
+        its own which have not been stored.
+
+        This must be called inside :meth:`_reading`, and the records are
+        then read in the same transaction, so that they agree with the
+        numbers of messages trained.
+
+        """
+        data_version, row = self._read_state()
+        if data_version == self._data_version:
+            return
+        if (self.wordinfo or self.deleted_words or
+                self._stored_state != (self.nspam, self.nham,
+                                       self.generation)):
+            # Only one process should train; keep the changes made here.
+            return
+        self._load_state(data_version, row)
+
+    def _fetch(self, words):
+        """Reads the records of each of `words` that is neither changed nor
+        cached into the cache.
+
+        """
+        words = [word for word in words if word not in self.wordinfo and
+                 word not in self.deleted_words and word not in self.cache]
+        for i in range(0, len(words), SQLITE_MAX_LOOKUP):
+            chunk = words[i:i + SQLITE_MAX_LOOKUP]
+            found = dict.fromkeys(chunk)
+            # Round the number of parameters up to a power of two, padding
+            # with a repeated word, so that only a few different statements
+            # are ever prepared, and they all stay in the connection's
+            # statement cache.
+            size = 16
+            while size < len(chunk):
+                size *= 2
+            chunk += chunk[-1:] * (size - len(chunk))
+            query = ('SELECT word, nspam, nham, lastseen FROM bayes'
+                     '  WHERE word IN ({})'.format(', '.join('?' * size)))
+            for word, nspam, nham, lastseen in self.db.execute(query, chunk):
+                record = self.WordInfoClass()
+                record.__setstate__((nspam, nham))
+                found[word] = record, lastseen
+            for word, entry in found.items():
+                self.cache.put(word, entry)
+
+    def _cached(self, word):
+        """Returns the cache entry for `word`, reading it from the database
+        if necessary.
+
+        """
+        entry = self.cache.get(word, _UNCACHED)
+        if entry is _UNCACHED:
+            self._fetch((word, ))
+            entry = self.cache.peek(word)
+        return entry
+
+    def _prefetching(self, wordstream):
+        """Yields the tokens of `wordstream`, having read the records of up
+        to :const:`SQLITE_MAX_LOOKUP` distinct tokens at a time with one
+        query before yielding them.
+
+        """
+        tokens = []
+        words = set()
+        for token in wordstream:
+            tokens.append(token)
+            words.add(token)
+            if len(words) == SQLITE_MAX_LOOKUP:
+                self._fetch(words)
+                yield from tokens
+                tokens.clear()
+                words.clear()
+        self._fetch(words)
+        yield from tokens
+
+    def _getclues(self, wordstream, worddistanceget=None):
+        # The state and every record used are read in one transaction, so
+        # that they are all as stored by the same call to store().
+        with self._reading():
+            self._refresh()
+            if not self._use_bigrams:
+                # The bigram scheme calls _prefetch() instead.
+                wordstream = self._prefetching(wordstream)
+            return super()._getclues(wordstream, worddistanceget)
+
+    def _prefetch(self, words):
+        self._fetch(words)
+
+    def _distinct(self, wordstream):
+        # Training looks up each distinct word; fetch them all first.
+        words = super()._distinct(wordstream)
+        self._fetch(words)
+        return words
+
+    def _wordinfoget(self, word):
+        try:
+            return self.wordinfo[word]
+        except KeyError:
+            pass
+        if word in self.deleted_words:
+            return None
+        entry = self._cached(word)
+        return entry[0] if entry is not None else None
+
+    def _wordinfoset(self, word, record):
+        self.wordinfo[word] = record
+        self.deleted_words.discard(word)
+        self.cache.pop(word)
+
+    def _wordinfodel(self, word):
+        self.wordinfo.pop(word, None)
+        self.cache.pop(word)
         self.deleted_words.add(word)
 
     def _wordinfokeys(self):
-        wordinfokeys = list(self.db.keys())
-        del wordinfokeys[wordinfokeys.index(self.statekey)]
-        return wordinfokeys
+        words = {row[0] for row in self.db.execute('SELECT word FROM bayes')}
+        words.discard(self.statekey)
+        words -= self.deleted_words
+        words.update(self.wordinfo)
+        return list(words)
+
+    def _iterwordinfokeys(self):
+        # The words changed since the last store() may not be in the
+        # database yet, so they come first; the rest are read in order, a
+        # page at a time, starting after the last word of the page before,
+        # so that deleting words does not disturb the iteration.
+        changed = list(self.wordinfo)
+        yield from changed
+        changed = set(changed)
+        last = ''
+        while True:
+            page = [row[0] for row in self.db.execute(
+                'SELECT word FROM bayes WHERE word > ? ORDER BY word LIMIT ?',
+                (last, SQLITE_PAGE_SIZE))]
+            for word in page:
+                if not (word == self.statekey or word in changed or
+                        word in self.deleted_words):
+                    yield word
+            if len(page) < SQLITE_PAGE_SIZE:
+                return
+            last = page[-1]
+
+    def _lastseenget(self, word):
+        try:
+            return self.lastseen[word]
+        except KeyError:
+            pass
+        if word in self.wordinfo or word in self.deleted_words:
+            return 0
+        entry = self._cached(word)
+        return entry[1] if entry is not None else 0
 
 
 # TODO this should be replaced with a SQLAlchemy-backed classifier.
@@ -621,16 +1403,27 @@ class CDBClassifier(StoredClassifierBase):
     #     return s
 
     def load(self):
+        self.version += 1
         if os.path.exists(self.filename):
             data = cdb.read(self.filename)
-            self.nham, self.nspam = [int(i) for i in
-                                     data[self.statekey].split(',')]
+            # Databases written before the age of words was recorded have
+            # no generation.
+            state = [int(i) for i in data[self.statekey].split(',')]
+            self.nham, self.nspam, self.generation = (state + [0])[:3]
             # self.wordinfo = {self.uunquote(k): self._WordInfoFactory(v)
             #                  for k, v in data.items()
             #                  if k != self.statekey}
-            from_string = lambda s: WordInfo(*(int(n) for n in s.split(',')))
+            from_string = lambda s: WordInfo(*(int(n) for n in
+                                               s.split(',')[:2]))
             self.wordinfo = {k: from_string(v) for k, v in data.items()
                              if k != self.statekey}
+            # Generations are only recorded if they are tracked.
+            self.lastseen = {}
+            for k, v in data.items():
+                fields = v.split(',')
+                if (k != self.statekey and len(fields) == 3 and
+                        fields[2] != '0'):
+                    self.lastseen[k] = int(fields[2])
             logging.debug('%s is an existing CDB, with %d ham and %d spam',
                           self.filename, self.nham, self.nspam)
         else:
@@ -638,10 +1431,15 @@ class CDBClassifier(StoredClassifierBase):
             self.wordinfo = {}
             self.nham = 0
             self.nspam = 0
+            self.generation = 0
+            self.lastseen = {}
 
     def store(self):
-        items = [(self.statekey, "{:d},{:d}".format(self.nham, self.nspam))]
-        items.extend((word, '{:d},{:d}'.format(info.hamcount, info.spamcount))
+        items = [(self.statekey, "{:d},{:d},{:d}".format(self.nham, self.nspam,
+                                                         self.generation))]
+        items.extend((word, '{:d},{:d},{:d}'.format(info.hamcount,
+                                                    info.spamcount,
+                                                    self._lastseenget(word)))
                      for word, info in self.wordinfo.items())
         cdb.write(self.filename, items)
 
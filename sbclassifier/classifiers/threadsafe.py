@@ -0,0 +1,315 @@
+# threadsafe.py - a classifier shared between scoring and training threads
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""A classifier that can be used by many scoring threads while another
+thread trains it.
+
+:class:`SnapshotClassifier` keeps its token database as a sequence of
+immutable snapshots. Each snapshot consists of a large base dictionary and a
+few small dictionaries of changes made since the base was built; none of
+them is ever modified once the snapshot has been published. Training builds
+the next snapshot under a lock, adding a dictionary of its own changes, and
+then publishes it with a single attribute assignment, so scoring never waits
+for training and always sees the state of the classifier either before or
+after any given message was learned.
+
+"""
+import threading
+
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.classifiers.basic import ReadOnlyClassifier
+from sbclassifier.classifiers.basic import USE_BIGRAMS
+
+#: When the dictionaries of changes made since the base of the current
+#: snapshot was built have more than this many entries in all, training folds
+#: them into a new base.  Each new base copies the whole database, while each
+#: word looked up in a snapshot may be looked up in each of its dictionaries
+#: of changes, so this trades the cost of the former against the cost of the
+#: latter.
+MERGE_THRESHOLD = 10000
+
+# Marks a word that has been deleted since the base was built.
+_DELETED = None
+
+
+class _Snapshot:
+    """An immutable state of a :class:`SnapshotClassifier`.
+
+    `base` maps words to ``(spamcount, hamcount)`` pairs. `layers` is a tuple
+    of dictionaries of changes made since, newest first, which do the same
+    and also map deleted words to ``None``; each takes precedence over those
+    after it and over `base`.
+
+    """
+
+    __slots__ = 'base', 'layers', 'nspam', 'nham'
+
+    def __init__(self, base, layers, nspam, nham):
+        self.base = base
+        self.layers = layers
+        self.nspam = nspam
+        self.nham = nham
+
+    def get(self, word):
+        for layer in self.layers:
+            if word in layer:
+                return layer[word]
+        return self.base.get(word)
+
+    def keys(self):
+        keys = set(self.base)
+        for layer in reversed(self.layers):
+            for word, counts in layer.items():
+                if counts is _DELETED:
+                    keys.discard(word)
+                else:
+                    keys.add(word)
+        return keys
+
+
+class SnapshotReader(ReadOnlyClassifier):
+    """A read-only classifier that scores against a single snapshot of a
+    :class:`SnapshotClassifier`.
+
+    Instances are obtained from :meth:`SnapshotClassifier.snapshot`. An
+    instance must not be used by more than one thread at a time, but may be
+    kept as long as desired; it is not affected by subsequent training.
+
+    """
+
+    def __init__(self, use_bigrams=USE_BIGRAMS):
+        super().__init__(use_bigrams)
+        self.wordinfo = None
+
+    def _attach(self, snapshot):
+        self.wordinfo = snapshot
+        self.nspam = snapshot.nspam
+        self.nham = snapshot.nham
+
+    def _wordinfoget(self, word):
+        counts = self.wordinfo.get(word)
+        if counts is None:
+            return None
+        return self.WordInfoClass(*counts)
+
+    def _wordinfokeys(self):
+        return self.wordinfo.keys()
+
+
+class _SnapshotWriter(Classifier):
+    """The classifier used to train a :class:`SnapshotClassifier`.
+
+    Training records its changes in :attr:`changes` without modifying the
+    base or the layers of the current snapshot.
+
+    """
+
+    # Snapshots hold only counts, so the generations would never be seen.
+    track_lastseen = False
+
+    def __init__(self, snapshot, use_bigrams=USE_BIGRAMS):
+        super().__init__(use_bigrams)
+        self.base = snapshot.base
+        self.layers = list(snapshot.layers)
+        # The changes made since the last snapshot.
+        self.changes = {}
+        self.nspam = snapshot.nspam
+        self.nham = snapshot.nham
+
+    def _wordinfoget(self, word):
+        try:
+            counts = self.changes[word]
+        except KeyError:
+            counts = _Snapshot.get(self, word)
+        if counts is None:
+            return None
+        return self.WordInfoClass(*counts)
+
+    def _wordinfoset(self, word, record):
+        self.changes[word] = (record.spamcount, record.hamcount)
+
+    def _wordinfodel(self, word):
+        self.changes[word] = _DELETED
+
+    def freeze(self, merge_threshold):
+        """Returns a new snapshot of the current state.
+
+        The changes made since the last snapshot become its newest layer,
+        which is first merged with the newer layers no larger than it, so
+        that there are only logarithmically many layers and each change is
+        copied only logarithmically many times. If there are more than
+        `merge_threshold` changes in all, they are merged into a copy of the
+        base instead.
+
+        """
+        layers = self.layers
+        layer = self.changes
+        self.changes = {}
+        if layer:
+            while layers and len(layers[0]) <= len(layer):
+                merged = dict(layers.pop(0))
+                merged.update(layer)
+                layer = merged
+            layers.insert(0, layer)
+        if sum(map(len, layers)) > merge_threshold:
+            base = dict(self.base)
+            for layer in reversed(layers):
+                for word, counts in layer.items():
+                    if counts is _DELETED:
+                        base.pop(word, None)
+                    else:
+                        base[word] = counts
+            self.base = base
+            layers.clear()
+        return _Snapshot(self.base, tuple(layers), self.nspam, self.nham)
+
+
+class SnapshotClassifier:
+    """A classifier which may be used to score messages from many threads
+    while a thread trains it.
+
+    `classifier`, if specified, is a
+    :class:`~sbclassifier.classifiers.basic.Classifier` whose training this
+    classifier starts with; its database is copied, and it is not used
+    afterwards. `use_bigrams` is as for the basic classifier, and is ignored
+    if `classifier` is given.
+
+    The scoring methods, :meth:`spamprob`, :meth:`spamprob_many`, and
+    :meth:`classify`, never block. Each call uses the most recently
+    published snapshot, so it sees the effects of every training call that
+    completed before it started and of no training call that is still in
+    progress. For several calls against the same state, use
+    :meth:`snapshot`.
+
+    The training methods are serialized by a lock, and publish a new
+    snapshot when they finish.
+
+    """
+
+    def __init__(self, classifier=None, use_bigrams=USE_BIGRAMS,
+                 merge_threshold=MERGE_THRESHOLD):
+        if classifier is None:
+            base, nspam, nham = {}, 0, 0
+        else:
+            use_bigrams = classifier._use_bigrams
+            base = {word: classifier._wordinfoget(word).__getstate__()
+                    for word in classifier._wordinfokeys()}
+            nspam, nham = classifier.nspam, classifier.nham
+        self._use_bigrams = use_bigrams
+        self.merge_threshold = merge_threshold
+        self._snapshot = _Snapshot(base, (), nspam, nham)
+        self._writer = _SnapshotWriter(self._snapshot, use_bigrams)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        #: The number of training calls made so far.
+        self.version = 0
+
+    @property
+    def nspam(self):
+        return self._snapshot.nspam
+
+    @property
+    def nham(self):
+        return self._snapshot.nham
+
+    def refresh(self):
+        """Does nothing, since only this object trains its database; see
+        :meth:`Classifier.refresh`.
+
+        """
+        pass
+
+    def snapshot(self):
+        """Returns a new :class:`SnapshotReader` for the current state."""
+        reader = SnapshotReader(self._use_bigrams)
+        reader._attach(self._snapshot)
+        return reader
+
+    def _reader(self):
+        """Returns this thread's reader, attached to the current snapshot.
+
+        Each thread keeps its own reader so that the probability cache, which
+        stays valid across snapshots, is not shared between threads.
+
+        """
+        reader = getattr(self._local, 'reader', None)
+        if reader is None:
+            reader = self._local.reader = SnapshotReader(self._use_bigrams)
+        reader._attach(self._snapshot)
+        return reader
+
+    def spamprob(self, wordstream, evidence=False):
+        """Returns the best-guess probability that `wordstream` is spam, as
+        described in :meth:`Classifier.spamprob`.
+
+        """
+        return self._reader().spamprob(wordstream, evidence)
+
+    def spamprob_many(self, wordstreams, evidence=False):
+        """Returns the best-guess probabilities that each of `wordstreams` is
+        spam, as described in :meth:`Classifier.spamprob_many`.
+
+        """
+        return self._reader().spamprob_many(wordstreams, evidence)
+
+    def classify(self, wordstream, *args, **kw):
+        """Classifies `wordstream`, as described in
+        :meth:`Classifier.classify`.
+
+        """
+        return self._reader().classify(wordstream, *args, **kw)
+
+    def _train(self, method, *args):
+        with self._lock:
+            getattr(self._writer, method)(*args)
+            self._snapshot = self._writer.freeze(self.merge_threshold)
+            # This changes only after the new snapshot is published, so a
+            # result computed after reading the version is never older than
+            # the snapshot that version describes.
+            self.version += 1
+
+    def learn_spam(self, wordstream):
+        """Convenience method for ``self.learn(wordstream, True)``."""
+        self.learn(wordstream, True)
+
+    def learn_ham(self, wordstream):
+        """Convenience method for ``self.learn(wordstream, False)``."""
+        self.learn(wordstream, False)
+
+    def unlearn_spam(self, wordstream):
+        """Convenience method for ``self.unlearn(wordstream, True)``."""
+        self.unlearn(wordstream, True)
+
+    def unlearn_ham(self, wordstream):
+        """Convenience method for ``self.unlearn(wordstream, False)``."""
+        self.unlearn(wordstream, False)
+
+    def learn(self, wordstream, is_spam):
+        """Learns `wordstream`, as described in :meth:`Classifier.learn`."""
+        self._train('learn', wordstream, is_spam)
+
+    def unlearn(self, wordstream, is_spam):
+        """Un-learns `wordstream`, as described in :meth:`Classifier.unlearn`.
+
+        """
+        self._train('unlearn', wordstream, is_spam)
+
+    def learn_many(self, messages):
+        """Learns many messages, as described in
+        :meth:`Classifier.learn_many`.
+
+        The new state is published only after all of them have been learned.
+
+        """
+        self._train('learn_many', messages)
+
+    def unlearn_many(self, messages):
+        """Un-learns many messages, as described in
+        :meth:`Classifier.unlearn_many`.
+
+        """
+        self._train('unlearn_many', messages)
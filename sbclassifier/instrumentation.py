@@ -0,0 +1,309 @@
+# instrumentation.py - measuring the stages of scoring a message
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Measuring where the time goes when messages are tokenized and scored.
+
+The :class:`~sbclassifier.tokenizer.Tokenizer` and every classifier have an
+``instrument`` attribute, which is ``None`` by default. If it is set to an
+:class:`Instrument`, each call reports the time taken by each of its stages,
+in nanoseconds, to :meth:`Instrument.record`, and adds what it did to the
+counters kept by :meth:`Instrument.count`::
+
+    collector = LatencyCollector()
+    Tokenizer.instrument = collector
+    Classifier.instrument = collector
+    ...
+    print(collector.dump())
+
+Setting the attribute on a class instruments all of its instances; setting
+it on one instance instruments only that one. When the attribute is
+``None``, the only cost is a single test per call.
+
+The stages are:
+
+:const:`PARSE`
+    Parsing a message given to the tokenizer as a string.
+:const:`TOKENIZE_HEADERS`, :const:`TOKENIZE_BODY`
+    Generating the tokens of the headers and of the body. Since tokens are
+    generated lazily, this is the time spent inside the tokenizer while its
+    consumer asks for tokens, not the time between the first and the last
+    token.
+:const:`SPAMPROB`
+    A whole call to ``spamprob()``, including :const:`CLUES` and
+    :const:`COMBINE`, and any tokenizing done while it consumes the tokens.
+:const:`CLUES`
+    Looking up the tokens and selecting the clues, including
+    :const:`LOOKUP`.
+:const:`LOOKUP`
+    The total time spent in the database lookups (``_wordinfoget()``)
+    for one message.
+:const:`COMBINE`
+    Combining the probabilities of the clues into a score.
+
+and the counters are :const:`TOKENS`, :const:`LOOKUPS`,
+:const:`PROBCACHE_HITS` and :const:`PROBCACHE_MISSES`.
+
+"""
+from collections import Counter
+from contextlib import contextmanager
+import math
+import time
+
+#: The stage in which the tokenizer parses a message given as a string.
+PARSE = 'parse'
+#: The stage in which the tokenizer generates the tokens of the headers.
+TOKENIZE_HEADERS = 'tokenize headers'
+#: The stage in which the tokenizer generates the tokens of the body.
+TOKENIZE_BODY = 'tokenize body'
+#: A whole call to ``spamprob()``.
+SPAMPROB = 'spamprob'
+#: The stage in which a classifier looks up tokens and selects clues.
+CLUES = 'clues'
+#: The database lookups made while selecting clues for one message.
+LOOKUP = 'lookup'
+#: The stage in which a classifier combines clues into a score.
+COMBINE = 'combine'
+
+#: The number of tokens generated by the tokenizer.
+TOKENS = 'tokens'
+#: The number of database lookups.
+LOOKUPS = 'lookups'
+#: The number of word probabilities found in the probability cache.
+PROBCACHE_HITS = 'probcache hits'
+#: The number of word probabilities which had to be computed.
+PROBCACHE_MISSES = 'probcache misses'
+
+#: The number of bits of each value kept by a :class:`LatencyHistogram`; the
+#: value recorded for each sample is within 1 part in ``2 ** (PRECISION -
+#: 1)`` of the true value.
+PRECISION = 8
+
+#: The percentiles shown by :meth:`LatencyCollector.dump`.
+PERCENTILES = (50, 90, 99, 99.9)
+
+clock = time.perf_counter_ns
+
+
+class Instrument:
+    """Receives measurements from instrumented code.
+
+    The methods of this class do nothing; subclasses override them to keep
+    the measurements.
+
+    """
+
+    def record(self, stage, nanoseconds):
+        """Records that one execution of `stage` took `nanoseconds`."""
+        pass
+
+    def count(self, counter, n=1):
+        """Adds `n` to `counter`."""
+        pass
+
+    @contextmanager
+    def stage(self, name):
+        """A context manager which records the time taken by its body as one
+        execution of the stage `name`.
+
+        """
+        start = clock()
+        try:
+            yield
+        finally:
+            self.record(name, clock() - start)
+
+
+def timed_iter(instrument, stage, iterable):
+    """Yields the items of `iterable`, and when it is exhausted, records the
+    total time spent producing them as one execution of `stage` and counts
+    them as :const:`TOKENS`.
+
+    """
+    iterator = iter(iterable)
+    elapsed = 0
+    n = 0
+    while True:
+        start = clock()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            elapsed += clock() - start
+            break
+        elapsed += clock() - start
+        n += 1
+        yield item
+    instrument.record(stage, elapsed)
+    instrument.count(TOKENS, n)
+
+
+class LatencyHistogram:
+    """A histogram of non-negative integer values, such as latencies in
+    nanoseconds, with bounded relative error.
+
+    Like an HDR histogram, values are counted in buckets whose width is
+    proportional to their magnitude: values less than ``2 ** precision`` are
+    counted exactly, and larger values are counted with their `precision`
+    most significant bits. The memory used is therefore proportional to the
+    logarithm of the largest value, and each percentile is within 1 part in
+    ``2 ** (precision - 1)`` of the true value.
+
+    """
+
+    def __init__(self, precision=PRECISION):
+        self.precision = precision
+        self.counts = []
+        #: The number of values recorded.
+        self.total_count = 0
+        #: The sum of the values recorded.
+        self.total = 0
+        #: The smallest value recorded, or ``None``.
+        self.min = None
+        #: The largest value recorded, or ``None``.
+        self.max = None
+
+    def _index(self, value):
+        shift = value.bit_length() - self.precision
+        if shift <= 0:
+            return value
+        return (shift << (self.precision - 1)) + (value >> shift)
+
+    def _lowest(self, index):
+        """Returns the smallest value counted in the bucket `index`."""
+        half = 1 << (self.precision - 1)
+        if index < 2 * half:
+            return index
+        shift = index // half - 1
+        return (index - shift * half) << shift
+
+    def _highest(self, index):
+        """Returns the largest value counted in the bucket `index`."""
+        return self._lowest(index + 1) - 1
+
+    def record(self, value, count=1):
+        """Records `count` occurrences of `value`."""
+        index = self._index(value)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += count
+        self.total_count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def update(self, other):
+        """Adds the values recorded by the histogram `other`, which must have
+        the same precision, to this one.
+
+        """
+        if other.precision != self.precision:
+            raise ValueError('histograms have different precisions')
+        counts = self.counts
+        if len(other.counts) > len(counts):
+            counts.extend([0] * (len(other.counts) - len(counts)))
+        for index, count in enumerate(other.counts):
+            counts[index] += count
+        self.total_count += other.total_count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min,
+                                                              other.min)
+            self.max = other.max if self.max is None else max(self.max,
+                                                              other.max)
+
+    @property
+    def mean(self):
+        """The mean of the values recorded, or ``None`` if there are none."""
+        if not self.total_count:
+            return None
+        return self.total / self.total_count
+
+    def percentile(self, p):
+        """Returns the value below which `p` percent of the values recorded
+        fall, or ``None`` if there are none.
+
+        As for an HDR histogram, the value returned is the largest value
+        counted in the same bucket, but never more than :attr:`max`.
+
+        """
+        if not self.total_count:
+            return None
+        # The rank of the value sought, counting from one.
+        rank = max(1, math.ceil(self.total_count * p / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self._highest(index), self.max)
+        return self.max
+
+
+class LatencyCollector(Instrument):
+    """An :class:`Instrument` which keeps a :class:`LatencyHistogram` for each
+    stage and a total for each counter, in memory.
+
+    :attr:`histograms` maps the name of each stage recorded to its histogram,
+    and :attr:`counters` is a :class:`collections.Counter` mapping the name
+    of each counter to its total. A collector is not thread-safe; give each
+    thread its own and combine them with :meth:`update`.
+
+    """
+
+    def __init__(self, precision=PRECISION):
+        self.precision = precision
+        self.histograms = {}
+        self.counters = Counter()
+
+    def record(self, stage, nanoseconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram(
+                self.precision)
+        histogram.record(nanoseconds)
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+
+    def update(self, other):
+        """Adds the measurements kept by the collector `other` to this one."""
+        for stage, histogram in other.histograms.items():
+            if stage not in self.histograms:
+                self.histograms[stage] = LatencyHistogram(self.precision)
+            self.histograms[stage].update(histogram)
+        self.counters.update(other.counters)
+
+    def reset(self):
+        """Discards all the measurements."""
+        self.histograms.clear()
+        self.counters.clear()
+
+    def dump(self, percentiles=PERCENTILES):
+        """Returns a table of the count, mean, specified percentiles, and
+        maximum of each stage, in microseconds, followed by the total of each
+        counter.
+
+        """
+        headings = (['stage', 'count', 'mean'] +
+                    ['p{:g}'.format(p) for p in percentiles] + ['max'])
+        rows = []
+        for stage in sorted(self.histograms):
+            histogram = self.histograms[stage]
+            values = ([histogram.mean] +
+                      [histogram.percentile(p) for p in percentiles] +
+                      [histogram.max])
+            rows.append([stage, str(histogram.total_count)] +
+                        ['{:.1f}'.format(v / 1000) for v in values])
+        width = max([len(row[0]) for row in rows] + [len('stage')])
+        line = '{:<{}}' + ' {:>10}' * (len(headings) - 1)
+        lines = [line.format(headings[0], width, *headings[1:])]
+        lines.extend(line.format(row[0], width, *row[1:]) for row in rows)
+        for counter in sorted(self.counters):
+            lines.append('{:<{}} {:>10}'.format(counter, width,
+                                                self.counters[counter]))
+        return '\n'.join(lines)
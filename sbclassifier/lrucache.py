@@ -0,0 +1,127 @@
+# lrucache.py - a size-bounded least-recently-used cache
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""A dictionary-like cache which evicts its least recently used entries."""
+from collections import OrderedDict
+
+from sbclassifier.corpora.caches import INFINITY
+
+
+class LRUCache:
+    """An in-memory cache holding at most `max_size` entries.
+
+    When an entry is added to a full cache, the entry that was least recently
+    added or retrieved is evicted. The default size limit is infinity, so
+    there is no size limit unless this keyword argument is set to a positive
+    integer.
+
+    The number of lookups which found an entry, the number which did not, and
+    the number of entries evicted are counted in the :attr:`hits`,
+    :attr:`misses`, and :attr:`evictions` attributes, respectively.
+
+    Subclasses may override :meth:`evict`, which is called with each entry
+    as it is evicted.
+
+    """
+
+    def __init__(self, max_size=INFINITY):
+        self.max_size = max_size
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        """Returns the value for `key`, marking it as most recently used, as
+        :meth:`get` does, but raises :exc:`KeyError` if `key` is not in the
+        cache.
+
+        """
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def get(self, key, default=None):
+        """Returns the value for `key`, marking it as most recently used, or
+        `default` if `key` is not in the cache.
+
+        """
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Adds or replaces the entry for `key`, marking it as most recently
+        used, and evicts the least recently used entries if the cache has
+        grown too large.
+
+        """
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_size:
+            self.evict(*self.data.popitem(last=False))
+            self.evictions += 1
+
+    def peek(self, key, default=None):
+        """Returns the value for `key`, or `default` if `key` is not in the
+        cache, without marking it as used or counting a hit or a miss.
+
+        """
+        return self.data.get(key, default)
+
+    def pop(self, key, default=None):
+        """Removes the entry for `key` without counting it as an eviction, and
+        returns its value, or `default` if `key` is not in the cache.
+
+        """
+        return self.data.pop(key, default)
+
+    def clear(self):
+        """Removes all entries, without counting them as evictions."""
+        self.data.clear()
+
+    def evict(self, key, value):
+        """Called when the entry for `key` is evicted from the cache.
+
+        The entry has already been removed when this method is called. The
+        default implementation does nothing.
+
+        """
+        pass
+
+    def stats(self):
+        """Returns a dictionary containing the hit, miss, and eviction
+        counters and the current number of entries.
+
+        """
+        return dict(hits=self.hits, misses=self.misses,
+                    evictions=self.evictions, size=len(self.data))
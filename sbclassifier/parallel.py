@@ -0,0 +1,92 @@
+# parallel.py - training on a directory of messages with many processes
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+"""Tokenizing and training a corpus of message files on all processors.
+
+Most of the time spent training on a large archive goes to parsing and
+tokenizing the messages, which one process does on one processor at a
+time. :func:`count_directories` splits the message files into shards and
+has a pool of worker processes compute a
+:class:`~sbclassifier.classifiers.partial.PartialModel` for each shard; the
+partial models are merged as they arrive. :func:`train_directories` then
+applies the merged counts to a classifier in a single update.
+
+"""
+import multiprocessing
+import os
+
+from sbclassifier.classifiers.basic import USE_BIGRAMS
+from sbclassifier.classifiers.partial import PartialModel
+from sbclassifier.message import from_path as message_from_path
+from sbclassifier.tokenizer import tokenize
+
+#: The number of message files tokenized by a worker process at a time.
+SHARD_SIZE = 100
+
+
+def message_files(directory):
+    """Returns a sorted list of the names of the regular files in
+    `directory`, each of which is assumed to contain one message.
+
+    """
+    return sorted(entry.path for entry in os.scandir(directory)
+                  if entry.is_file())
+
+
+def count_files(shard, use_bigrams=USE_BIGRAMS):
+    """Returns the :class:`PartialModel` for a shard of message files.
+
+    `shard` is an iterable of ``(filename, is_spam)`` pairs.
+
+    """
+    return PartialModel.from_messages(
+        ((tokenize(message_from_path(filename)), is_spam)
+         for filename, is_spam in shard), use_bigrams)
+
+
+def _count_files(args):
+    # Pool.imap_unordered() passes a single argument.
+    return count_files(*args)
+
+
+def count_directories(spam_directory, ham_directory, processes=None,
+                      use_bigrams=USE_BIGRAMS, shard_size=SHARD_SIZE):
+    """Returns a :class:`PartialModel` for all the messages in the specified
+    directories of spam and ham, computed by `processes` worker processes.
+
+    Either directory may be ``None``. If `processes` is ``None``, one worker
+    process is started for each processor.
+
+    """
+    files = []
+    for directory, is_spam in (spam_directory, True), (ham_directory, False):
+        if directory is not None:
+            files.extend((name, is_spam) for name in message_files(directory))
+    shards = [(files[i:i + shard_size], use_bigrams)
+              for i in range(0, len(files), shard_size)]
+    result = PartialModel()
+    with multiprocessing.Pool(processes) as pool:
+        for model in pool.imap_unordered(_count_files, shards):
+            result.update(model)
+    return result
+
+
+def train_directories(classifier, spam_directory, ham_directory,
+                      processes=None, shard_size=SHARD_SIZE):
+    """Trains `classifier` on all the messages in the specified directories
+    of spam and ham, tokenizing them with `processes` worker processes, and
+    returns the :class:`PartialModel` that was applied.
+
+    The arguments are as for :func:`count_directories`. As with training,
+    call the ``store`` method of a stored classifier afterwards to save the
+    result.
+
+    """
+    model = count_directories(spam_directory, ham_directory, processes,
+                              classifier._use_bigrams, shard_size)
+    model.apply(classifier)
+    return model
@@ -5,17 +5,93 @@
 #
 # This file is part of sbclassifier, which is licensed under the Python
 # Software Foundation License; for more information, see LICENSE.txt.
+from contextlib import contextmanager
+import glob
+import os
 import pickle
-import shutil
+import tempfile
 
 from lockfile import FileLock
-from tempfile import NamedTemporaryFile
 
 
 #: The number of seconds for which to acquire a file lock. An exception is
 #: raised if the file is still locked after this number of seconds.
 DEFAULT_TIMEOUT = 20
 
+#: The size of the buffer through which pickles are written.
+BUFFER_SIZE = 1024 * 1024
+
+
+def _fsync_directory(dirname):
+    """Forces the entries of the directory `dirname` to disk, where the
+    operating system allows it.
+
+    """
+    try:
+        fd = os.open(dirname, os.O_RDONLY)
+    except OSError:
+        # Directories cannot be opened on Windows, where os.replace() is
+        # durable once it returns anyway.
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_open(filename, fsync=True):
+    """A context manager which returns a buffered binary file whose contents
+    replace the file named `filename` when the context exits without an
+    exception.
+
+    The data is written to a uniquely named temporary file in the same
+    directory, which is then renamed over `filename` with :func:`os.replace`,
+    so a crash at any point leaves either the old file or the new one in
+    full, and the data is never copied twice. If `fsync` is true, the
+    temporary file is forced to disk before it is renamed, and the directory
+    after. If the context exits with an exception, the temporary file is
+    removed and `filename` is not changed.
+
+    A process killed while writing leaves its temporary file behind; see
+    :func:`remove_stale_files`.
+
+    """
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.' + basename + '.',
+                                   suffix='.tmp')
+    try:
+        with open(fd, 'wb', buffering=BUFFER_SIZE) as f:
+            yield f
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmpname, filename)
+    except BaseException:
+        os.remove(tmpname)
+        raise
+    if fsync:
+        _fsync_directory(dirname)
+
+
+def remove_stale_files(filename):
+    """Removes the temporary files left behind by processes killed while
+    writing the file named `filename` with :func:`atomic_open`.
+
+    The caller must hold the lock on `filename`, so that no other write of
+    it is in progress; :func:`pickle_write` does this before each write.
+
+    """
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    pattern = glob.escape('.' + basename + '.') + '*.tmp'
+    for name in glob.glob(os.path.join(dirname, pattern)):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
 
 def pickle_read(filename):
     """Read pickle file contents with a lock."""
@@ -24,11 +100,19 @@ def pickle_read(filename):
             return pickle.load(f)
 
 
-def pickle_write(filename, value, protocol=pickle.HIGHEST_PROTOCOL):
-    """Store value as a pickle without creating corruption."""
+def pickle_write(filename, value, protocol=pickle.HIGHEST_PROTOCOL,
+                 fsync=True):
+    """Store value as a pickle without creating corruption.
+
+    The pickle is written with :func:`atomic_open`, so `filename` holds
+    either the old value or the new one even if the process is killed while
+    writing. `fsync` is as for :func:`atomic_open`; by default the pickle is
+    forced to disk before this function returns, which earlier versions did
+    not do, so callers which write often and can afford to lose the latest
+    value on a power failure may prefer to pass ``fsync=False``.
+
+    """
     with FileLock(filename, timeout=DEFAULT_TIMEOUT):
-        # Be as defensive as possible: dump the pickle data to a temporary file
-        # first, then move the data to the requested filename second.
-        with NamedTemporaryFile(delete=False) as fp:
-            pickle.dump(value, fp, protocol)
-        shutil.move(fp.name, filename)
+        remove_stale_files(filename)
+        with atomic_open(filename, fsync) as f:
+            pickle.dump(value, f, protocol)
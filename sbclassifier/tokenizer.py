@@ -23,6 +23,11 @@ import binascii
 
 from sbclassifier.dnsutils import dns_lookup
 from sbclassifier.dnsutils import reverse_dns_lookup
+from sbclassifier.instrumentation import clock
+from sbclassifier.instrumentation import PARSE
+from sbclassifier.instrumentation import timed_iter
+from sbclassifier.instrumentation import TOKENIZE_BODY
+from sbclassifier.instrumentation import TOKENIZE_HEADERS
 from sbclassifier.strippers import UUencodeStripper
 from sbclassifier.strippers import URLStripper
 from sbclassifier.strippers import StyleStripper
@@ -1121,17 +1126,36 @@ class Tokenizer:
                     "%d %b %Y %H:%M (%Z)",
                     "%d %b %Y %H:%M %Z")
 
+    # If this is not None, each call reports the time taken to parse the
+    # message and to generate the tokens of its headers and body to this
+    # sbclassifier.instrumentation.Instrument.
+    instrument = None
+
     def __init__(self):
         self.basic_skip = [re.compile(s) for s in BASIC_HEADER_SKIP]
 
     @convert_to_bytes
     def __call__(self, message, basic_header_tokenize=BASIC_HEADER_TOKENIZE,
                  basic_header_tokenize_only=BASIC_HEADER_TOKENIZE_ONLY):
+        instrument = self.instrument
+        if instrument is not None:
+            return self._instrumented_call(instrument, message)
         if isinstance(message, str):
             message = email.message_from_string(message)
         return itertools.chain(self.tokenize_headers(message),
                                self.tokenize_body(message))
 
+    def _instrumented_call(self, instrument, message):
+        if isinstance(message, str):
+            start = clock()
+            message = email.message_from_string(message)
+            instrument.record(PARSE, clock() - start)
+        return itertools.chain(
+            timed_iter(instrument, TOKENIZE_HEADERS,
+                       self.tokenize_headers(message)),
+            timed_iter(instrument, TOKENIZE_BODY,
+                       self.tokenize_body(message)))
+
     def tokenize_headers(self, msg,
                          basic_header_tokenize=BASIC_HEADER_TOKENIZE,
                          basic_header_tokenize_only=BASIC_HEADER_TOKENIZE_ONLY):
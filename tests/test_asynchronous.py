@@ -0,0 +1,95 @@
+# test_asynchronous.py - unit tests for the
+# sbclassifier.classifiers.asynchronous module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import random
+import threading
+import time
+
+from sbclassifier.classifiers.asynchronous import AsyncClassifier
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.tokenizer import tokenize
+
+WORDS = ('cheap pills offer winner money meeting lunch report notes agenda'
+         ' project budget').split()
+
+
+def messages(n):
+    rng = random.Random(0)
+    result = []
+    for i in range(n):
+        body = ' '.join(rng.choice(WORDS) for _ in range(20))
+        result.append(('Subject: message {}\n\n{}\n'.format(i, body),
+                       i % 3 == 0))
+    return result
+
+
+class StoringClassifier(Classifier):
+    """A classifier whose store() records the state it stored."""
+
+    def __init__(self):
+        super().__init__()
+        self.stored = []
+        self.storing = threading.Lock()
+
+    def store(self):
+        assert self.storing.acquire(blocking=False)
+        time.sleep(0.02)
+        self.stored.append(self.nspam + self.nham)
+        self.storing.release()
+
+
+def test_concurrent_use():
+    corpus = messages(40)
+    expected = Classifier()
+    for message, is_spam in corpus:
+        expected.learn(tokenize(message), is_spam)
+
+    async def run():
+        classifier = AsyncClassifier(Classifier(),
+                                     executor=ThreadPoolExecutor(4))
+        await asyncio.gather(*[classifier.learn(message, is_spam)
+                               for message, is_spam in corpus])
+        scores = await asyncio.gather(*[classifier.score(message, True)
+                                        for message, _ in corpus])
+        await classifier.close()
+        return classifier.classifier, scores
+
+    actual, scores = asyncio.run(run())
+    assert (actual.nspam, actual.nham) == (expected.nspam, expected.nham)
+    assert set(actual._wordinfokeys()) == set(expected._wordinfokeys())
+    for word in expected._wordinfokeys():
+        assert (actual._wordinfoget(word).__getstate__() ==
+                expected._wordinfoget(word).__getstate__())
+    assert scores == [expected.spamprob(tokenize(message), True)
+                      for message, _ in corpus]
+
+
+def test_store_coalescing():
+    corpus = messages(3)
+
+    async def run():
+        classifier = AsyncClassifier(StoringClassifier())
+        await classifier.learn(*corpus[0])
+        first = asyncio.ensure_future(classifier.store())
+        # Let the first store start.
+        while classifier._current_store is None:
+            await asyncio.sleep(0)
+        await classifier.learn(*corpus[1])
+        # These all arrive while the first store is in progress, so they
+        # share one more store, which includes the second message.
+        await asyncio.gather(first, *[classifier.store() for _ in range(10)])
+        assert classifier.stores == 2
+        assert classifier.classifier.stored == [1, 2]
+        await classifier.learn(*corpus[2])
+        await classifier.store()
+        assert classifier.classifier.stored == [1, 2, 3]
+        await classifier.close()
+
+    asyncio.run(run())
@@ -0,0 +1,37 @@
+# test_bloomfilter.py - unit tests for the sbclassifier.bloomfilter module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import unittest
+
+from sbclassifier.bloomfilter import BloomFilter
+
+
+class BloomFilterTest(unittest.TestCase):
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(capacity=10000, error_rate=0.01)
+        added = ['added{}'.format(i) for i in range(10000)]
+        for item in added:
+            bloom.add(item)
+        # There are no false negatives.
+        assert all(item in bloom for item in added)
+        # The false positive rate is close to the one requested.
+        others = ['other{}'.format(i) for i in range(10000)]
+        false_positives = sum(item in bloom for item in others)
+        assert false_positives < 200
+        # About 9.6 bits per item for a 1% error rate.
+        assert len(bloom.bits) < 10000 * 10 / 8
+
+    def test_invalid_arguments(self):
+        for capacity, error_rate in ((100, 0), (100, 1), (100, -0.5),
+                                     (0, 0.01), (-1, 0.01)):
+            with self.assertRaises(ValueError):
+                BloomFilter(capacity, error_rate)
+        # The smallest filter still works.
+        bloom = BloomFilter(1)
+        bloom.add('item')
+        assert 'item' in bloom
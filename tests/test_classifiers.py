@@ -5,8 +5,21 @@
 #
 # This file is part of sbclassifier, which is licensed under the Python
 # Software Foundation License; for more information, see LICENSE.txt.
+import decimal
+import math
+import random
+
 from sbclassifier import Classifier
+from sbclassifier.bloomfilter import BloomFilter
+from sbclassifier.classifiers.basic import chi2Q
+from sbclassifier.classifiers.basic import chi2Q_many
+from sbclassifier.classifiers.basic import classify_probability
+from sbclassifier.classifiers.basic import MAX_DISCRIMINATORS
+from sbclassifier.classifiers.basic import numpy_is_available
+from sbclassifier.classifiers.basic import PROBCACHE_TABLES
+from sbclassifier.classifiers.basic import WordInfo
 from sbclassifier.classifiers.constants import HAM_CUTOFF
+from sbclassifier.classifiers.constants import SPAM
 from sbclassifier.classifiers.constants import SPAM_CUTOFF
 
 
@@ -32,3 +45,252 @@ def test_bigrams():
     assert SPAM_CUTOFF <= probability
     probability = classifier.spamprob(['dog', 'sloth', 'koala'])
     assert probability <= HAM_CUTOFF
+
+
+def test_bigrams_from_iterator():
+    classifier = Classifier(use_bigrams=True)
+    classifier.learn_spam(iter('a b c a b'.split()))
+    assert sorted(classifier._wordinfokeys()) == sorted(
+        ['a', 'b', 'c', 'bi:a b', 'bi:b c', 'bi:c a'])
+
+
+def test_bigrams_last_unigram():
+    # Earlier versions dropped the last token of the message when training
+    # with bigrams; it is now counted like every other token.
+    classifier = Classifier(use_bigrams=True)
+    classifier.learn_spam('a b c'.split())
+    assert classifier._wordinfoget('c').__getstate__() == (1, 0)
+    assert sorted(classifier._wordinfokeys()) == sorted(
+        ['a', 'b', 'c', 'bi:a b', 'bi:b c'])
+
+
+def test_bigram_clues():
+    classifier = Classifier(use_bigrams=True)
+    for i in range(5):
+        classifier.learn_spam('buy cheap pills now'.split())
+        classifier.learn_ham('meeting notes for now'.split())
+    wordstream = 'buy cheap buy cheap pills meeting now'.split()
+    prob, clues = classifier.spamprob(iter(wordstream), evidence=True)
+    assert (prob, clues) == classifier.spamprob(wordstream, evidence=True)
+    # Only the first occurrence of each word is a candidate, and each token
+    # contributes to at most one clue.
+    words = [word for word, p in clues]
+    assert len(words) == len(set(words))
+    assert 'buy' in words or 'bi:buy cheap' in words
+    assert not {'buy', 'bi:buy cheap'} <= set(words)
+    assert not {'bi:cheap pills', 'pills'} <= set(words)
+    assert 'meeting' in words or 'bi:pills meeting' in words
+
+
+def test_seen_filter():
+    rng = random.Random(0)
+    classifier = Classifier()
+    for i in range(20):
+        classifier.learn(['token{}'.format(rng.randrange(1000))
+                          for _ in range(200)], i % 2 == 0)
+    wordstream = ['token{}'.format(rng.randrange(1200)) for _ in range(5000)]
+    expected = classifier.spamprob(wordstream, evidence=True)
+    classifier.seen_filter = set
+    assert classifier.spamprob(iter(wordstream), evidence=True) == expected
+    # A Bloom filter large enough for the message almost never skips a
+    # token, so the score is almost always the same.
+    classifier.seen_filter = lambda: BloomFilter(10000, 1e-9)
+    assert classifier.spamprob(iter(wordstream), evidence=True) == expected
+
+
+def test_spamprob_many():
+    ham_strings = 'dog cat horse sloth koala'.split()
+    spam_strings = 'shark raptor bear spider cockroach'.split()
+    classifier = Classifier()
+    for i in range(20):
+        classifier.learn_ham(ham_strings + ['ham{}'.format(i)])
+        classifier.learn_spam(spam_strings + ['spam{}'.format(i)])
+    wordstreams = [['shark', 'bear', 'spider'], ['dog', 'sloth', 'koala'],
+                   [], ['unknown'], ['dog', 'shark', 'cat', 'raptor'],
+                   ['ham{}'.format(i) for i in range(20)] + spam_strings,
+                   ['spam{}'.format(i) for i in range(20)]]
+    expected = [classifier.spamprob(w, evidence=True) for w in wordstreams]
+    actual = classifier.spamprob_many(wordstreams, evidence=True)
+    assert len(actual) == len(expected)
+    for (prob1, clues1), (prob2, clues2) in zip(expected, actual):
+        assert abs(prob1 - prob2) <= 1e-12
+        assert [w for w, p in clues1] == [w for w, p in clues2]
+        for (w1, p1), (w2, p2) in zip(clues1, clues2):
+            assert abs(p1 - p2) <= 1e-12
+    probs = classifier.spamprob_many(wordstreams)
+    assert probs == [prob for prob, clues in actual]
+    assert classifier.spamprob_many([]) == []
+
+
+def test_probcache():
+    classifier = Classifier(probcache_size=4)
+    classifier.learn_ham(['a', 'b'])
+    classifier.learn_spam(['a', 'b', 'c'])
+    record = classifier._wordinfoget('a')
+    prob = classifier.probability(record)
+    assert (classifier.probcache_hits, classifier.probcache_misses) == (0, 1)
+    # 'b' has the same counts as 'a', so it uses the same cache entry.
+    assert classifier.probability(classifier._wordinfoget('b')) == prob
+    assert (classifier.probcache_hits, classifier.probcache_misses) == (1, 1)
+    # Training changes the message totals, so the stale entry is not used...
+    classifier.learn_ham(['e'])
+    assert classifier.probability(record) != prob
+    assert (classifier.probcache_hits, classifier.probcache_misses) == (1, 2)
+    # ...but it is not discarded either, so it is used again once the
+    # classifier returns to the same totals.
+    classifier.unlearn_ham(['e'])
+    assert classifier.probability(record) == prob
+    assert (classifier.probcache_hits, classifier.probcache_misses) == (2, 2)
+    # Neither a table nor the number of tables grows beyond its maximum size.
+    for i in range(10):
+        classifier.learn_spam(['x'])
+        classifier.probability(record)
+    assert len(classifier._probcaches) < PROBCACHE_TABLES
+    # A full table evicts its least recently used entry, so a word used
+    # all along stays cached.
+    classifier.probability(record)
+    hits = classifier.probcache_hits
+    misses = classifier.probcache_misses
+    for i in range(10):
+        classifier.probability(WordInfo(i + 2, 1))
+        classifier.probability(record)
+        assert len(classifier._probcache) <= 4
+    assert classifier.probcache_hits == hits + 10
+    assert classifier.probcache_misses == misses + 10
+
+
+def test_heap_clue_selection():
+    import sbclassifier.classifiers.basic as basic
+    classifier = Classifier()
+    # Many words with identical counts produce many ties in distance and
+    # probability, which must be broken in the same way by both strategies.
+    for i in range(10):
+        words = ['word{}'.format(j) for j in range(i * 100, i * 100 + 400)]
+        classifier.learn(words, i % 3 == 0)
+    message = ['word{}'.format(j) for j in range(1500)]
+    threshold = basic.HEAP_SELECTION_THRESHOLD
+    try:
+        basic.HEAP_SELECTION_THRESHOLD = len(message)
+        sorted_clues = classifier._getclues(message)
+        basic.HEAP_SELECTION_THRESHOLD = 0
+        heap_clues = classifier._getclues(message)
+    finally:
+        basic.HEAP_SELECTION_THRESHOLD = threshold
+    assert len(sorted_clues) == basic.MAX_DISCRIMINATORS
+    assert heap_clues == sorted_clues
+
+
+def test_learn_many():
+    messages = [('dog cat horse'.split(), False),
+                ('shark raptor dog'.split(), True),
+                ('dog dog sloth'.split(), False),
+                ('shark bear'.split(), True)]
+    one_at_a_time = Classifier()
+    for wordstream, is_spam in messages:
+        one_at_a_time.learn(wordstream, is_spam)
+    bulk = Classifier()
+    bulk.learn_many(iter(messages))
+    assert (bulk.nspam, bulk.nham) == (2, 2)
+    assert bulk.wordinfo.keys() == one_at_a_time.wordinfo.keys()
+    for word, record in one_at_a_time.wordinfo.items():
+        assert bulk.wordinfo[word].__getstate__() == record.__getstate__()
+
+    bulk.unlearn_many(messages[:3])
+    assert (bulk.nspam, bulk.nham) == (1, 0)
+    assert sorted(bulk.wordinfo) == ['bear', 'shark']
+    # Nothing is changed if a count would go negative.
+    try:
+        bulk.unlearn_many(messages)
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError not raised'
+    assert (bulk.nspam, bulk.nham) == (1, 0)
+
+
+def _reference_chi2Q(x2, v):
+    # The straightforward summation of the whole series, as chi2Q() was
+    # originally implemented.
+    m = x2 / 2
+    result = term = math.exp(-m)
+    for i in range(1, v // 2):
+        term *= m / i
+        result += term
+    return min(result, 1.0)
+
+
+def _exact_chi2Q(x2, v):
+    # The same series summed with 50 significant digits.
+    with decimal.localcontext() as context:
+        context.prec = 50
+        m = decimal.Decimal(x2) / 2
+        result = term = decimal.Decimal(1)
+        for i in range(1, v // 2):
+            term = term * m / i
+            result += term
+        return float(result * (-m).exp())
+
+
+def test_chi2Q_accuracy():
+    rng = random.Random(0)
+    for v in range(2, 302, 2):
+        m = v / 2
+        values = [0, 1e-3, 0.5, 1, m / 2, m - 1, m, m + 1, 2 * m, 4 * m,
+                  1000, 1380]
+        values.extend(rng.uniform(0, 2000) for i in range(10))
+        for x2 in values:
+            actual = chi2Q(x2, v)
+            if x2 / 2 < v // 2 - 1:
+                # Stopping the summation early gives exactly the same result.
+                assert actual == _reference_chi2Q(x2, v)
+            # Subnormal results can only be accurate to within a few units
+            # of the smallest subnormal number.
+            expected = _exact_chi2Q(x2, v)
+            assert abs(actual - expected) <= 1e-12 * expected + 1e-320
+    try:
+        chi2Q(1, 3)
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError not raised'
+
+
+def test_chi2Q_many():
+    if not numpy_is_available:
+        return
+    x2 = [0, 0.5, 10, 100, 299, 300, 301, 1000, 1380, 3000]
+    for v in 2, 4, 40, 150, 300:
+        actual = chi2Q_many(x2, [v] * len(x2))
+        for x, a in zip(x2, actual):
+            expected = chi2Q(x, v)
+            assert abs(a - expected) <= 1e-13 * expected
+
+
+def test_classify_early_exit():
+    classifier = Classifier()
+    rng = random.Random(0)
+    hammy = ['ham{}'.format(i) for i in range(300)]
+    spammy = ['spam{}'.format(i) for i in range(300)]
+    for i in range(40):
+        classifier.learn_ham(rng.sample(hammy, 100))
+        classifier.learn_spam(rng.sample(spammy, 100))
+    # An overwhelmingly spammy message is decided before all of its clues
+    # are evaluated.
+    result = classifier.classify(spammy, early_exit=True)
+    assert result.classification == SPAM
+    assert result.early
+    assert result.nclues < MAX_DISCRIMINATORS
+    prob = classifier.spamprob(spammy)
+    assert result.low <= prob + 1e-12 and prob - 1e-12 <= result.high
+    result = classifier.classify(spammy)
+    assert not result.early
+    assert result.nclues == MAX_DISCRIMINATORS
+    assert result.low == result.high == classifier.spamprob(spammy)
+    # The verdict is always the same as that of the full computation.
+    for i in range(50):
+        message = (rng.sample(hammy, rng.randint(0, 100)) +
+                   rng.sample(spammy, rng.randint(0, 100)))
+        prob = classifier.spamprob(message)
+        result = classifier.classify(message, early_exit=True)
+        assert result.classification == classify_probability(prob)
+        assert result.low <= prob + 1e-12 and prob - 1e-12 <= result.high
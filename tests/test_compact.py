@@ -0,0 +1,66 @@
+# test_compact.py - unit tests for the sbclassifier.classifiers.compact module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import pickle
+
+from sbclassifier import Classifier
+from sbclassifier.classifiers.compact import ArrayWordInfoStore
+from sbclassifier.classifiers.compact import CompactClassifier
+from sbclassifier.classifiers.compact import WordInfoView
+
+
+def test_store():
+    store = ArrayWordInfoStore()
+    words = ['word{}'.format(i) for i in range(1000)]
+    for i, word in enumerate(words):
+        store[word] = WordInfoView(i, i + 1)
+    assert len(store) == 1000
+    for i, word in enumerate(words):
+        record = store[word]
+        assert (record.spamcount, record.hamcount) == (i, i + 1)
+    # Views write through to the store.
+    store['word3'].spamcount += 10
+    assert store['word3'].spamcount == 13
+    # Deleted ids are reused, and other words are unaffected.
+    for word in words[::2]:
+        del store[word]
+    assert len(store) == 500
+    assert store.get('word0') is None
+    assert 'word0' not in store and 'word1' in store
+    store.set_counts('new', 7, 8)
+    assert store.id('new') < 1000
+    assert store['new'].__getstate__() == (7, 8)
+    assert store['word999'].__getstate__() == (999, 1000)
+    assert set(store) == set(words[1::2]) | {'new'}
+
+
+def test_store_pickle():
+    store = ArrayWordInfoStore()
+    store.set_counts('a', 1, 2)
+    store.set_counts('b', 3, 4)
+    del store['a']
+    copy = pickle.loads(pickle.dumps(store))
+    assert list(copy) == ['b']
+    assert copy['b'].__getstate__() == (3, 4)
+
+
+def test_classifier():
+    ham_strings = 'dog cat horse sloth koala'.split()
+    spam_strings = 'shark raptor bear spider cockroach'.split()
+    basic = Classifier()
+    compact = CompactClassifier()
+    for classifier in basic, compact:
+        classifier.learn_ham(ham_strings)
+        classifier.learn_ham(ham_strings[:2])
+        classifier.learn_spam(spam_strings)
+        classifier.unlearn_ham(ham_strings[:2])
+    for wordstream in ham_strings, spam_strings, ham_strings + spam_strings:
+        assert basic.spamprob(wordstream) == compact.spamprob(wordstream)
+    assert sorted(basic._wordinfokeys()) == sorted(compact._wordinfokeys())
+    copy = CompactClassifier()
+    copy.__setstate__(pickle.loads(pickle.dumps(compact.__getstate__())))
+    assert copy.spamprob(spam_strings) == compact.spamprob(spam_strings)
@@ -0,0 +1,97 @@
+# test_frozen.py - unit tests for the sbclassifier.classifiers.frozen module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import os
+import tempfile
+import threading
+import unittest
+
+from sbclassifier import Classifier
+from sbclassifier.classifiers.frozen import export
+from sbclassifier.classifiers.frozen import FrozenClassifier
+
+
+class FrozenClassifierTest(unittest.TestCase):
+
+    def test_frozen(self):
+        classifier = Classifier()
+        classifier.learn_spam('cheap pills buy now'.split())
+        classifier.learn_ham('meeting agenda attached'.split())
+        classifier.learn_ham([b'bytes', 'unicode é'])
+        messages = [['cheap', 'meeting', 'unknown'], ['pills', 'agenda'],
+                    [b'bytes'], ['unicode é']]
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'model')
+            export(classifier, filename)
+            frozen = FrozenClassifier(filename)
+            assert (frozen.nspam, frozen.nham) == (1, 2)
+            for message in messages:
+                assert (frozen.spamprob(message, evidence=True) ==
+                        classifier.spamprob(message, evidence=True))
+            assert sorted(frozen._wordinfokeys(), key=repr) == \
+                sorted(classifier._wordinfokeys(), key=repr)
+            with self.assertRaises(TypeError):
+                frozen.learn_spam(['spam'])
+            # Replacing the file does not affect a classifier which has it
+            # open.
+            classifier.learn_spam('cheap pills'.split())
+            export(classifier, filename)
+            assert frozen.nspam == 1
+            assert FrozenClassifier(filename).nspam == 2
+            frozen.close()
+            assert os.listdir(dirname) == ['model']
+
+    def test_concurrent_exports(self):
+        classifiers = []
+        for i in range(4):
+            classifier = Classifier()
+            for j in range(i + 1):
+                start = 1000 * j
+                classifier.learn_spam(['word{}'.format(k)
+                                       for k in range(start, start + 500)])
+            classifiers.append(classifier)
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'model')
+
+            def run(classifier):
+                for i in range(2):
+                    export(classifier, filename)
+
+            threads = [threading.Thread(target=run, args=(classifier, ))
+                       for classifier in classifiers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # The file is one of the databases in full.
+            frozen = FrozenClassifier(filename)
+            assert 1 <= frozen.nspam <= 4
+            assert len(frozen._wordinfokeys()) == 500 * frozen.nspam
+            frozen.close()
+            assert os.listdir(dirname) == ['model']
+
+    def test_not_a_model(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'not a model' * 10)
+            f.flush()
+            with self.assertRaises(ValueError):
+                FrozenClassifier(f.name)
+
+    def test_truncated(self):
+        classifier = Classifier()
+        classifier.learn(['some', 'simple', 'tokens'], True)
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'model')
+            export(classifier, filename)
+            with open(filename, 'rb') as f:
+                data = f.read()
+            # Cut off within the header, and within the sections after it.
+            for size in 8, len(data) - 8:
+                with open(filename, 'wb') as f:
+                    f.write(data[:size])
+                with self.assertRaises(ValueError):
+                    FrozenClassifier(filename)
@@ -0,0 +1,71 @@
+# test_hashing.py - unit tests for the sbclassifier.classifiers.hashing module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import pickle
+import unittest
+
+from sbclassifier import Classifier
+from sbclassifier.classifiers.hashing import bucket
+from sbclassifier.classifiers.hashing import HashingClassifier
+from sbclassifier.classifiers.pruning import HapaxAgePolicy
+from sbclassifier.classifiers.pruning import Pruner
+
+
+class HashingClassifierTest(unittest.TestCase):
+
+    def test_bucket(self):
+        assert bucket('word', 1000) == bucket('word', 1000)
+        assert 0 <= bucket(b'word', 7) < 7
+        assert bucket('word', 1) == 0
+        # str and bytes tokens with the same encoding are different tokens.
+        assert bucket('word', 2 ** 32) != bucket(b'word', 2 ** 32)
+
+    def test_classifier(self):
+        ham_strings = 'dog cat horse sloth koala'.split()
+        spam_strings = 'shark raptor bear spider cockroach'.split()
+        basic = Classifier()
+        hashing = HashingClassifier(2 ** 16)
+        for classifier in basic, hashing:
+            classifier.learn_ham(ham_strings)
+            classifier.learn_ham(ham_strings[:2])
+            classifier.learn_spam(spam_strings)
+            classifier.learn_many([(spam_strings[:3], True)])
+            classifier.unlearn_ham(ham_strings[:2])
+        # There are no collisions among so few tokens in so many buckets.
+        message = ham_strings[:3] + spam_strings[:1] + ['unknown']
+        prob, evidence = hashing.spamprob(message, evidence=True)
+        assert (prob, evidence) == basic.spamprob(message, evidence=True)
+        # The evidence names the original tokens.
+        assert set(word for word, p in evidence) >= set(ham_strings[:3])
+        assert hashing._wordinfoget('unknown') is None
+        hashing.unlearn_spam(spam_strings)
+        hashing.unlearn_many([(spam_strings[:3], True)])
+        assert hashing._wordinfoget('shark') is None
+        assert hashing._wordinfoget('dog').__getstate__() == (0, 1)
+        with self.assertRaises(TypeError):
+            hashing._wordinfokeys()
+        with self.assertRaises(TypeError):
+            Pruner(hashing, HapaxAgePolicy(1))
+
+    def test_collisions(self):
+        classifier = HashingClassifier(1)
+        classifier.learn_spam(['a', 'b', 'c'])
+        classifier.learn_ham(['d'])
+        # Every token shares the only bucket, which is counted once per
+        # message.
+        assert classifier._wordinfoget('z').__getstate__() == (1, 1)
+        assert len(classifier.wordinfo) == 1
+        assert classifier.wordinfo.size == 8
+
+    def test_pickle(self):
+        classifier = HashingClassifier(100)
+        classifier.learn_spam(['spam', 'eggs'])
+        copy = HashingClassifier(1)
+        state = pickle.dumps(classifier.__getstate__())
+        copy.__setstate__(pickle.loads(state))
+        assert copy.nbuckets == 100
+        assert copy.spamprob(['spam']) == classifier.spamprob(['spam'])
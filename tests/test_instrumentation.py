@@ -0,0 +1,142 @@
+# test_instrumentation.py - unit tests for the sbclassifier.instrumentation
+# module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import random
+import unittest
+
+from sbclassifier import Classifier
+from sbclassifier.instrumentation import CLUES
+from sbclassifier.instrumentation import COMBINE
+from sbclassifier.instrumentation import LatencyCollector
+from sbclassifier.instrumentation import LatencyHistogram
+from sbclassifier.instrumentation import LOOKUP
+from sbclassifier.instrumentation import LOOKUPS
+from sbclassifier.instrumentation import PARSE
+from sbclassifier.instrumentation import PROBCACHE_HITS
+from sbclassifier.instrumentation import PROBCACHE_MISSES
+from sbclassifier.instrumentation import SPAMPROB
+from sbclassifier.instrumentation import TOKENIZE_BODY
+from sbclassifier.instrumentation import TOKENIZE_HEADERS
+from sbclassifier.instrumentation import TOKENS
+from sbclassifier.tokenizer import Tokenizer
+
+MESSAGE = """From: someone@example.com
+To: someone.else@example.com
+Subject: lunch tomorrow
+
+Shall we meet at the usual place at noon?
+"""
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = LatencyHistogram(precision=8)
+        assert histogram.percentile(50) is None
+        assert histogram.mean is None
+        rng = random.Random(0)
+        values = sorted(rng.randrange(10 ** 9) for _ in range(10000))
+        for value in values:
+            histogram.record(value)
+        assert histogram.total_count == len(values)
+        assert histogram.min == values[0]
+        assert histogram.max == values[-1]
+        assert histogram.mean == sum(values) / len(values)
+        for p in 50, 90, 99, 99.9:
+            exact = values[int(len(values) * p / 100) - 1]
+            assert exact <= histogram.percentile(p) <= exact * (1 + 2 ** -7)
+        assert histogram.percentile(100) == values[-1]
+        # Small values are counted exactly.
+        small = LatencyHistogram(precision=8)
+        for value in range(256):
+            small.record(value)
+        assert small.percentile(50) == 127
+
+    def test_histogram_update(self):
+        first = LatencyHistogram()
+        second = LatencyHistogram()
+        both = LatencyHistogram()
+        for value in range(0, 10000, 7):
+            first.record(value)
+            both.record(value)
+        for value in range(5, 100000, 11):
+            second.record(value)
+            both.record(value)
+        first.update(second)
+        assert first.counts == both.counts
+        assert (first.total_count, first.total, first.min, first.max) == \
+            (both.total_count, both.total, both.min, both.max)
+        with self.assertRaises(ValueError):
+            first.update(LatencyHistogram(precision=4))
+
+    def test_classifier_instrumentation(self):
+        classifier = Classifier()
+        classifier.learn_spam(['buy', 'cheap', 'pills'])
+        classifier.learn_ham(['meeting', 'notes', 'pills'])
+        wordstream = ['buy', 'meeting', 'unknown', 'buy']
+        expected = classifier.spamprob(wordstream, evidence=True)
+        collector = LatencyCollector()
+        classifier.instrument = collector
+        assert classifier.spamprob(wordstream, evidence=True) == expected
+        assert classifier.spamprob(iter(wordstream)) == expected[0]
+        assert set(collector.histograms) == {SPAMPROB, CLUES, LOOKUP, COMBINE}
+        for stage in SPAMPROB, CLUES, LOOKUP, COMBINE:
+            assert collector.histograms[stage].total_count == 2
+        spamprob = collector.histograms[SPAMPROB]
+        clues = collector.histograms[CLUES]
+        lookup = collector.histograms[LOOKUP]
+        assert spamprob.total >= clues.total >= lookup.total
+        # Each distinct word is looked up once per call, and the probabilities
+        # of the known ones are cached after the first call.
+        assert collector.counters[LOOKUPS] == 6
+        assert collector.counters[PROBCACHE_HITS] + \
+            collector.counters[PROBCACHE_MISSES] == 4
+        assert collector.counters[PROBCACHE_HITS] >= 2
+        # Instrumenting one instance leaves the others alone.
+        assert Classifier.instrument is None
+
+    def test_bigram_instrumentation(self):
+        classifier = Classifier(use_bigrams=True)
+        classifier.learn_spam(['buy', 'cheap', 'pills'])
+        collector = LatencyCollector()
+        classifier.instrument = collector
+        classifier.spamprob(['buy', 'cheap', 'pills'])
+        # Three unigrams and two bigrams.
+        assert collector.counters[LOOKUPS] == 5
+
+    def test_tokenizer_instrumentation(self):
+        tokenizer = Tokenizer()
+        expected = list(tokenizer(MESSAGE))
+        collector = LatencyCollector()
+        tokenizer.instrument = collector
+        assert list(tokenizer(MESSAGE)) == expected
+        assert collector.counters[TOKENS] == len(expected)
+        for stage in PARSE, TOKENIZE_HEADERS, TOKENIZE_BODY:
+            assert collector.histograms[stage].total_count == 1
+
+    def test_stage_and_dump(self):
+        collector = LatencyCollector()
+        with collector.stage('mime'):
+            pass
+        collector.record('mime', 1500)
+        collector.count(LOOKUPS, 3)
+        assert collector.histograms['mime'].total_count == 2
+        lines = collector.dump().splitlines()
+        assert lines[0].split() == ['stage', 'count', 'mean', 'p50', 'p90',
+                                    'p99', 'p99.9', 'max']
+        assert lines[1].split()[:2] == ['mime', '2']
+        assert lines[1].split()[-1] == '1.5'
+        assert lines[2].split() == ['lookups', '3']
+        other = LatencyCollector()
+        other.record('mime', 10)
+        other.count(LOOKUPS)
+        collector.update(other)
+        assert collector.histograms['mime'].total_count == 3
+        assert collector.counters[LOOKUPS] == 4
+        collector.reset()
+        assert collector.dump().splitlines()[1:] == []
@@ -0,0 +1,130 @@
+# test_layered.py - unit tests for the sbclassifier.classifiers.layered module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import pickle
+import unittest
+
+from sbclassifier import Classifier
+from sbclassifier.classifiers.layered import LAYER_PROBCACHE_SIZE
+from sbclassifier.classifiers.layered import LayeredClassifier
+from sbclassifier.classifiers.packed import pack
+from sbclassifier.classifiers.packed import PackedClassifier
+
+SHARED = [('cheap pills buy now'.split(), True),
+          ('meeting agenda attached'.split(), False),
+          ('buy cheap watches'.split(), True),
+          ('lunch meeting tomorrow'.split(), False)]
+
+OWN = [('agenda for the pills trial'.split(), False),
+       ('buy my band tickets'.split(), False),
+       ('watches and tickets cheap'.split(), True)]
+
+MESSAGES = [message for message, is_spam in SHARED + OWN] + [['unknown']]
+
+
+def check_layered(packed):
+    """Checks a layer over a base trained on `SHARED`, packed if `packed`
+    is true.
+
+    """
+    base = Classifier()
+    base.learn_many(SHARED)
+    if packed:
+        base = PackedClassifier(bytes(pack(base)))
+    layered = LayeredClassifier(base)
+    for message, is_spam in OWN:
+        layered.learn(message, is_spam)
+    expected = Classifier()
+    expected.learn_many(SHARED + OWN)
+    assert (layered.nspam, layered.nham) == (expected.nspam, expected.nham)
+    assert (layered.own_nspam, layered.own_nham) == (1, 2)
+    for message in MESSAGES:
+        assert (layered.spamprob(message, evidence=True) ==
+                expected.spamprob(message, evidence=True))
+    assert sorted(layered._wordinfokeys()) == sorted(expected._wordinfokeys())
+    # The layer holds only the words of its own training.
+    assert set(layered.wordinfo) == set().union(*(m for m, s in OWN))
+    # The base is unchanged.
+    assert (base.nspam, base.nham) == (2, 2)
+    assert base._wordinfoget('cheap').__getstate__() == (2, 0)
+
+
+class LayeredClassifierTest(unittest.TestCase):
+
+    def test_layered(self):
+        check_layered(False)
+
+    def test_layered_packed(self):
+        check_layered(True)
+
+    def test_unlearn_base_message(self):
+        base = Classifier()
+        base.learn_many(SHARED)
+        layered = LayeredClassifier(base)
+        layered.unlearn(*SHARED[0])
+        assert (layered.nspam, layered.own_nspam) == (1, -1)
+        assert layered._wordinfoget('pills') is None
+        assert layered._wordinfoget('cheap').__getstate__() == (1, 0)
+        assert 'pills' not in layered._wordinfokeys()
+        # Learning the message again cancels out the layer.
+        layered.learn(*SHARED[0])
+        assert layered.wordinfo == {}
+        assert (layered.nspam, layered.own_nspam) == (2, 0)
+        assert base._wordinfoget('pills').__getstate__() == (1, 0)
+
+    def test_pickle_and_replace_base(self):
+        base = Classifier()
+        base.learn_many(SHARED[:2])
+        layered = LayeredClassifier(base)
+        layered.learn_many(OWN)
+        state = pickle.loads(pickle.dumps(layered.__getstate__()))
+        # The layer is applied to a newer base.
+        newbase = Classifier()
+        newbase.learn_many(SHARED)
+        restored = LayeredClassifier(newbase)
+        restored.__setstate__(state)
+        expected = Classifier()
+        expected.learn_many(SHARED + OWN)
+        assert ((restored.nspam, restored.nham) ==
+                (expected.nspam, expected.nham))
+        for message in MESSAGES:
+            assert restored.spamprob(message) == expected.spamprob(message)
+
+    def test_layer_probcache(self):
+        base = Classifier()
+        base.learn_many(SHARED)
+        layered = LayeredClassifier(base)
+        for message, is_spam in OWN:
+            layered.learn(message, is_spam)
+            for message in MESSAGES:
+                layered.spamprob(message)
+        # Only the table for the current totals is kept.
+        assert layered._probcaches == {}
+        assert len(layered._probcache) <= LAYER_PROBCACHE_SIZE
+
+    def test_replace_base_after_unlearning(self):
+        base = Classifier()
+        base.learn_many(SHARED)
+        layered = LayeredClassifier(base)
+        layered.unlearn(*SHARED[0])
+        layered.unlearn(*SHARED[2])
+        # The new base holds none of the un-learned spam.
+        smaller = Classifier()
+        smaller.learn_many(SHARED[1:2])
+        layered.base = smaller
+        assert (layered.nspam, layered.nham) == (0, 1)
+        assert layered._wordinfoget('pills') is None
+        assert layered._wordinfoget('cheap') is None
+        assert 'cheap' not in layered._wordinfokeys()
+        assert layered._wordinfoget('meeting').__getstate__() == (0, 1)
+        for message in MESSAGES:
+            assert 0 <= layered.spamprob(message) <= 1
+        # Training starts again from the clamped counts.
+        layered.learn_spam(['cheap', 'meeting'])
+        assert layered.nspam == 1
+        assert layered._wordinfoget('cheap').__getstate__() == (1, 0)
+        assert layered._wordinfoget('meeting').__getstate__() == (1, 1)
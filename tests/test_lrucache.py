@@ -0,0 +1,48 @@
+# test_lrucache.py - unit tests for the sbclassifier.lrucache module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import unittest
+
+from sbclassifier.lrucache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        evicted = []
+
+        class RecordingCache(LRUCache):
+            def evict(self, key, value):
+                evicted.append((key, value))
+
+        cache = RecordingCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        # Retrieving 'a' makes 'b' the least recently used entry.
+        assert cache.get('a') == 1
+        cache.put('c', 3)
+        assert evicted == [('b', 2)]
+        assert cache.get('b') is None
+        assert list(cache) == ['a', 'c']
+        assert cache.stats() == dict(hits=1, misses=1, evictions=1, size=2)
+        assert cache.pop('a') == 1
+        assert cache.evictions == 1
+
+    def test_mapping_methods(self):
+        cache = LRUCache(max_size=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        assert cache['a'] == 1
+        # Peeking does not make 'b' the most recently used entry.
+        assert cache.peek('b') == 2
+        cache['c'] = 3
+        assert list(cache) == ['a', 'c']
+        with self.assertRaises(KeyError):
+            cache['b']
+        del cache['a']
+        assert list(cache) == ['c']
+        assert cache.stats() == dict(hits=1, misses=1, evictions=1, size=1)
@@ -0,0 +1,49 @@
+# test_parallel.py - unit tests for the sbclassifier.parallel module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import os
+import tempfile
+
+from sbclassifier import Classifier
+from sbclassifier.message import from_path as message_from_path
+from sbclassifier.parallel import count_directories
+from sbclassifier.parallel import train_directories
+from sbclassifier.tokenizer import tokenize
+
+MESSAGE = 'Subject: message {}\nFrom: sender{}@example.com\n\n{}\n'
+
+
+def write_messages(directory, words, n):
+    os.mkdir(directory)
+    for i in range(n):
+        with open(os.path.join(directory, str(i)), 'w') as f:
+            f.write(MESSAGE.format(i, i % 3, ' '.join(words[i % 4:])))
+
+
+def test_train_directories():
+    with tempfile.TemporaryDirectory() as dirname:
+        spamdir = os.path.join(dirname, 'spam')
+        hamdir = os.path.join(dirname, 'ham')
+        write_messages(spamdir, 'buy cheap pills watches now'.split(), 13)
+        write_messages(hamdir, 'agenda for the lunch meeting'.split(), 8)
+        expected = Classifier()
+        expected.learn_many(
+            [(tokenize(message_from_path(os.path.join(directory, name))),
+              is_spam)
+             for directory, is_spam in ((spamdir, True), (hamdir, False))
+             for name in os.listdir(directory)])
+        classifier = Classifier()
+        model = train_directories(classifier, spamdir, hamdir, processes=2,
+                                  shard_size=3)
+        assert (model.nspam, model.nham) == (13, 8)
+        assert (classifier.nspam, classifier.nham) == (13, 8)
+        assert sorted(classifier._wordinfokeys()) == \
+            sorted(expected._wordinfokeys())
+        for word in expected._wordinfokeys():
+            assert (classifier._wordinfoget(word).__getstate__() ==
+                    expected._wordinfoget(word).__getstate__())
+        assert count_directories(spamdir, None, processes=1).nham == 0
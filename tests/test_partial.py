@@ -0,0 +1,99 @@
+# test_partial.py - unit tests for the sbclassifier.classifiers.partial module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import os
+import pickle
+import tempfile
+import unittest
+
+from sbclassifier import Classifier
+from sbclassifier.classifiers.compact import CompactClassifier
+from sbclassifier.classifiers.partial import merge
+from sbclassifier.classifiers.partial import PartialModel
+from sbclassifier.classifiers.storage import PickleClassifier
+from sbclassifier.classifiers.storage import ShelveClassifier
+from sbclassifier.classifiers.storage import SQLiteClassifier
+
+MESSAGES = [('cheap pills buy now'.split(), True),
+            ('meeting agenda attached'.split(), False),
+            ('buy cheap watches'.split(), True),
+            ('lunch meeting tomorrow'.split(), False),
+            ('agenda for lunch'.split(), False)]
+
+
+def states(classifier):
+    return (classifier.nspam, classifier.nham,
+            {word: classifier._wordinfoget(word).__getstate__()
+             for word in classifier._wordinfokeys()})
+
+
+def check_apply(use_bigrams):
+    """Checks applying and un-applying a partial model of `MESSAGES` to
+    in-memory classifiers.
+
+    """
+    expected = Classifier(use_bigrams)
+    expected.learn_many(MESSAGES)
+    model = merge(PartialModel.from_messages([message], use_bigrams)
+                  for message in MESSAGES)
+    for classifier in Classifier(use_bigrams), CompactClassifier(use_bigrams):
+        model.apply(classifier)
+        assert states(classifier) == states(expected)
+        model.unapply(classifier)
+        assert states(classifier) == (0, 0, {})
+
+
+class PartialModelTest(unittest.TestCase):
+
+    def test_merge(self):
+        shards = [PartialModel.from_messages(MESSAGES[i:i + 2])
+                  for i in range(0, len(MESSAGES), 2)]
+        a, b, c = shards
+        assert (a + b) + c == a + (b + c) == c + b + a
+        assert merge(shards) == PartialModel.from_messages(MESSAGES)
+        assert merge([]) == PartialModel()
+        # Adding does not modify the operands.
+        assert a == PartialModel.from_messages(MESSAGES[:2])
+        assert pickle.loads(pickle.dumps(a)) == a
+
+    def test_apply(self):
+        check_apply(False)
+
+    def test_apply_bigrams(self):
+        check_apply(True)
+
+
+class _StoredPartialModelTests:
+    # Subclass must define a concrete StorageClass.
+    StorageClass = None
+
+    def test_stored(self):
+        expected = Classifier()
+        expected.learn_many(MESSAGES)
+        with tempfile.TemporaryDirectory() as dirname:
+            modelname = os.path.join(dirname, 'model')
+            PartialModel.from_messages(MESSAGES).save(modelname)
+            filename = os.path.join(dirname, 'db')
+            classifier = self.StorageClass(filename)
+            PartialModel.load(modelname).apply(classifier)
+            classifier.store()
+            classifier.close()
+            classifier = self.StorageClass(filename)
+            assert states(classifier) == states(expected)
+            classifier.close()
+
+
+class PicklePartialModelTest(_StoredPartialModelTests, unittest.TestCase):
+    StorageClass = PickleClassifier
+
+
+class ShelvePartialModelTest(_StoredPartialModelTests, unittest.TestCase):
+    StorageClass = ShelveClassifier
+
+
+class SQLitePartialModelTest(_StoredPartialModelTests, unittest.TestCase):
+    StorageClass = SQLiteClassifier
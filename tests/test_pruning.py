@@ -0,0 +1,223 @@
+# test_pruning.py - unit tests for the sbclassifier.classifiers.pruning module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import glob
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+from sbclassifier import Classifier
+from sbclassifier.classifiers import storage
+from sbclassifier.classifiers.compact import CompactClassifier
+from sbclassifier.classifiers.pruning import HapaxAgePolicy
+from sbclassifier.classifiers.pruning import prune
+from sbclassifier.classifiers.pruning import Pruner
+from sbclassifier.classifiers.pruning import usefulness
+from sbclassifier.classifiers.pruning import UsefulnessPolicy
+from sbclassifier.classifiers.storage import PickleClassifier
+from sbclassifier.classifiers.storage import ShelveClassifier
+from sbclassifier.classifiers.storage import SQLiteClassifier
+
+
+def train(classifier):
+    """Trains `classifier` on six generations of messages, tracking when
+    each token was last learned.
+
+    """
+    classifier.track_lastseen = True
+    classifier.learn_spam(['old', 'common'])
+    classifier.learn_ham(['older', 'common'])
+    classifier.learn_many([(['batch', 'common'], True),
+                           (['batch', 'common'], False)])
+    classifier.learn_spam(['new', 'common'])
+    classifier.learn_ham(['removed'])
+    classifier.unlearn_ham(['removed'])
+    classifier.learn_ham(['newer', 'common'])
+
+
+class _InMemoryPruningTests:
+    # Subclass must define a concrete ClassifierClass.
+    ClassifierClass = None
+
+    def test_generations(self):
+        classifier = self.ClassifierClass()
+        train(classifier)
+        assert classifier.generation == 6
+        assert classifier._lastseenget('old') == 1
+        assert classifier._lastseenget('batch') == 3
+        assert classifier._lastseenget('common') == 6
+        assert classifier._lastseenget('removed') == 0
+        assert classifier._lastseenget('unknown') == 0
+        copy = self.ClassifierClass()
+        state = pickle.dumps(classifier.__getstate__())
+        copy.__setstate__(pickle.loads(state))
+        assert copy.generation == 6
+        assert copy._lastseenget('new') == 4
+
+    def test_untracked(self):
+        classifier = self.ClassifierClass()
+        classifier.learn_spam(['old', 'common'])
+        classifier.learn_ham(['new', 'common'])
+        assert classifier.generation == 2
+        assert classifier._lastseenget('new') == 0
+        assert classifier.lastseen == {}
+        with self.assertRaises(TypeError):
+            Pruner(classifier, HapaxAgePolicy(1))
+        # Policies which do not need the generations still work.
+        assert prune(classifier, UsefulnessPolicy(1)) == 2
+
+    def test_hapax_age(self):
+        classifier = self.ClassifierClass()
+        train(classifier)
+        # 'old' and 'older' are hapaxes more than 3 generations old; 'batch'
+        # appeared in two messages.
+        assert prune(classifier, HapaxAgePolicy(3)) == 2
+        assert set(classifier._wordinfokeys()) == {'batch', 'common', 'new',
+                                                   'newer'}
+        assert (classifier.nspam, classifier.nham) == (3, 3)
+
+
+class ClassifierPruningTest(_InMemoryPruningTests, unittest.TestCase):
+    ClassifierClass = Classifier
+
+
+class CompactClassifierPruningTest(_InMemoryPruningTests, unittest.TestCase):
+    ClassifierClass = CompactClassifier
+
+
+class PruningTest(unittest.TestCase):
+
+    def test_old_pickle(self):
+        classifier = Classifier()
+        classifier.__setstate__((5, {}, 1, 2))
+        assert (classifier.nspam, classifier.nham) == (1, 2)
+        assert classifier.generation == 0 and classifier.lastseen == {}
+
+    def test_usefulness(self):
+        classifier = Classifier()
+        for i in range(10):
+            classifier.learn_spam(['spam', 'neutral', 'spam{}'.format(i)])
+            classifier.learn_ham(['ham', 'neutral', 'ham{}'.format(i)])
+        spam = classifier._wordinfoget('spam')
+        hapax = classifier._wordinfoget('spam0')
+        neutral = classifier._wordinfoget('neutral')
+        assert usefulness(classifier, spam) > usefulness(classifier, hapax) > 0
+        assert usefulness(classifier, neutral) == 0
+        assert prune(classifier, UsefulnessPolicy(5)) == 18
+        # Both strong tokens are kept, and three of the equally useful hapaxes.
+        keys = set(classifier._wordinfokeys())
+        assert len(keys) == 5
+        assert {'spam', 'ham'} < keys
+        assert 'neutral' not in keys
+        assert prune(classifier, UsefulnessPolicy(10)) == 0
+
+    def test_time_slices(self):
+        classifier = Classifier()
+        classifier.track_lastseen = True
+        for i in range(100):
+            classifier.learn_spam(['word{}'.format(i)])
+        pruner = Pruner(classifier, HapaxAgePolicy(50))
+        steps = 0
+        while not pruner.step(0):
+            steps += 1
+            if steps == 1:
+                # Training between steps is allowed.
+                classifier.learn_ham(['word99', 'another'])
+        # Each step examines exactly one token when the slice is empty.
+        assert steps == 100
+        assert pruner.examined == 100 and pruner.pruned == 50
+        assert len(classifier.wordinfo) == 51
+
+    def test_prune_everything(self):
+        classifier = Classifier()
+        classifier.learn_spam(['spam', 'both'])
+        classifier.learn_ham(['ham', 'both'])
+        assert prune(classifier, UsefulnessPolicy(0)) == 3
+        assert not classifier.wordinfo
+        assert prune(classifier, UsefulnessPolicy(0)) == 0
+        with self.assertRaises(ValueError):
+            UsefulnessPolicy(-1)
+
+
+class _StoredPruningTests:
+    # Subclass must define a concrete StorageClass.
+    StorageClass = None
+
+    def setUp(self):
+        self.db_name = tempfile.mktemp('prunetest')
+
+    def tearDown(self):
+        for name in glob.glob(self.db_name + '*'):
+            if os.path.isfile(name):
+                os.remove(name)
+
+    def test_stored(self):
+        classifier = self.StorageClass(self.db_name)
+        train(classifier)
+        classifier.store()
+        classifier.close()
+        classifier = self.StorageClass(self.db_name)
+        classifier.track_lastseen = True
+        assert classifier.generation == 6
+        assert classifier._lastseenget('old') == 1
+        assert classifier._lastseenget('batch') == 3
+        assert prune(classifier, HapaxAgePolicy(3)) == 2
+        classifier.store()
+        classifier.close()
+        classifier = self.StorageClass(self.db_name)
+        assert set(classifier._wordinfokeys()) == {'batch', 'common', 'new',
+                                                   'newer'}
+        classifier.close()
+
+    def test_prune_changed_then_store(self):
+        classifier = self.StorageClass(self.db_name)
+        for i in range(3):
+            classifier.learn_spam(['word{}'.format(i), 'common'])
+        classifier.store()
+        # Pruning words changed since the last store() leaves nothing for
+        # the next one to write back.
+        classifier.learn_ham(['word0', 'common'])
+        assert prune(classifier, UsefulnessPolicy(1)) == 3
+        classifier.store()
+        classifier.close()
+        classifier = self.StorageClass(self.db_name)
+        assert len(classifier._wordinfokeys()) == 1
+        classifier.close()
+
+
+class PicklePruningTest(_StoredPruningTests, unittest.TestCase):
+    StorageClass = PickleClassifier
+
+
+class ShelvePruningTest(_StoredPruningTests, unittest.TestCase):
+    StorageClass = ShelveClassifier
+
+
+class SQLitePruningTest(_StoredPruningTests, unittest.TestCase):
+    StorageClass = SQLiteClassifier
+
+    def test_pages(self):
+        with mock.patch.object(storage, 'SQLITE_PAGE_SIZE', 4):
+            classifier = SQLiteClassifier(self.db_name)
+            classifier.track_lastseen = True
+            for i in range(10):
+                classifier.learn_spam(['word{}'.format(i)])
+            classifier.store()
+            classifier.learn_ham(['word0', 'unstored'])
+            queries = []
+            classifier.db.set_trace_callback(queries.append)
+            pruner = Pruner(classifier, HapaxAgePolicy(5))
+            # The words are listed a page at a time as they are examined.
+            assert pruner.step(0) is False
+            assert len([q for q in queries if 'ORDER BY' in q]) == 0
+            pruner.run()
+            assert len([q for q in queries if 'ORDER BY' in q]) == 3
+            assert pruner.examined == 11
+            assert pruner.pruned == 4
+            classifier.close()
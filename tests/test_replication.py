@@ -0,0 +1,136 @@
+# test_replication.py - unit tests for the replication module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import os
+import tempfile
+
+from sbclassifier import Classifier
+from sbclassifier.classifiers.pruning import HapaxAgePolicy
+from sbclassifier.classifiers.pruning import prune
+from sbclassifier.classifiers.replication import JournalWriter
+from sbclassifier.classifiers.replication import Replica
+
+MESSAGES = [('cheap pills buy now'.split(), True),
+            ('meeting agenda attached'.split(), False),
+            ('buy cheap watches'.split(), True),
+            ('lunch meeting tomorrow'.split(), False),
+            ('agenda for lunch'.split(), False)]
+
+
+def states(classifier):
+    return (classifier.nspam, classifier.nham,
+            {word: classifier._wordinfoget(word).__getstate__()
+             for word in classifier._wordinfokeys()})
+
+
+def train(classifier):
+    for message, is_spam in MESSAGES[:2]:
+        classifier.learn(message, is_spam)
+    classifier.learn_many(MESSAGES[2:])
+    classifier.unlearn(*MESSAGES[0])
+    classifier.unlearn_many(MESSAGES[3:4])
+    # Un-learning a message that was never learned changes only the counts
+    # of messages.
+    classifier.unlearn(['never', 'seen'], False)
+
+
+def test_replicate():
+    with tempfile.TemporaryDirectory() as directory:
+        master = Classifier()
+        master.journal = JournalWriter(directory, segment_size=100)
+        replica = Replica(directory)
+        assert replica.poll() == 0
+        master.learn(*MESSAGES[0])
+        assert replica.poll() == 1
+        assert states(replica.classifier) == states(master)
+        train(master)
+        assert master.journal.seq == 7
+        assert replica.poll() == 6
+        assert replica.seq == 7
+        assert states(replica.classifier) == states(master)
+        # Small segments made the writer start several.
+        assert len(os.listdir(directory)) > 2
+
+
+def test_pruning():
+    with tempfile.TemporaryDirectory() as directory:
+        master = Classifier()
+        master.track_lastseen = True
+        master.journal = JournalWriter(directory)
+        replica = Replica(directory)
+        for message, is_spam in MESSAGES:
+            master.learn(message, is_spam)
+        replica.poll()
+        assert prune(master, HapaxAgePolicy(2)) > 0
+        assert replica.poll() > 0
+        assert states(replica.classifier) == states(master)
+
+
+def test_incomplete_record():
+    with tempfile.TemporaryDirectory() as directory:
+        master = Classifier()
+        master.journal = JournalWriter(directory)
+        master.learn(*MESSAGES[0])
+        master.learn(*MESSAGES[1])
+        segment = os.path.join(directory, os.listdir(directory)[0])
+        with open(segment, 'rb') as f:
+            data = f.read()
+        # Pretend the second record is still being written.
+        with open(segment, 'r+b') as f:
+            f.truncate(len(data) - 5)
+        replica = Replica(directory)
+        assert replica.poll() == 1
+        with open(segment, 'r+b') as f:
+            f.seek(len(data) - 5)
+            f.write(data[-5:])
+        assert replica.poll() == 1
+        assert states(replica.classifier) == states(master)
+        # A writer reopening the journal discards an incomplete record.
+        master.journal.close()
+        with open(segment, 'ab') as f:
+            f.write(b'\xff\x00')
+        master.journal = JournalWriter(directory)
+        assert master.journal.seq == 2
+        master.learn(*MESSAGES[2])
+        assert replica.poll() == 1
+        assert states(replica.classifier) == states(master)
+
+
+def test_compaction():
+    with tempfile.TemporaryDirectory() as directory:
+        master = Classifier()
+        master.journal = JournalWriter(directory, segment_size=100)
+        behind = Replica(directory)
+        current = Replica(directory)
+        master.learn(*MESSAGES[0])
+        assert behind.poll() == current.poll() == 1
+        train(master)
+        assert current.poll() == 6
+        master.journal.compact(master)
+        names = os.listdir(directory)
+        assert 'snapshot-0000000000000007.pickle' in names
+        assert 'journal-0000000000000008.log' in names
+        assert not any(name.startswith('journal-000000000000000'
+                                       '1') for name in names)
+        master.learn(*MESSAGES[4])
+        # A replica which was up to date just follows the journal, while
+        # one whose records were compacted away reloads the snapshot.
+        assert current.poll() == 1
+        old = behind.classifier
+        behind.poll()
+        assert behind.classifier is not old
+        assert behind.seq == current.seq == 8
+        # A new replica starts from the snapshot.
+        new = Replica(directory)
+        assert new.seq == 7
+        assert new.poll() == 1
+        for replica in behind, current, new:
+            assert states(replica.classifier) == states(master)
+        # A writer reopening a compacted journal continues its numbering.
+        master.journal.close()
+        master.journal = JournalWriter(directory)
+        assert master.journal.seq == 8
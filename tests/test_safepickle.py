@@ -0,0 +1,101 @@
+# test_safepickle.py - unit tests for the sbclassifier.safepickle module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from lockfile import FileLock
+
+from sbclassifier.safepickle import pickle_read
+from sbclassifier.safepickle import pickle_write
+
+# Writes consistent pickles to the file named by its argument as fast as it
+# can, until it is killed.  Each value is a sequence number and a list of
+# chunks of bytes which all depend on that number.
+WRITER = """
+import sys
+from sbclassifier.safepickle import pickle_write
+i = 0
+while True:
+    i += 1
+    pickle_write(sys.argv[1], (i, [bytes([i % 256]) * 65536] * 64))
+"""
+
+
+def check_consistent(value):
+    i, chunks = value
+    assert len(chunks) == 64
+    assert all(chunk == bytes([i % 256]) * 65536 for chunk in chunks)
+
+
+class SafePickleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, 'value.pickle')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def temporary_files(self):
+        return [name for name in os.listdir(self.dirname)
+                if name.endswith('.tmp')]
+
+    def test_pickle_write(self):
+        filename = self.filename
+        pickle_write(filename, {'a': 1})
+        pickle_write(filename, {'a': 2}, fsync=False)
+        assert pickle_read(filename) == {'a': 2}
+        # A value that cannot be pickled leaves the old value in place and no
+        # temporary file behind.
+        with self.assertRaises(Exception):
+            pickle_write(filename, lambda: None)
+        assert pickle_read(filename) == {'a': 2}
+        assert sorted(os.listdir(self.dirname)) == ['value.pickle']
+        # Temporary files left behind by killed writers of the same file are
+        # removed by the next write, and those of other files are not.
+        for name in '.value.pickle.stale.tmp', '.other.pickle.stale.tmp':
+            open(os.path.join(self.dirname, name), 'wb').close()
+        pickle_write(filename, {'a': 3})
+        assert self.temporary_files() == ['.other.pickle.stale.tmp']
+
+    def test_killed_writer(self):
+        filename = self.filename
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=root)
+        rng = random.Random(0)
+        last = 0
+        for trial in range(5):
+            writer = subprocess.Popen([sys.executable, '-c', WRITER, filename],
+                                      env=env, stderr=subprocess.DEVNULL)
+            try:
+                while not os.path.exists(filename):
+                    time.sleep(0.01)
+                # Kill the writer at an arbitrary point, most likely in the
+                # middle of writing a pickle.
+                time.sleep(rng.uniform(0.05, 0.3))
+            finally:
+                writer.kill()
+                writer.wait()
+            # The killed writer may have held the lock.
+            FileLock(filename).break_lock()
+            value = pickle_read(filename)
+            check_consistent(value)
+            last = value[0]
+            # The killed writer may have left its temporary file, but the
+            # next writer removed any left before.
+            assert len(self.temporary_files()) <= 1
+        assert last > 0
+        # The next write removes any temporary file left behind.
+        pickle_write(filename, {})
+        assert self.temporary_files() == []
@@ -0,0 +1,139 @@
+# test_scorecache.py - unit tests for the sbclassifier.classifiers.scorecache
+# module
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import email
+import os
+import tempfile
+
+from sbclassifier.classifiers.basic import Classifier
+from sbclassifier.classifiers.layered import LayeredClassifier
+from sbclassifier.classifiers.pruning import HapaxAgePolicy
+from sbclassifier.classifiers.pruning import prune
+from sbclassifier.classifiers.scorecache import digest
+from sbclassifier.classifiers.scorecache import ScoreCache
+from sbclassifier.classifiers.storage import PickleClassifier
+from sbclassifier.classifiers.storage import SQLiteClassifier
+from sbclassifier.classifiers.threadsafe import SnapshotClassifier
+from sbclassifier.tokenizer import tokenize
+
+SPAM = 'Subject: offer\n\ncheap pills for the winner\n'
+HAM = 'Subject: lunch\n\nshall we meet for lunch tomorrow\n'
+
+
+class CountingTokenizer:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, message):
+        self.calls += 1
+        return tokenize(message)
+
+
+def test_digest():
+    assert digest(SPAM) == digest(SPAM.replace('\n', '\r\n'))
+    assert digest(SPAM) == digest(SPAM.encode())
+    assert digest(SPAM) == digest(email.message_from_string(SPAM))
+    assert digest(SPAM) != digest(HAM)
+
+
+def test_score_cache():
+    classifier = Classifier()
+    classifier.learn(tokenize(SPAM), True)
+    classifier.learn(tokenize(HAM), False)
+    tokenizer = CountingTokenizer()
+    scores = ScoreCache(classifier, tokenizer, max_size=1)
+    expected = classifier.spamprob(tokenize(SPAM))
+    assert scores.score(SPAM) == expected
+    assert scores.score(SPAM.replace('\n', '\r\n')) == expected
+    assert tokenizer.calls == 1
+    assert (scores.hits, scores.misses, scores.hit_rate) == (1, 1, 0.5)
+    # The cache holds only one score.
+    scores.score(HAM)
+    scores.score(SPAM)
+    assert tokenizer.calls == 3
+    assert scores.evictions == 2
+    # Evidence is cached separately, and each caller gets its own list.
+    prob, clues = scores.score(SPAM, evidence=True)
+    assert prob == expected
+    clues.clear()
+    assert scores.score(SPAM, evidence=True)[1]
+    assert tokenizer.calls == 4
+
+
+def test_invalidation():
+    classifier = Classifier()
+    classifier.track_lastseen = True
+    classifier.learn(tokenize(SPAM), True)
+    scores = ScoreCache(classifier)
+    first = scores.score(HAM)
+    classifier.learn(tokenize(HAM), False)
+    second = scores.score(HAM)
+    assert second != first
+    assert second == classifier.spamprob(tokenize(HAM))
+    assert scores.invalidations == 1
+    classifier.unlearn(tokenize(HAM), False)
+    assert scores.score(HAM) == first
+    assert scores.invalidations == 2
+    prune(classifier, HapaxAgePolicy(-1))
+    assert scores.score(HAM) == 0.5
+    stats = scores.stats()
+    assert stats['invalidations'] == 3
+    assert stats['hit_rate'] == 0.0
+
+
+def test_snapshot_classifier():
+    classifier = SnapshotClassifier()
+    scores = ScoreCache(classifier)
+    before = scores.score(SPAM)
+    classifier.learn(tokenize(SPAM), True)
+    classifier.learn(tokenize(HAM), False)
+    assert scores.score(SPAM) != before
+    assert scores.invalidations == 1
+
+
+def test_reload():
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'db')
+        writer = PickleClassifier(filename)
+        writer.learn(tokenize(SPAM), True)
+        writer.store()
+        reader = PickleClassifier(filename)
+        scores = ScoreCache(reader)
+        before = scores.score(SPAM)
+        writer.unlearn(tokenize(SPAM), True)
+        writer.store()
+        reader.load()
+        assert scores.score(SPAM) == 0.5 != before
+        assert scores.invalidations == 1
+
+
+def test_sqlite_reader():
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'db')
+        writer = SQLiteClassifier(filename)
+        writer.learn(tokenize(SPAM), True)
+        writer.store()
+        reader = SQLiteClassifier(filename)
+        scores = ScoreCache(reader)
+        before = scores.score(SPAM)
+        writer.unlearn(tokenize(SPAM), True)
+        writer.store()
+        assert scores.score(SPAM) == 0.5 != before
+        assert scores.invalidations == 1
+        writer.close()
+        reader.close()
+
+
+def test_layered_base():
+    base = Classifier()
+    base.learn(tokenize(SPAM), True)
+    classifier = LayeredClassifier(base)
+    scores = ScoreCache(classifier)
+    before = scores.score(SPAM)
+    classifier.base = Classifier()
+    assert scores.score(SPAM) == 0.5 != before
@@ -0,0 +1,76 @@
+# test_shared.py - unit tests for the sbclassifier.classifiers.packed and
+# sbclassifier.classifiers.shared modules
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import multiprocessing
+import random
+
+from sbclassifier import Classifier
+from sbclassifier.classifiers.packed import pack
+from sbclassifier.classifiers.packed import PackedClassifier
+from sbclassifier.classifiers.shared import publish
+from sbclassifier.classifiers.shared import SharedMemoryClassifier
+
+
+def _train():
+    classifier = Classifier()
+    rng = random.Random(0)
+    vocabulary = ['word{}'.format(i) for i in range(2000)]
+    vocabulary += ['unicode \N{SNOWMAN} {}'.format(i) for i in range(100)]
+    for i in range(100):
+        classifier.learn(rng.sample(vocabulary, 100), i % 3 == 0)
+    # Tokens may also be bytes, but str and bytes tokens cannot be scored
+    # together, since they cannot be sorted.
+    classifier.learn([b'bytes:1', b'bytes:2'], True)
+    messages = [rng.sample(vocabulary, 200) + ['unknown'] for i in range(20)]
+    return classifier, messages
+
+
+def test_packed():
+    classifier, messages = _train()
+    packed = PackedClassifier(bytes(pack(classifier)))
+    assert (packed.nspam, packed.nham) == (classifier.nspam, classifier.nham)
+    assert sorted(packed._wordinfokeys(), key=str) == \
+        sorted(classifier._wordinfokeys(), key=str)
+    for message in messages:
+        assert packed.spamprob(message) == classifier.spamprob(message)
+    # str and bytes tokens with the same characters are different tokens.
+    assert packed._wordinfoget(b'bytes:1').spamcount == 1
+    assert packed._wordinfoget('bytes:1') is None
+    assert packed._wordinfoget(b'word1') is None
+    try:
+        packed.learn(['word1'], True)
+    except TypeError:
+        pass
+    else:
+        assert False, 'TypeError not raised'
+
+
+def _score(name, messages, queue):
+    classifier = SharedMemoryClassifier(name)
+    queue.put([classifier.spamprob(message) for message in messages])
+    classifier.close()
+
+
+def test_shared_memory():
+    classifier, messages = _train()
+    shm = publish(classifier)
+    try:
+        queue = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_score,
+                                           args=(shm.name, messages, queue))
+                   for i in range(2)]
+        for worker in workers:
+            worker.start()
+        results = [queue.get(timeout=30) for worker in workers]
+        for worker in workers:
+            worker.join()
+        expected = [classifier.spamprob(message) for message in messages]
+        assert results == [expected, expected]
+    finally:
+        shm.close()
+        shm.unlink()
@@ -5,14 +5,21 @@
 #
 # This file is part of sbclassifier, which is licensed under the Python
 # Software Foundation License; for more information, see LICENSE.txt.
+import functools
 import glob
 import os
+import subprocess
+import sys
 import tempfile
+import threading
+import time
 import unittest
 
 from sbclassifier.classifiers.storage import CDBClassifier
+from sbclassifier.classifiers.storage import JournaledPickleClassifier
 from sbclassifier.classifiers.storage import ShelveClassifier
 from sbclassifier.classifiers.storage import PickleClassifier
+from sbclassifier.classifiers.storage import SQLiteClassifier
 #from sbclassifier.classifiers.storage import ZODBClassifier
 
 try:
@@ -28,8 +35,26 @@ except ImportError:
 #     zodb_is_available = False
 
 
-class _StorageTestBase(unittest.TestCase):
-    # Subclass must define a concrete StorageClass.
+#: The directory containing the sbclassifier package.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Trains and stores the SQLite database named by its argument as fast as it
+# can, until it is killed.
+SQLITE_WRITER = """
+import sys
+from sbclassifier.classifiers.storage import SQLiteClassifier
+classifier = SQLiteClassifier(sys.argv[1])
+while True:
+    classifier.learn(["spam", "both"], True)
+    classifier.learn(["ham", "both"], False)
+    classifier.store()
+"""
+
+
+class _StorageTestBase:
+    # Subclass must also derive from unittest.TestCase, and define a concrete
+    # StorageClass; this class is not itself a TestCase, so that it is not
+    # run on its own.
     StorageClass = None
 
     def setUp(self):
@@ -83,6 +108,36 @@ class _StorageTestBase(unittest.TestCase):
             self.assertEqual(c.nham, count - i - 1)
             self.assertEqual(c.nspam, 0)
 
+    def testLearnMany(self):
+        c = self.classifier
+        c.learn_many([(["some", "simple", "tokens"], True),
+                      (["some", "other"], False),
+                      (["ones"], False),
+                      (["ones", "other"], False)])
+        self._checkAllWordCounts((("some", 1, 1),
+                                  ("simple", 0, 1),
+                                  ("other", 2, 0),
+                                  ("ones", 2, 0)), True)
+        self.assertEqual(c.nham, 3)
+        self.assertEqual(c.nspam, 1)
+        c.unlearn_many([(["ones"], False), (["some", "simple"], True)])
+        self._checkAllWordCounts((("some", 1, 0),
+                                  ("simple", 0, 0),
+                                  ("tokens", 0, 1),
+                                  ("ones", 1, 0)), True)
+        self.assertEqual(c.nham, 2)
+        self.assertEqual(c.nspam, 0)
+
+    def testKeysBeforeStore(self):
+        c = self.classifier
+        c.learn_many([(["a", "b"], True), (["a", "c"], False)])
+        c.learn(["z"], True)
+        # Every word trained is listed, whether or not it has been written
+        # to the database yet.
+        self.assertEqual(sorted(c._wordinfokeys()), ["a", "b", "c", "z"])
+        c.store()
+        self.assertEqual(sorted(c._wordinfokeys()), ["a", "b", "c", "z"])
+
     def _checkWordCounts(self, word, expected_ham, expected_spam):
         assert word
         info = self.classifier._wordinfoget(word)
@@ -185,16 +240,199 @@ class _StorageTestBase(unittest.TestCase):
 
 
 # Test classes for each classifier.
-class PickleStorageTestCase(_StorageTestBase):
+class PickleStorageTestCase(_StorageTestBase, unittest.TestCase):
     StorageClass = PickleClassifier
 
 
-class DBStorageTestCase(_StorageTestBase):
+class JournaledPickleStorageTestCase(_StorageTestBase, unittest.TestCase):
+    StorageClass = JournaledPickleClassifier
+
+    def _reopen(self, **kw):
+        self.classifier.close()
+        self.classifier = self.StorageClass(self.db_name, **kw)
+        return self.classifier
+
+    def _journal_files(self):
+        return sorted(glob.glob(self.db_name + '.journal.*'))
+
+    def testStoreAppends(self):
+        c = self.classifier
+        c.learn(["some", "simple", "tokens"], True)
+        c.store()
+        size = os.path.getsize(self._journal_files()[-1])
+        c.learn(["some", "other"], False)
+        c.unlearn(["some", "simple", "tokens"], True)
+        c.store()
+        # No snapshot has been written yet, only the journal, and the second
+        # record holds only the four words changed.
+        self.assertFalse(os.path.exists(self.db_name))
+        self.assertEqual(len(self._journal_files()), 1)
+        self.assertLess(os.path.getsize(self._journal_files()[-1]),
+                        3 * size)
+        c = self._reopen()
+        self._checkAllWordCounts((("some", 1, 0),
+                                  ("simple", 0, 0),
+                                  ("other", 1, 0)), False)
+        self.assertEqual((c.nspam, c.nham), (0, 1))
+
+    def testIncompleteRecord(self):
+        c = self.classifier
+        c.learn(["some", "tokens"], True)
+        c.store()
+        c.learn(["other"], True)
+        c.store()
+        c.close()
+        # Simulate a crash in the middle of writing the second record.
+        name = self._journal_files()[-1]
+        with open(name, 'r+b') as f:
+            f.truncate(os.path.getsize(name) - 1)
+        c = self._reopen()
+        self.assertEqual(c.nspam, 1)
+        self._checkAllWordCounts((("tokens", 0, 1), ("other", 0, 0)), False)
+        c.learn(["more"], False)
+        c.store()
+        c = self._reopen()
+        self.assertEqual((c.nspam, c.nham), (1, 1))
+        self._checkAllWordCounts((("tokens", 0, 1), ("more", 1, 0)), False)
+
+    def testCompaction(self):
+        c = self._reopen(compaction_threshold=1)
+        c.learn(["some", "simple", "tokens"], True)
+        c.store()
+        # Training while the snapshot is written does not affect it.
+        c.learn(["some", "other"], False)
+        c.close()
+        self.assertEqual(len(self._journal_files()), 1)
+        snapshot = PickleClassifier(self.db_name)
+        self.assertEqual((snapshot.nspam, snapshot.nham), (1, 0))
+        self.assertEqual(snapshot._wordinfoget("some").hamcount, 0)
+        self.assertIsNone(snapshot._wordinfoget("other"))
+        c = self._reopen()
+        c.learn(["some", "other"], False)
+        c.compact()
+        self.assertEqual(os.path.getsize(self._journal_files()[-1]), 0)
+        c = self._reopen()
+        self._checkAllWordCounts((("some", 1, 1), ("other", 1, 0)), False)
+        self.assertEqual((c.nspam, c.nham), (1, 1))
+
+    def testCopyOnWrite(self):
+        release = threading.Event()
+
+        class BlockedClassifier(JournaledPickleClassifier):
+            def _compact(self, snapshot, last):
+                release.wait()
+                super()._compact(snapshot, last)
+
+        self.classifier.close()
+        self.classifier = c = BlockedClassifier(self.db_name,
+                                                compaction_threshold=1)
+        try:
+            c.learn(["some", "tokens"], True)
+            record = c._wordinfoget("some")
+            wordinfo = c.wordinfo
+            c.store()
+            # The snapshot takes the database as it is, without copying it.
+            self.assertIs(c._frozen[0], wordinfo)
+            # Scoring does not copy the record, but training does, before it
+            # changes it, and leaves the database being written alone.
+            self.assertIs(c._wordinfoget("some"), record)
+            c.learn(["some", "other"], False)
+            c.unlearn(["some", "tokens"], True)
+            c.store()
+            self.assertEqual((record.spamcount, record.hamcount), (1, 0))
+            self.assertEqual(sorted(wordinfo), ["some", "tokens"])
+            self.assertEqual(sorted(c._wordinfokeys()), ["other", "some"])
+            self._checkAllWordCounts((("some", 1, 0), ("tokens", 0, 0),
+                                      ("other", 1, 0)), False)
+        finally:
+            release.set()
+        c.close()
+        self.assertEqual(sorted(c.wordinfo), ["other", "some"])
+        self._checkAllWordCounts((("some", 1, 0), ("tokens", 0, 0),
+                                  ("other", 1, 0)), False)
+        c = self._reopen()
+        self.assertEqual((c.nspam, c.nham), (0, 1))
+        self._checkAllWordCounts((("some", 1, 0), ("tokens", 0, 0),
+                                  ("other", 1, 0)), False)
+
+    def testStoreWithoutChanges(self):
+        c = self.classifier
+        c.learn(["some", "tokens"], True)
+        c.store()
+        size = os.path.getsize(self._journal_files()[-1])
+        c.store()
+        c.spamprob(["some"])
+        c.store()
+        self.assertEqual(os.path.getsize(self._journal_files()[-1]), size)
+
+
+class DBStorageTestCase(_StorageTestBase, unittest.TestCase):
     StorageClass = ShelveClassifier
 
     def _fail_open_best(self, *args):
         raise Exception("No dbm modules available!")
 
+    def _reopen(self, **kw):
+        self.classifier.close()
+        self.classifier = self.StorageClass(self.db_name, **kw)
+        return self.classifier
+
+    def testWriteCoalescing(self):
+        c = self._reopen(flush_count=10, flush_interval=3600)
+        for i in range(4):
+            c.learn(["common", "hapax{}".format(i)], False)
+        # The state key and five single-count records are buffered; the
+        # first record of "common" was replaced when it was counted twice.
+        self.assertEqual(len(c.buffer), 5)
+        self.assertNotIn("hapax0", c.db)
+        self.assertEqual(c.buffer_stats(),
+                         dict(writes=9, flushed=0, flushes=0, pending=5,
+                              saved=4))
+        self._checkWordCounts("hapax0", 1, 0)
+        for i in range(4, 10):
+            c.learn(["hapax{}".format(i)], True)
+        # The buffer was written once it held ten values, after the ninth
+        # message; only the last of the nine writes of the state key so far
+        # reached the database.
+        self.assertEqual(c.buffer_stats(),
+                         dict(writes=21, flushed=10, flushes=1, pending=2,
+                              saved=9))
+        self.assertEqual(c.db[c.statekey][1:3], (5, 4))
+        self.assertEqual(c.db["hapax8"][:2], (1, 0))
+        # The changed records in the cache were written along with the
+        # buffer, so the counts in the database agree with the state key.
+        self.assertEqual(c.db["common"][:2], (0, 4))
+        self.assertFalse(c.changed_words)
+        c.learn(["common"], True)
+        # Closing the database writes the rest of the buffer and the changed
+        # records.
+        c = self._reopen()
+        self.assertEqual((c.nspam, c.nham), (7, 4))
+        self._checkAllWordCounts((("common", 4, 1), ("hapax3", 1, 0),
+                                  ("hapax9", 0, 1)), False)
+
+    def testDeletedKeys(self):
+        c = self._reopen(flush_interval=3600)
+        c.learn(["gone", "kept"], False)
+        c.learn(["gone", "kept"], False)
+        c.store()
+        c.unlearn(["gone"], False)
+        c.unlearn(["gone"], False)
+        # The word is deleted before the next store, but still in the
+        # database.
+        self.assertIn("gone", c.deleted_words)
+        self.assertIn("gone", c.db)
+        self.assertEqual(c._wordinfokeys(), ["kept"])
+        c.store()
+        self.assertNotIn("gone", c.db)
+        self.assertEqual(c._wordinfokeys(), ["kept"])
+
+    def testFlushInterval(self):
+        c = self._reopen(flush_interval=0)
+        c.learn(["hapax"], True)
+        self.assertEqual(c.buffer_stats()["flushes"], 1)
+        self.assertEqual(c.db["hapax"][:2], (1, 0))
+
     @unittest.skip('This is unnecessary')
     def testNoDBMAvailable(self):
         from sbclassifier.storage import open_storage
@@ -213,11 +451,177 @@ class DBStorageTestCase(_StorageTestBase):
                 os.remove(name)
 
 
+class SQLiteStorageTestCase(_StorageTestBase, unittest.TestCase):
+    StorageClass = SQLiteClassifier
+
+    def testBulkLookup(self):
+        c = self.classifier
+        words = ["word{}".format(i) for i in range(1000)]
+        c.learn(words, True)
+        c.learn(words[:500], False)
+        c.store()
+        c.close()
+        self.classifier = c = self.StorageClass(self.db_name)
+        queries = []
+        c.db.set_trace_callback(queries.append)
+        c.spamprob(words + ["unknown"])
+        # One query for each 512 words, known or not.
+        selects = [q for q in queries if 'IN (' in q]
+        self.assertEqual(len(selects), 2)
+        # The state and the records are read in one transaction.
+        self.assertEqual(queries[0], 'BEGIN')
+        self.assertEqual(queries[-1], 'COMMIT')
+        self.assertEqual(queries.count('BEGIN'), 1)
+        self.assertEqual(len(c.cache), 1001)
+        self.assertEqual(len(c.wordinfo), 0)
+
+    def testBigramLookup(self):
+        c = self.classifier
+        c._use_bigrams = True
+        c.learn(["one", "two", "three"], True)
+        c.store()
+        c.close()
+        self.classifier = c = self.StorageClass(self.db_name)
+        c._use_bigrams = True
+        queries = []
+        c.db.set_trace_callback(queries.append)
+        c.spamprob(["one", "two", "three"])
+        # The unigrams and bigrams are fetched by a single query.
+        selects = [q for q in queries if 'IN (' in q]
+        self.assertEqual(len(selects), 1)
+        self.assertIn("bi:one two", c.cache)
+
+    def testBoundedCache(self):
+        c = self.classifier
+        words = ["word{}".format(i) for i in range(100)]
+        c.learn(words, True)
+        c.learn(words, True)
+        c.store()
+        c.close()
+        self.classifier = c = self.StorageClass(self.db_name, cache_size=10)
+        c.spamprob(words + ["unknown{}".format(i) for i in range(100)])
+        self.assertEqual(len(c.cache), 10)
+        self.assertEqual(len(c.wordinfo), 0)
+        self._checkAllWordCounts([(word, 0, 2) for word in words], False)
+
+    def testConcurrentReader(self):
+        writer = self.classifier
+        writer.learn(["some", "simple", "tokens"], True)
+        writer.store()
+        reader = self.StorageClass(self.db_name)
+        try:
+            self.assertEqual(reader.nspam, 1)
+            before = reader.spamprob(["some", "simple"])
+            writer.learn(["some", "simple"], False)
+            writer.learn(["some"], False)
+            # Changes are seen by the reader once they are stored.
+            self.assertEqual(reader.spamprob(["some", "simple"]), before)
+            writer.store()
+            self.assertEqual(reader.spamprob(["some", "simple"]),
+                             writer.spamprob(["some", "simple"]))
+            self.assertEqual((reader.nspam, reader.nham), (1, 2))
+            self.assertEqual(reader._wordinfoget("some").hamcount, 2)
+        finally:
+            reader.close()
+
+    def testRefresh(self):
+        writer = self.classifier
+        writer.learn(["some", "tokens"], True)
+        writer.store()
+        reader = self.StorageClass(self.db_name)
+        try:
+            writer.learn(["some"], False)
+            writer.store()
+            queries = []
+            reader.db.set_trace_callback(queries.append)
+            version = reader.version
+            # Reading the version does not touch the database; refreshing
+            # does.
+            self.assertEqual(queries, [])
+            self.assertEqual(reader.nham, 0)
+            reader.refresh()
+            self.assertEqual(reader.nham, 1)
+            self.assertGreater(reader.version, version)
+            # Training never picks up the totals stored by another process.
+            writer.learn(["more"], True)
+            writer.store()
+            reader.learn(["other"], False)
+            self.assertEqual((reader.nspam, reader.nham), (1, 2))
+            reader.refresh()
+            self.assertEqual((reader.nspam, reader.nham), (1, 2))
+        finally:
+            reader.close()
+
+    def testReplace(self):
+        # The statement used instead of an upsert by old versions of SQLite.
+        c = self.classifier
+        c.upsert = c.replace
+        c.learn(["some", "tokens"], True)
+        c.store()
+        c.learn(["some"], False)
+        c.store()
+        c.close()
+        self.classifier = self.StorageClass(self.db_name)
+        self._checkAllWordCounts((("some", 1, 1), ("tokens", 0, 1)), False)
+
+    def testConcurrentWriterProcess(self):
+        # Another process trains and stores in a loop while this one scores.
+        # Every token is in every message, so its counts equal the message
+        # totals, and reading a count stored after the totals were read
+        # would raise an exception in probability().
+        writer = subprocess.Popen([sys.executable, '-c', SQLITE_WRITER,
+                                   self.db_name],
+                                  env=dict(os.environ, PYTHONPATH=ROOT))
+        try:
+            c = self.classifier
+            deadline = time.monotonic() + 2
+            scored = 0
+            while time.monotonic() < deadline:
+                for message in (["spam", "both"], ["ham", "both"]):
+                    c.spamprob(message)
+                    c.spamprob(message, evidence=True)
+                    c._use_bigrams = not c._use_bigrams
+                scored += 1
+            self.assertIsNone(writer.poll())
+            self.assertGreater(c.nspam, 0)
+            self.assertGreater(scored, 0)
+        finally:
+            writer.kill()
+            writer.wait()
+
+
+class BoundedDBStorageTestCase(_StorageTestBase, unittest.TestCase):
+    StorageClass = functools.partial(ShelveClassifier, cache_size=2)
+
+    def testWriteback(self):
+        c = self.classifier
+        words = ["common", "nearly_hapax", "other"]
+        c.learn(words, False)
+        c.learn(words, True)
+        # Only two of the three records fit in the cache, so whenever a
+        # changed record is evicted, it is written back first.
+        self.assertEqual(len(c.wordinfo), 2)
+        self.assertEqual(len(c.changed_words), 2)
+        stats = c.cache_stats()
+        self.assertEqual(stats["size"], 2)
+        self.assertEqual(stats["writebacks"], 1)
+        self.assertEqual(stats["evictions"], 1)
+        # Single-count records are not cached, so every lookup missed.
+        self.assertEqual(stats["misses"], 6)
+        self.assertEqual(stats["hits"], 0)
+        for word in list(c.wordinfo):
+            c._wordinfoget(word)
+        self.assertEqual(c.cache_stats()["hits"], 2)
+        self._checkAllWordCounts((("common", 1, 1),
+                                  ("nearly_hapax", 1, 1),
+                                  ("other", 1, 1)), True)
+
+
 @unittest.skipUnless(cdb_is_available, 'requires cdb')
-class CDBStorageTestCase(_StorageTestBase):
+class CDBStorageTestCase(_StorageTestBase, unittest.TestCase):
     StorageClass = CDBClassifier
 
 
 # @unittest.skipUnless(zodb_is_available, 'requires ZODB')
-# class ZODBStorageTestCase(_StorageTestBase):
+# class ZODBStorageTestCase(_StorageTestBase, unittest.TestCase):
 #     StorageClass = ZODBClassifier
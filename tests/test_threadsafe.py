@@ -0,0 +1,98 @@
+# test_threadsafe.py - unit tests for sbclassifier.classifiers.threadsafe
+#
+# Copyright (C) 2002-2013 Python Software Foundation; All Rights Reserved
+# Copyright 2014 Jeffrey Finkelstein.
+#
+# This file is part of sbclassifier, which is licensed under the Python
+# Software Foundation License; for more information, see LICENSE.txt.
+import random
+import threading
+
+from sbclassifier import Classifier
+from sbclassifier.classifiers.threadsafe import SnapshotClassifier
+
+
+def test_same_results():
+    ham_strings = 'dog cat horse sloth koala'.split()
+    spam_strings = 'shark raptor bear spider cockroach'.split()
+    basic = Classifier()
+    basic.learn_ham(ham_strings)
+    classifier = SnapshotClassifier(basic, merge_threshold=2)
+    basic.learn_spam(spam_strings)
+    classifier.learn_spam(spam_strings)
+    snapshot = classifier.snapshot()
+    basic.unlearn_ham(ham_strings[:2])
+    classifier.unlearn_ham(ham_strings[:2])
+    for wordstream in ham_strings, spam_strings, ham_strings + spam_strings:
+        assert classifier.spamprob(wordstream) == basic.spamprob(wordstream)
+    # The earlier snapshot is unaffected by later training.
+    assert (snapshot.nspam, snapshot.nham) == (1, 1)
+    assert snapshot._wordinfoget('dog').hamcount == 1
+    assert sorted(classifier.snapshot()._wordinfokeys()) == \
+        sorted(basic._wordinfokeys())
+
+
+def test_stress():
+    # Every spam message contains the word 'always', so in any consistent
+    # state its spam count equals the number of spam messages trained, and
+    # likewise for ham.
+    classifier = SnapshotClassifier(merge_threshold=50)
+    rng = random.Random(0)
+    vocabulary = ['word{}'.format(i) for i in range(500)]
+    stop = threading.Event()
+    errors = []
+
+    def train():
+        try:
+            for i in range(300):
+                message = rng.sample(vocabulary, 20) + ['always']
+                classifier.learn(message, i % 3 == 0)
+                if i % 10 == 9:
+                    classifier.unlearn(message, i % 3 == 0)
+        except Exception as exception:
+            errors.append(exception)
+        finally:
+            stop.set()
+
+    def score():
+        try:
+            while not stop.is_set():
+                snapshot = classifier.snapshot()
+                record = snapshot._wordinfoget('always')
+                if record is not None:
+                    assert record.spamcount == snapshot.nspam
+                    assert record.hamcount == snapshot.nham
+                prob = classifier.spamprob(vocabulary[:50] + ['always'])
+                assert 0 <= prob <= 1
+        except Exception as exception:
+            errors.append(exception)
+
+    scorers = [threading.Thread(target=score) for i in range(8)]
+    trainer = threading.Thread(target=train)
+    for thread in scorers + [trainer]:
+        thread.start()
+    for thread in scorers + [trainer]:
+        thread.join()
+    assert not errors, errors
+    assert classifier.nspam + classifier.nham == 270
+
+
+def test_publish_copies_only_new_changes():
+    # Publishing does not copy the layers of earlier snapshots, except to
+    # merge them with no larger ones, so there are few layers.
+    classifier = SnapshotClassifier(merge_threshold=10 ** 6)
+    for i in range(64):
+        classifier.learn_spam(['word{}-{}'.format(i, j) for j in range(4)])
+    before = classifier._snapshot
+    assert [len(layer) for layer in before.layers] == [256]
+    classifier.learn_ham(['new{}'.format(j) for j in range(4)])
+    after = classifier._snapshot
+    assert [len(layer) for layer in after.layers] == [4, 256]
+    assert after.layers[1] is before.layers[0]
+    assert before.get('new0') is None
+    assert after.get('new0') == (0, 1)
+    assert after.get('word0-0') == (1, 0)
+    classifier.unlearn_ham(['new{}'.format(j) for j in range(4)])
+    assert classifier._snapshot.get('new0') is None
+    assert 'new0' not in classifier._snapshot.keys()
+    assert len(classifier._snapshot.keys()) == 256